@@ -1,39 +1,200 @@
+import os
+import hashlib
+import logging
+import threading
 import boto3
+from concurrent.futures import ThreadPoolExecutor
 from botocore.exceptions import ClientError
 from db.config import settings
+from services.env import env_int
+
+logger = logging.getLogger("pdf_chat_bot")
 
 # Get the value of the S3_BUCKET_NAME from settings
 S3_BUCKET_NAME = settings.s3_bucket_name
 
-# Create the S3 client using LocalStack
-s3_client = boto3.client(
-    "s3",
-    aws_access_key_id=settings.aws_access_key_id,
-    aws_secret_access_key=settings.aws_secret_access_key,
-    region_name=settings.s3_region_name,
-    endpoint_url=settings.aws_endpoint_url, 
-)
+_s3_client = None
+_s3_client_lock = threading.Lock()
+
+def get_s3_client():
+    # Created on first use (or during startup) so importing the module makes no client or network call
+    global _s3_client
+    with _s3_client_lock:
+        if _s3_client is None:
+            # Create the S3 client using LocalStack
+            _s3_client = boto3.client(
+                "s3",
+                aws_access_key_id=settings.aws_access_key_id,
+                aws_secret_access_key=settings.aws_secret_access_key,
+                region_name=settings.s3_region_name,
+                endpoint_url=settings.aws_endpoint_url,
+            )
+        return _s3_client
 
 def ensure_bucket_exists(bucket_name):
+    # Raises if the bucket can neither be found nor created, so startup can report S3 as down
+    s3_client = get_s3_client()
     try:
         # Check if the bucket exists
         s3_client.head_bucket(Bucket=bucket_name)
-        print(f"Bucket {bucket_name} already exists.")
-    except s3_client.exceptions.ClientError as e:
+        logger.info(f"Bucket {bucket_name} already exists.")
+    except ClientError as e:
         error_code = e.response["Error"]["Code"]
-        
-        if error_code == "404":
-            print(f"Bucket {bucket_name} does not exist. Creating bucket...")
-            try:
-                # Create the bucket
-                s3_client.create_bucket(
-                    Bucket=bucket_name
-                )
-                print(f"Bucket {bucket_name} created.")
-            except ClientError as create_error:
-                print(f"Failed to create bucket: {create_error}")
-        else:
-            print(f"Failed to check/create bucket: {e}")
-
-# Ensure the bucket exists
-ensure_bucket_exists(S3_BUCKET_NAME)
+        if error_code != "404":
+            raise
+        logger.info(f"Bucket {bucket_name} does not exist. Creating bucket...")
+        s3_client.create_bucket(Bucket=bucket_name)
+        logger.info(f"Bucket {bucket_name} created.")
+
+def check_bucket(bucket_name=None):
+    # Readiness check: the bucket is reachable with our credentials
+    get_s3_client().head_bucket(Bucket=bucket_name or S3_BUCKET_NAME)
+
+# Multipart uploads: files larger than one part are sent as parts, several at a time.
+# S3 requires every part but the last to be at least 5 MB.
+MIN_PART_SIZE = 5 * 1024 * 1024
+S3_PART_SIZE = max(env_int("s3_part_size", 8 * 1024 * 1024), MIN_PART_SIZE)
+# Parts uploaded at the same time, across all uploads of this process
+S3_UPLOAD_CONCURRENCY = env_int("s3_upload_concurrency", 4)
+
+_part_pool = None
+_part_pool_lock = threading.Lock()
+
+def get_part_pool() -> ThreadPoolExecutor:
+    # Created on first use so importing the module does not start threads
+    global _part_pool
+    with _part_pool_lock:
+        if _part_pool is None:
+            _part_pool = ThreadPoolExecutor(max_workers=S3_UPLOAD_CONCURRENCY, thread_name_prefix="s3-part")
+        return _part_pool
+
+
+class FilePart:
+    """
+    Read-only view of `length` bytes of a file starting at `offset`. Used as the body
+    of a part so boto3 streams it from disk instead of holding the part in memory.
+    """
+
+    def __init__(self, path: str, offset: int, length: int):
+        self._file = open(path, "rb")
+        self._offset = offset
+        self._length = length
+        self.seek(0)
+
+    def __len__(self):
+        return self._length
+
+    def read(self, size: int = -1) -> bytes:
+        remaining = self._length - self._position
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        data = self._file.read(size)
+        self._position += len(data)
+        return data
+
+    def seek(self, position: int, whence: int = os.SEEK_SET) -> int:
+        if whence == os.SEEK_CUR:
+            position += self._position
+        elif whence == os.SEEK_END:
+            position += self._length
+        self._position = min(max(position, 0), self._length)
+        self._file.seek(self._offset + self._position)
+        return self._position
+
+    def tell(self) -> int:
+        return self._position
+
+    def close(self):
+        self._file.close()
+
+
+class PendingUpload:
+    """
+    Upload of a file on disk that runs in the background and only becomes visible in
+    the bucket on `complete()`; `abort()` discards it. Small files are sent with a
+    single put_object on `complete()`.
+    """
+
+    def __init__(self, client, bucket: str, key: str, path: str, part_size: int):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.path = path
+        self.size = os.path.getsize(path)
+        self.upload_id = None
+        self._futures = []
+
+        if self.size > part_size:
+            response = client.create_multipart_upload(Bucket=bucket, Key=key, ContentType="application/pdf")
+            self.upload_id = response["UploadId"]
+            pool = get_part_pool()
+            for number, offset in enumerate(range(0, self.size, part_size), start=1):
+                length = min(part_size, self.size - offset)
+                self._futures.append(pool.submit(self._upload_part, number, offset, length))
+
+    def _upload_part(self, number: int, offset: int, length: int) -> dict:
+        body = FilePart(self.path, offset, length)
+        try:
+            response = self.client.upload_part(
+                Bucket=self.bucket, Key=self.key, UploadId=self.upload_id, PartNumber=number, Body=body,
+            )
+        finally:
+            body.close()
+        return {"PartNumber": number, "ETag": response["ETag"]}
+
+    def complete(self):
+        if self.upload_id is None:
+            with open(self.path, "rb") as f:
+                self.client.put_object(Bucket=self.bucket, Key=self.key, Body=f.read())
+            return
+        try:
+            parts = [future.result() for future in self._futures]
+        except Exception:
+            self.abort()
+            raise
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket, Key=self.key, UploadId=self.upload_id, MultipartUpload={"Parts": parts},
+        )
+
+    def abort(self):
+        if self.upload_id is None:
+            return
+        for future in self._futures:
+            future.cancel()
+        for future in self._futures:
+            if not future.cancelled():
+                try:
+                    future.result()
+                except Exception:
+                    pass
+        try:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+        except ClientError as e:
+            logger.warning(f"Failed to abort upload of {self.key}: {e}")
+
+
+def start_upload(path: str, key: str, bucket: str = None, client=None, part_size: int = None) -> PendingUpload:
+    """
+    Start uploading the file at `path` to `key`; call complete() on the result to publish it.
+    The file must stay in place until the upload is completed or aborted.
+    """
+    return PendingUpload(
+        client or get_s3_client(), bucket or S3_BUCKET_NAME, key, path, max(part_size or S3_PART_SIZE, MIN_PART_SIZE),
+    )
+
+
+def hash_object(key: str, bucket: str = None, client=None):
+    """
+    Return the sha256 of the object at `key`, read in fixed-size blocks, or None if there is no such object.
+    """
+    client = client or get_s3_client()
+    try:
+        body = client.get_object(Bucket=bucket or S3_BUCKET_NAME, Key=key)["Body"]
+    except ClientError as e:
+        if e.response["Error"]["Code"] not in ("NoSuchKey", "404"):
+            raise
+        return None
+    digest = hashlib.sha256()
+    for block in body.iter_chunks(1024 * 1024):
+        digest.update(block)
+    return digest.hexdigest()
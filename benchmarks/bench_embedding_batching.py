@@ -0,0 +1,63 @@
+"""
+Benchmark local query embedding with and without micro-batching.
+
+Embeds questions from many concurrent coroutines, as WebSocket clients do, through
+MicroBatchingEmbeddings with max_batch=1 (one forward pass per question) and with the
+configured batch size. The "hashing" provider runs offline with almost no compute, so it
+only measures the cost of batching; "local" needs sentence-transformers and shows the gain
+of batched CPU inference.
+
+Usage:
+    python -m benchmarks.bench_embedding_batching --provider hashing --concurrency 1 16 64
+    python -m benchmarks.bench_embedding_batching --provider local --queries 512
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+from services.embedding_providers import HashingEncoder, MicroBatchingEmbeddings, SentenceTransformerEncoder
+
+
+async def run(embeddings, queries: int, concurrency: int):
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def ask(i):
+        async with semaphore:
+            start = time.perf_counter()
+            await embeddings.aembed_query(f"What does clause {i} say about the termination notice period?")
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(ask(i) for i in range(queries)))
+    return queries / (time.perf_counter() - start), statistics.median(latencies) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--provider", choices=["hashing", "local"], default="hashing")
+    parser.add_argument("--queries", type=int, default=1024)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 64])
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--wait-ms", type=float, default=5)
+    args = parser.parse_args()
+
+    if args.provider == "local":
+        model = os.getenv("local_embedding_model", "sentence-transformers/all-MiniLM-L6-v2")
+        encoder = SentenceTransformerEncoder(model, os.getenv("local_embedding_runtime", "torch"), args.batch_size)
+    else:
+        encoder = HashingEncoder()
+
+    print(f"{'batching':>10} {'concurrency':>12} {'queries/s':>10} {'p50 ms':>8} {'avg batch':>10}")
+    for name, max_batch in [("off", 1), ("on", args.batch_size)]:
+        for concurrency in args.concurrency:
+            embeddings = MicroBatchingEmbeddings(encoder, max_batch, args.wait_ms)
+            rate, p50 = asyncio.run(run(embeddings, args.queries, concurrency))
+            print(f"{name:>10} {concurrency:>12} {rate:>10,.0f} {p50:>8.2f} "
+                  f"{embeddings.stats()['average_batch_size']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,399 @@
+"""
+End-to-end benchmark of uploads and questions, fully offline and reproducible.
+
+The app runs in-process in a uvicorn server (real startup, HTTP and WebSockets) with:
+- the fake chat model (`llm_provider=fake`, latency set by --llm-delay) and the hashing embeddings
+- an in-memory S3 and a fake Redis (benchmarks/fakes.py), the in-memory job queue and rate limiter
+- a temporary SQLite database (aiosqlite for the request handlers)
+
+A corpus of generated contract PDFs is uploaded through POST /upload (timed until GET /jobs/{id}
+reports completion), then questions about them are asked over /ws/question at each concurrency
+level. Throughput, p50/p95/p99 latency and the time spent in each pipeline stage are reported,
+and written as JSON with --output; --compare prints the change against an earlier result.
+
+Usage:
+    python -m benchmarks.bench_end_to_end --documents 20 --questions 400 --concurrency 1 8 32
+    python -m benchmarks.bench_end_to_end --output after.json --compare before.json
+"""
+import argparse
+import asyncio
+import functools
+import inspect
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import textwrap
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack
+from unittest.mock import patch
+
+from benchmarks.bench_context_packing import make_contract
+
+LINES_PER_PAGE = 70
+LINE_WIDTH = 100
+
+
+def configure_environment(workdir: str, args):
+    # Must run before the app is imported: modules read their configuration at import
+    os.environ.update({
+        "embedding_provider": "hashing",
+        "llm_provider": "fake",
+        "fake_llm_delay": str(args.llm_delay),
+        "answer_cache_backend": args.answer_cache,
+        "embedding_cache_backend": "sqlite",
+        "embedding_cache_path": os.path.join(workdir, "embedding_cache.sqlite3"),
+        "vector_store_backend": "local",
+        "faiss_index_dir": os.path.join(workdir, "faiss_index"),
+        "ingestion_queue_backend": "memory",
+        "ingestion_staging_dir": os.path.join(workdir, "staging"),
+        "ws_rate_limit_backend": "memory",
+        # The benchmark is one client: rate limits would only measure themselves
+        "no_of_request": "1000000000",
+        "time_window": "1",
+        "minutes": "1",
+    })
+    # Settings the app requires; nothing connects to them
+    for name, value in {
+        "database_hostname": "localhost", "database_port": "5432", "database_password": "benchmark",
+        "database_name": "benchmark", "database_username": "benchmark",
+        "aws_access_key_id": "benchmark", "aws_secret_access_key": "benchmark",
+        "aws_endpoint_url": "http://localhost:4566", "s3_region_name": "us-east-1",
+        "s3_bucket_name": "benchmark", "google_api_key": "unused",
+        "REDIS_HOST": "localhost", "REDIS_PORT": "6379",
+    }.items():
+        os.environ.setdefault(name, value)
+
+
+def make_corpus(documents: int, clauses: int, seed: int):
+    # One contract per document: (filename, pdf bytes, [question, ...])
+    import pymupdf
+
+    rng = random.Random(seed)
+    corpus = []
+    for number in range(documents):
+        text, facts = make_contract(clauses, rng)
+        lines = textwrap.wrap(text, LINE_WIDTH)
+        pdf = pymupdf.open()
+        for start in range(0, len(lines), LINES_PER_PAGE):
+            page = pdf.new_page()
+            page.insert_text((36, 36), "\n".join(lines[start:start + LINES_PER_PAGE]), fontsize=8)
+        corpus.append((f"contract_{seed}_{number}.pdf", pdf.tobytes(), [question for question, _ in facts]))
+        pdf.close()
+    return corpus
+
+
+def percentile(values: list, q: float) -> float:
+    # Nearest-rank percentile
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered) + 0.5)) - 1))]
+
+
+def summarize(latencies_ms: list, elapsed: float, errors: int) -> dict:
+    return {
+        "requests": len(latencies_ms),
+        "errors": errors,
+        "throughput_per_s": round(len(latencies_ms) / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": round(sum(latencies_ms) / len(latencies_ms), 2) if latencies_ms else 0.0,
+        "p50_ms": round(percentile(latencies_ms, 50), 2),
+        "p95_ms": round(percentile(latencies_ms, 95), 2),
+        "p99_ms": round(percentile(latencies_ms, 99), 2),
+    }
+
+
+class StageTimer:
+    """
+    Times calls to the functions that make up each pipeline stage, wherever they run
+    (event loop or blocking pool).
+    """
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+
+    def wrap(self, stage: str, func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def timed(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    self.samples[stage].append((time.perf_counter() - start) * 1000)
+        else:
+            @functools.wraps(func)
+            def timed(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.samples[stage].append((time.perf_counter() - start) * 1000)
+        return timed
+
+    def patch(self, stack: ExitStack, module, stages: dict):
+        # stages: {stage name: function name in `module`}
+        for stage, name in stages.items():
+            stack.enter_context(patch.object(module, name, self.wrap(stage, getattr(module, name))))
+
+    def collect(self) -> dict:
+        # Summary of the stages timed since the last collect
+        samples, self.samples = self.samples, defaultdict(list)
+        return {
+            stage: {
+                "calls": len(values),
+                "mean_ms": round(sum(values) / len(values), 3),
+                "p50_ms": round(percentile(values, 50), 3),
+                "p95_ms": round(percentile(values, 95), 3),
+            }
+            for stage, values in samples.items()
+        }
+
+
+def patch_app(stack: ExitStack, workdir: str, timer: StageTimer, s3, redis):
+    """
+    Point the app at the SQLite database and the fakes, and time its stages.
+    """
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+    from fastapi_limiter import FastAPILimiter
+    import startup
+    from aws import s3client
+    from db import redis_setup
+    from db.database import PoolMetrics, POOL_OPTIONS, DB_POOL_SIZE, DB_MAX_OVERFLOW
+    from controllers import pdf_endpoints_service, pdf_endpoints_controller, websocket_controller
+    from services import nlp_services
+
+    path = os.path.join(workdir, "benchmark.db")
+    # Same pool settings as the PostgreSQL engines
+    engine = create_engine(
+        f"sqlite:///{path}", connect_args={"check_same_thread": False, "timeout": 30}, **POOL_OPTIONS
+    )
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}", connect_args={"timeout": 30}, **POOL_OPTIONS)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    async_session_factory = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+    async def setup_fake_redis():
+        redis_setup.redis_connection = redis
+        await FastAPILimiter.init(redis)
+        return redis
+
+    stack.enter_context(patch.object(startup, "engine", engine))
+    stack.enter_context(patch.object(startup, "async_engine", async_engine))
+    stack.enter_context(patch.object(startup, "setup_redis", setup_fake_redis))
+    stack.enter_context(patch.object(s3client, "_s3_client", s3))
+    stack.enter_context(patch.object(nlp_services, "SessionLocal", session_factory))
+    stack.enter_context(patch.object(pdf_endpoints_service, "SessionLocal", session_factory))
+    stack.enter_context(patch.object(pdf_endpoints_controller, "AsyncSessionLocal", async_session_factory))
+    stack.enter_context(patch.object(websocket_controller, "AsyncSessionLocal", async_session_factory))
+
+    timer.patch(stack, pdf_endpoints_service, {
+        "spool": "spool_upload",
+        "extract": "extract_pages",
+        "chunk_and_embed": "prepare_chunks",
+        "save": "_save_document_in_new_session",
+        "s3_upload": "finish_store_pdf",
+        "index": "index_document",
+    })
+    timer.patch(stack, websocket_controller, {"document_lookup": "get_document_hash"})
+    timer.patch(stack, nlp_services, {
+        "exact_match": "find_exact_matches",
+        "embed_question": "embed_question",
+        "retrieve": "retrieve_documents",
+        "pack_context": "prepare_context",
+        "llm": "user_input",
+    })
+    return PoolMetrics(async_engine.sync_engine, DB_POOL_SIZE + DB_MAX_OVERFLOW)
+
+
+def start_server(stack: ExitStack) -> int:
+    # Same as the live_server test fixture, but with the app's startup and shutdown
+    import uvicorn
+    from main import app
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=0, lifespan="on", log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("The server failed to start.")
+        time.sleep(0.01)
+
+    def stop():
+        server.should_exit = True
+        thread.join()
+
+    stack.callback(stop)
+    return server.servers[0].sockets[0].getsockname()[1]
+
+
+async def upload_corpus(base_url: str, corpus: list, concurrency: int):
+    # POST every document, then poll its job until it completes; returns ({filename: text_id}, summary)
+    import httpx
+
+    text_ids = {}
+    latencies = []
+    errors = 0
+    pending = list(corpus)
+
+    async def upload_one(client, filename: str, contents: bytes):
+        nonlocal errors
+        start = time.perf_counter()
+        response = await client.post("/upload", files={"file": (filename, contents, "application/pdf")})
+        if response.status_code != 202:
+            errors += 1
+            return
+        job_id = response.json()["job_id"]
+        job = response.json()
+        while job["status"] not in ("completed", "failed"):
+            await asyncio.sleep(0.005)
+            job = (await client.get(f"/jobs/{job_id}")).json()
+        if job["status"] == "failed":
+            errors += 1
+            return
+        latencies.append((time.perf_counter() - start) * 1000)
+        text_ids[filename] = job["text_id"]
+
+    async def uploader(client):
+        while pending:
+            filename, contents, _ = pending.pop()
+            await upload_one(client, filename, contents)
+
+    start = time.perf_counter()
+    async with httpx.AsyncClient(base_url=base_url, timeout=300) as client:
+        await asyncio.gather(*(uploader(client) for _ in range(concurrency)))
+    return text_ids, summarize(latencies, time.perf_counter() - start, errors)
+
+
+async def ask_questions(ws_url: str, questions: list, concurrency: int) -> dict:
+    # `concurrency` sockets, each asking its next question as soon as the previous one is answered
+    import websockets
+
+    latencies = []
+    errors = 0
+    pending = list(reversed(questions))
+
+    async def client():
+        nonlocal errors
+        async with websockets.connect(ws_url, max_size=None) as websocket:
+            while pending:
+                text_id, question = pending.pop()
+                start = time.perf_counter()
+                await websocket.send(json.dumps({"text_id": text_id, "question": question}))
+                response = json.loads(await websocket.recv())
+                if "error" in response:
+                    errors += 1
+                    continue
+                latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return summarize(latencies, time.perf_counter() - start, errors)
+
+
+def compare(results: dict, baseline: dict):
+    # Change of the headline numbers against an earlier run, per concurrency level
+    print(f"\nAgainst {baseline['config'].get('output') or 'baseline'}:")
+    rows = [("upload", baseline["upload"], results["upload"])]
+    earlier = {level["concurrency"]: level for level in baseline["questions"]}
+    rows += [
+        (f"questions c={level['concurrency']}", earlier[level["concurrency"]], level)
+        for level in results["questions"] if level["concurrency"] in earlier
+    ]
+    print(f"{'phase':<18} {'throughput':>11} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for name, before, after in rows:
+        changes = [
+            f"{(after[key] / before[key] - 1) * 100:+.1f}%" if before[key] else "n/a"
+            for key in ("throughput_per_s", "p50_ms", "p95_ms", "p99_ms")
+        ]
+        print(f"{name:<18} {changes[0]:>11} {changes[1]:>9} {changes[2]:>9} {changes[3]:>9}")
+
+
+def print_summary(name: str, summary: dict, stages: dict):
+    print(f"\n{name}: {summary['requests']} ok, {summary['errors']} errors, "
+          f"{summary['throughput_per_s']}/s, p50 {summary['p50_ms']} ms, "
+          f"p95 {summary['p95_ms']} ms, p99 {summary['p99_ms']} ms")
+    for stage, timing in stages.items():
+        print(f"    {stage:<18} {timing['calls']:>6} calls {timing['mean_ms']:>10.2f} ms mean "
+              f"{timing['p95_ms']:>10.2f} ms p95")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=20)
+    parser.add_argument("--clauses", type=int, default=60, help="clauses per generated contract")
+    parser.add_argument("--upload-concurrency", type=int, default=4)
+    parser.add_argument("--questions", type=int, default=400, help="questions asked at each concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--llm-delay", type=float, default=0.05, help="seconds of simulated model latency")
+    parser.add_argument("--answer-cache", choices=["memory", "none"], default="none")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare against")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir, ExitStack() as stack:
+        configure_environment(workdir, args)
+        from benchmarks.fakes import InMemoryS3, FakeRedis
+        from services import nlp_services
+        import startup
+
+        s3 = InMemoryS3()
+        redis = FakeRedis()
+        timer = StageTimer()
+        pool_metrics = patch_app(stack, workdir, timer, s3, redis)
+        port = start_server(stack)
+        corpus = make_corpus(args.documents, args.clauses, args.seed)
+        rng = random.Random(args.seed)
+
+        text_ids, upload = asyncio.run(
+            upload_corpus(f"http://127.0.0.1:{port}", corpus, args.upload_concurrency)
+        )
+        upload_stages = timer.collect()
+        print_summary(f"upload ({len(corpus)} documents, concurrency {args.upload_concurrency})", upload, upload_stages)
+
+        questions = [
+            (text_ids[filename], question)
+            for filename, _, document_questions in corpus if filename in text_ids
+            for question in document_questions
+        ]
+        levels = []
+        for concurrency in args.concurrency:
+            sample = [rng.choice(questions) for _ in range(args.questions)] if questions else []
+            summary = asyncio.run(ask_questions(f"ws://127.0.0.1:{port}/ws/question", sample, concurrency))
+            stages = timer.collect()
+            print_summary(f"questions (concurrency {concurrency})", summary, stages)
+            levels.append(dict(summary, concurrency=concurrency, stages=stages))
+
+        results = {
+            "config": vars(args),
+            "environment": {
+                "python": sys.version.split()[0],
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+            },
+            "startup": dict(startup.startup_report),
+            "upload": dict(upload, stages=upload_stages),
+            "questions": levels,
+            "llm": nlp_services.llm_clients.stats(),
+            "database_pool": pool_metrics.stats(),
+            "s3": s3.stats(),
+            "redis_commands": redis.commands,
+        }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
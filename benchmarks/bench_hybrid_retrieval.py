@@ -0,0 +1,81 @@
+"""
+Benchmark retrieval recall of dense, BM25 and hybrid (reciprocal rank fusion) search.
+
+Uses the synthetic contract of bench_context_packing, with two kinds of question: by clause
+("What is the supplier reference code in clause 12?") and by identifier ("Which clause
+sets reference code C4821?"). Dense retrieval uses the deterministic hashing embedder,
+which like a real embedding model spreads an identifier over a few meaningless dimensions.
+
+Recall@k is the share of questions whose clause is among the top-k chunks. "no embedding"
+is the share of questions the exact lookup answers without embedding the question.
+
+Usage:
+    python -m benchmarks.bench_hybrid_retrieval --clauses 200 --questions 200 --k 8
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
+
+from benchmarks.bench_context_packing import HashingEmbedder, make_contract
+from services.lexical_index import BM25Index, reciprocal_rank_fusion
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clauses", type=int, default=200)
+    parser.add_argument("--questions", type=int, default=200)
+    parser.add_argument("--k", type=int, default=8)
+    parser.add_argument("--chunk-size", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    text, facts = make_contract(args.clauses, rng)
+    questions = []
+    for number, (question, code) in rng.sample(list(enumerate(facts, 1)), min(args.questions, len(facts))):
+        if rng.random() < 0.5:
+            questions.append((question, code))
+        else:
+            questions.append((f"Which clause sets reference code {code}?", f"Clause {number}."))
+
+    splitter = RecursiveCharacterTextSplitter(chunk_size=args.chunk_size, chunk_overlap=args.chunk_size // 10)
+    chunks = [
+        Document(page_content=content, metadata={"chunk": i})
+        for i, content in enumerate(splitter.split_text(text))
+    ]
+    embedder = HashingEmbedder()
+    matrix = embedder.embed([doc.page_content for doc in chunks])
+    start = time.perf_counter()
+    index = BM25Index(chunks)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    def dense(question):
+        distances = ((matrix - embedder.embed([question])[0]) ** 2).sum(axis=1)
+        return [chunks[i] for i in np.argsort(distances)[:args.k]]
+
+    def lexical(question):
+        return [doc for doc, _ in index.search(question, args.k)]
+
+    def hybrid(question):
+        return reciprocal_rank_fusion([dense(question), lexical(question)], args.k)
+
+    print(f"{len(chunks)} chunks, {len(questions)} questions, BM25 index built in {build_ms:.1f} ms")
+    print(f"{'retrieval':<10} {'recall@' + str(args.k):>10} {'ms/query':>9}")
+    for name, search in [("dense", dense), ("bm25", lexical), ("hybrid", hybrid)]:
+        start = time.perf_counter()
+        found = sum(any(answer in doc.page_content for doc in search(question)) for question, answer in questions)
+        elapsed_ms = (time.perf_counter() - start) * 1000 / len(questions)
+        print(f"{name:<10} {found / len(questions):>10.2%} {elapsed_ms:>9.2f}")
+
+    exact = [index.exact_search(question, args.k) for question, _ in questions]
+    answered = sum(bool(docs) for docs in exact)
+    correct = sum(any(answer in doc.page_content for doc in docs) for docs, (_, answer) in zip(exact, questions) if docs)
+    print(f"no embedding: {answered / len(questions):.2%} of questions, {correct}/{answered} with the right chunk")
+
+
+if __name__ == "__main__":
+    main()
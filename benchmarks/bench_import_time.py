@@ -0,0 +1,63 @@
+"""
+Benchmark how long it takes to import the app and its heaviest modules.
+
+Each module is imported in a fresh interpreter, several times, and the wall time of the
+interpreter (minus an empty one) is reported. With --top, the slowest imports by cumulative
+time are listed from `python -X importtime`. Importing must not touch the network: run with
+the backends stopped to check that import time does not depend on them.
+
+Usage:
+    python -m benchmarks.bench_import_time --repeat 5
+    python -m benchmarks.bench_import_time --modules main --top 15
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+MODULES = ["main", "startup", "services.nlp_services", "aws.s3client", "controllers.websocket_controller"]
+
+
+def wall_time(code: str, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], check=True, capture_output=True)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def slowest_imports(module: str, top: int) -> list:
+    # -X importtime writes "import time: self [us] | cumulative | imported package" lines to stderr
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"], check=True, capture_output=True, text=True
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative_us), int(self_us), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modules", nargs="+", default=MODULES)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=0, help="list the N slowest imports of each module")
+    args = parser.parse_args()
+
+    baseline = wall_time("pass", args.repeat)
+    print(f"interpreter start: {baseline * 1000:.0f} ms (subtracted below)")
+    print(f"{'module':<36} {'import ms':>10}")
+    for module in args.modules:
+        print(f"{module:<36} {(wall_time(f'import {module}', args.repeat) - baseline) * 1000:>10.0f}")
+        if args.top:
+            for cumulative_us, self_us, name in slowest_imports(module, args.top):
+                print(f"    {name:<40} {cumulative_us / 1000:>8.1f} ms cumulative {self_us / 1000:>8.1f} ms self")
+
+
+if __name__ == "__main__":
+    main()
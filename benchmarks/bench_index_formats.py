@@ -0,0 +1,121 @@
+"""
+Benchmark the vector index types (vector_index_type) on one large synthetic document.
+
+For each type the index is built with services.vector_stores.build_index, written to disk, and
+loaded twice: read into memory, and memory-mapped as the registry does on a local backend.
+Reported per type:
+
+- disk MB: size of the stored index; memory MB: bytes held by its vectors (index_bytes)
+- load ms, and the growth of the process RSS, for the in-memory and the memory-mapped load.
+  Mapped pages are counted in RSS once a search touches them, but they are shared with every
+  other process mapping the same file, so N workers hold one copy instead of N.
+- ms/query and recall@k: share of the exact top-k neighbours (brute-force float32) returned
+
+Vectors are drawn around a few hundred centres, so that neighbours are meaningful; real
+embeddings cluster similarly. The RSS columns are only available on Linux.
+
+Usage:
+    python -m benchmarks.bench_index_formats --vectors 50000 --dimensions 768 --k 8
+    python -m benchmarks.bench_index_formats --types flat int8 pq
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import faiss
+import numpy as np
+
+from services.vector_stores import (
+    INDEX_TYPES,
+    MMAP_FLAGS,
+    build_index,
+    index_bytes,
+    index_factory_string,
+    set_search_parameters,
+)
+
+
+def make_vectors(count: int, dimensions: int, clusters: int, rng) -> np.ndarray:
+    centres = rng.standard_normal((clusters, dimensions)).astype(np.float32)
+    vectors = centres[rng.integers(0, clusters, count)] + 0.5 * rng.standard_normal((count, dimensions))
+    vectors = vectors.astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def rss_bytes():
+    # Resident set size of this process (Linux), else None
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+def timed_load(path: str, flags: int):
+    # (index, load ms, RSS before loading or None)
+    before = rss_bytes()
+    start = time.perf_counter()
+    index = faiss.read_index(path, flags)
+    set_search_parameters(index)
+    load_ms = (time.perf_counter() - start) * 1000
+    return index, load_ms, before
+
+
+def recall(found: np.ndarray, exact: np.ndarray) -> float:
+    return float(np.mean([len(set(row) & set(truth)) / len(truth) for row, truth in zip(found, exact)]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=50_000)
+    parser.add_argument("--dimensions", type=int, default=768)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=8)
+    parser.add_argument("--types", nargs="+", default=list(INDEX_TYPES), choices=INDEX_TYPES)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    vectors = make_vectors(args.vectors, args.dimensions, args.clusters, rng)
+    queries = make_vectors(args.queries, args.dimensions, args.clusters, rng)
+    exact = faiss.IndexFlatL2(args.dimensions)
+    exact.add(vectors)
+    _, truth = exact.search(queries, args.k)
+    del exact
+
+    mb = 1024 * 1024
+    print(f"{args.vectors} vectors of {args.dimensions} dimensions, {args.queries} queries, k={args.k}")
+    print(f"{'type':<6} {'factory':<14} {'build s':>8} {'disk MB':>8} {'memory MB':>10} "
+          f"{'load ms':>8} {'RSS MB':>7} {'mmap ms':>8} {'mmap RSS':>9} {'ms/query':>9} {'recall@' + str(args.k):>9}")
+    with tempfile.TemporaryDirectory() as root:
+        for index_type in args.types:
+            start = time.perf_counter()
+            index = build_index(vectors, index_type)
+            build_s = time.perf_counter() - start
+            path = os.path.join(root, f"{index_type}.faiss")
+            faiss.write_index(index, path)
+            description = index_factory_string(index_type, args.vectors, args.dimensions)
+            memory = index_bytes(index)
+            del index
+
+            columns = []
+            for flags in (faiss.IO_FLAG_READ_ONLY, MMAP_FLAGS):
+                loaded, load_ms, before = timed_load(path, flags)
+                start = time.perf_counter()
+                _, found = loaded.search(queries, args.k)
+                query_ms = (time.perf_counter() - start) * 1000 / args.queries
+                after = rss_bytes()
+                growth = f"{(after - before) / mb:.1f}" if before is not None and after is not None else "-"
+                columns.append((load_ms, growth, query_ms, recall(found, truth)))
+                del loaded
+
+            (load_ms, rss, query_ms, hit_rate), (mmap_ms, mmap_rss, _, _) = columns
+            print(f"{index_type:<6} {description:<14} {build_s:>8.2f} {os.path.getsize(path) / mb:>8.1f} "
+                  f"{memory / mb:>10.1f} {load_ms:>8.1f} {rss:>7} {mmap_ms:>8.1f} {mmap_rss:>9} "
+                  f"{query_ms:>9.3f} {hit_rate:>9.2%}")
+
+
+if __name__ == "__main__":
+    main()
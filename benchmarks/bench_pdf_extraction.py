@@ -0,0 +1,75 @@
+"""
+Benchmark PDF text extraction across page counts.
+
+Compares the original in-memory extraction (`text += page.get_text()`) with the
+page engine in services/pdf_service.py (sequential below `pdf_parallel_min_pages`,
+process pool above it).
+
+Usage:
+    python -m benchmarks.bench_pdf_extraction --pages 10 100 1000 --repeat 3
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import pymupdf
+
+from services.pdf_service import iter_pdf_pages, pdf_file_to_text
+
+LINES_PER_PAGE = 40
+
+
+def legacy_pdf_to_text(contents: bytes) -> str:
+    # The implementation before the page engine, kept here as the baseline
+    pdf = pymupdf.open(stream=contents, filetype="pdf")
+    text = ""
+    for page in pdf:
+        text += page.get_text()
+    return text
+
+
+def make_pdf(path: str, pages: int):
+    doc = pymupdf.open()
+    for number in range(pages):
+        page = doc.new_page()
+        body = "\n".join(f"Page {number + 1} line {line}: the quick brown fox jumps over the lazy dog."
+                         for line in range(LINES_PER_PAGE))
+        page.insert_text((36, 36), body, fontsize=8)
+    doc.save(path)
+    doc.close()
+
+
+def best_of(repeat: int, func) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 100, 500, 2000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'pages':>8} {'legacy s':>10} {'engine s':>10} {'first page s':>13} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for pages in args.pages:
+            path = os.path.join(tmp, f"{pages}.pdf")
+            make_pdf(path, pages)
+            with open(path, "rb") as f:
+                contents = f.read()
+
+            legacy = best_of(args.repeat, lambda: legacy_pdf_to_text(contents))
+            engine = best_of(args.repeat, lambda: pdf_file_to_text(path))
+            first_page = best_of(args.repeat, lambda: next(iter_pdf_pages(path)))
+            assert legacy_pdf_to_text(contents) == pdf_file_to_text(path)
+
+            print(f"{pages:>8} {legacy:>10.3f} {engine:>10.3f} {first_page:>13.4f} {legacy / engine:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
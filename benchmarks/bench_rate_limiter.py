@@ -0,0 +1,75 @@
+"""
+Benchmark WebSocket rate limit checks per second.
+
+Compares the original per-IP timestamp list (rebuilt on every message) with the
+sliding window counter limiters in services/rate_limiter.py. The Redis limiter is
+only measured with --redis-url, against a real server.
+
+Usage:
+    python -m benchmarks.bench_rate_limiter --checks 100000 --clients 1 1000
+    python -m benchmarks.bench_rate_limiter --redis-url redis://localhost:6379/0
+"""
+import argparse
+import asyncio
+import time
+from collections import defaultdict
+
+from services.rate_limiter import InMemoryRateLimiter, RedisRateLimiter
+
+
+class LegacyRateLimiter:
+    # The implementation in the WebSocket controller before the limiter, kept here as the baseline
+    def __init__(self, limit: int, window: int):
+        self.limit = limit
+        self.window = window
+        self.message_counts = defaultdict(list)
+
+    async def allow(self, key: str) -> bool:
+        current_time = time.time()
+        self.message_counts[key] = [ts for ts in self.message_counts[key] if current_time - ts < self.window]
+        if len(self.message_counts[key]) >= self.limit:
+            return False
+        self.message_counts[key].append(current_time)
+        return True
+
+
+async def checks_per_second(limiter, checks: int, clients: int) -> float:
+    keys = [f"10.0.{i // 256}.{i % 256}" for i in range(clients)]
+    start = time.perf_counter()
+    for i in range(checks):
+        await limiter.allow(keys[i % clients])
+    return checks / (time.perf_counter() - start)
+
+
+async def run(args):
+    limiters = {
+        "legacy": lambda: LegacyRateLimiter(args.limit, args.window),
+        "memory": lambda: InMemoryRateLimiter(args.limit, args.window),
+    }
+    if args.redis_url:
+        from redis.asyncio import Redis
+        client = Redis.from_url(args.redis_url)
+        limiters["redis"] = lambda: RedisRateLimiter(lambda: client, args.limit, args.window, prefix="bench_rate")
+
+    print(f"{'limiter':>8} {'clients':>8} {'checks/s':>12}")
+    for name, make in limiters.items():
+        for clients in args.clients:
+            checks = args.checks if name != "redis" else min(args.checks, 20_000)
+            rate = await checks_per_second(make(), checks, clients)
+            print(f"{name:>8} {clients:>8} {rate:>12,.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--checks", type=int, default=100_000)
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 1000])
+    # A high limit keeps every check on the "allowed" path, where the legacy list grows
+    parser.add_argument("--limit", type=int, default=10_000)
+    parser.add_argument("--window", type=int, default=60)
+    parser.add_argument("--redis-url")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+In-process stand-ins for the external services, for benchmarks that run the whole app offline.
+
+- InMemoryS3: the subset of the boto3 S3 client used by aws/s3client.py and the S3 index backend
+- FakeRedis: the subset of redis.asyncio used by the upload rate limiter (fastapi-limiter) and health checks
+
+The Gemini and embedding fakes are part of the app: `llm_provider=fake` and `embedding_provider=hashing`.
+"""
+import io
+import time
+import uuid
+import hashlib
+import threading
+
+from botocore.exceptions import ClientError
+
+
+def _client_error(code: str, operation: str) -> ClientError:
+    return ClientError({"Error": {"Code": code, "Message": code}}, operation)
+
+
+class InMemoryS3:
+    """
+    Buckets and objects kept in a dict, with multipart uploads assembled on completion.
+    Thread-safe: parts are uploaded from the part pool.
+    """
+
+    def __init__(self):
+        self.buckets = {}
+        self.uploads = {}
+        self.requests = 0
+        self.bytes_stored = 0
+        self._lock = threading.Lock()
+
+    def _bucket(self, name: str, operation: str) -> dict:
+        self.requests += 1
+        if name not in self.buckets:
+            raise _client_error("404" if operation == "HeadBucket" else "NoSuchBucket", operation)
+        return self.buckets[name]
+
+    def head_bucket(self, Bucket):
+        with self._lock:
+            self._bucket(Bucket, "HeadBucket")
+        return {}
+
+    def create_bucket(self, Bucket, **kwargs):
+        with self._lock:
+            self.requests += 1
+            self.buckets.setdefault(Bucket, {})
+        return {}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        data = Body if isinstance(Body, bytes) else Body.read()
+        with self._lock:
+            self._bucket(Bucket, "PutObject")[Key] = data
+            self.bytes_stored += len(data)
+        return {"ETag": hashlib.md5(data).hexdigest()}
+
+    def get_object(self, Bucket, Key, **kwargs):
+        with self._lock:
+            objects = self._bucket(Bucket, "GetObject")
+            if Key not in objects:
+                raise _client_error("NoSuchKey", "GetObject")
+            return {"Body": io.BytesIO(objects[Key]), "ContentLength": len(objects[Key])}
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        upload_id = uuid.uuid4().hex
+        with self._lock:
+            self._bucket(Bucket, "CreateMultipartUpload")
+            self.uploads[upload_id] = {}
+        return {"UploadId": upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body, **kwargs):
+        data = Body.read()
+        with self._lock:
+            self.requests += 1
+            if UploadId not in self.uploads:
+                raise _client_error("NoSuchUpload", "UploadPart")
+            self.uploads[UploadId][PartNumber] = data
+        return {"ETag": hashlib.md5(data).hexdigest()}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload, **kwargs):
+        with self._lock:
+            parts = self.uploads.pop(UploadId, None)
+            if parts is None:
+                raise _client_error("NoSuchUpload", "CompleteMultipartUpload")
+            data = b"".join(parts[part["PartNumber"]] for part in MultipartUpload["Parts"])
+            self._bucket(Bucket, "CompleteMultipartUpload")[Key] = data
+            self.bytes_stored += len(data)
+        return {}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId, **kwargs):
+        with self._lock:
+            self.requests += 1
+            self.uploads.pop(UploadId, None)
+        return {}
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "objects": sum(len(objects) for objects in self.buckets.values()),
+                "bytes_stored": self.bytes_stored,
+            }
+
+
+class FakeRedis:
+    """
+    Async Redis with the commands the app issues over its shared connection, kept in a dict.
+    The fastapi-limiter Lua script is run natively: evalsha applies its fixed-window counter.
+    """
+
+    def __init__(self):
+        self.values = {}
+        self.commands = 0
+
+    def _get(self, key):
+        value, expires_at = self.values.get(key, (None, None))
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self.values[key]
+            return None
+        return value
+
+    async def ping(self):
+        self.commands += 1
+        return True
+
+    async def get(self, key):
+        self.commands += 1
+        return self._get(key)
+
+    async def set(self, key, value, ex=None, px=None, **kwargs):
+        self.commands += 1
+        ttl = px / 1000 if px is not None else ex
+        self.values[key] = (value, time.monotonic() + ttl if ttl is not None else None)
+        return True
+
+    async def delete(self, *keys):
+        self.commands += 1
+        return sum(self.values.pop(key, None) is not None for key in keys)
+
+    async def script_load(self, script: str):
+        self.commands += 1
+        return hashlib.sha1(script.encode()).hexdigest()
+
+    async def evalsha(self, sha, numkeys, key, limit, expire_ms):
+        # fastapi-limiter: allow `limit` requests per `expire_ms`, else return the milliseconds to wait
+        self.commands += 1
+        current = int(self._get(key) or 0)
+        if current == 0:
+            self.values[key] = (1, time.monotonic() + int(expire_ms) / 1000)
+            return 0
+        if current + 1 > int(limit):
+            return max(int((self.values[key][1] - time.monotonic()) * 1000), 1)
+        self.values[key] = (current + 1, self.values[key][1])
+        return 0
+
+    async def aclose(self):
+        pass
+
+    close = aclose
@@ -0,0 +1,33 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from startup import check_readiness, startup_report, READINESS_CHECKS
+from db.database import pool_stats
+
+health_router = APIRouter()
+
+
+# Liveness: the process is up and its event loop responds; no dependency is checked
+@health_router.get("/health/live")
+async def liveness():
+    return {"status": "alive"}
+
+
+# Readiness: every dependency answers now, and the startup phases that are not rechecked
+# here (clients, Google credentials, ingestion workers) succeeded. 503 otherwise.
+@health_router.get("/health/ready")
+async def readiness():
+    dependencies = await check_readiness()
+    startup = {name: outcome for name, outcome in startup_report.items() if name not in READINESS_CHECKS}
+    ready = all(outcome["ok"] for outcome in dependencies.values()) and all(
+        outcome["ok"] for outcome in startup.values()
+    )
+    return JSONResponse(
+        {
+            "status": "ready" if ready else "unavailable",
+            "dependencies": dependencies,
+            "startup": startup_report,
+            # Connection pool usage, to tell a saturated pool from a slow database
+            "database_pool": pool_stats(),
+        },
+        status_code=200 if ready else 503,
+    )
@@ -0,0 +1,25 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from services import nlp_services
+from services.metrics import registry
+from db.database import pool_metrics
+
+metrics_router = APIRouter()
+
+# Counters kept by the components themselves, read on every scrape.
+# Looked up through the module so replacements (e.g. in tests) are what gets reported.
+registry.add_collector("answer_cache", lambda: nlp_services.answer_cache.stats())
+registry.add_collector("vector_cache", lambda: nlp_services.vector_store_cache.stats())
+registry.add_collector("lexical_cache", lambda: nlp_services.lexical_index_registry.cache.stats())
+registry.add_collector("query_batcher", lambda: nlp_services.query_batcher.stats())
+registry.add_collector("embedding_batches", lambda: nlp_services.embeddings.stats())
+registry.add_collector("llm_clients", lambda: nlp_services.llm_clients.stats())
+registry.add_collector("database_pool_async", pool_metrics["async"].stats)
+registry.add_collector("database_pool_sync", pool_metrics["sync"].stats)
+
+
+# Prometheus scrape endpoint: stage latency histograms, model tokens and bytes,
+# WebSocket connections and the cache, batching and pool counters of this worker process
+@metrics_router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
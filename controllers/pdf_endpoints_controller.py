@@ -1,37 +1,88 @@
+import json
+from contextlib import aclosing
 from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
-from fastapi_limiter.depends import RateLimiter
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from db.database import SessionLocal, get_db
+from db.database import AsyncSessionLocal, get_db
 from db.models import PDFText
-from .pdf_endpoints_service import upload_pdf_service #, ask_question_service
-from .schema import UploadResponse, QuestionRequest, AnswerResponse
+from .pdf_endpoints_service import enqueue_upload_service, get_ingestion_queue #, ask_question_service
+from .schema import UploadResponse, JobStatusResponse, QuestionRequest, BatchQuestionRequest, AnswerResponse
+from services.nlp_services import answer_questions, get_document_hash, is_valid_batch, MAX_BATCH_QUESTIONS
 from botocore.exceptions import NoCredentialsError
-import os
 from dotenv import load_dotenv
+from services.env import env_int
+from services.rate_limiter import FailOpenRateLimiter
 load_dotenv()
 
 # Import the APIRouter from FastAPI
-no_of_request = int(os.getenv('no_of_request', 5))  # default to 5 if not set
-no_of_minutes = int(os.getenv('minutes', 1))  # default to 1 if not set
+no_of_request = env_int('no_of_request', 5)  # default to 5 if not set
+no_of_minutes = env_int('minutes', 1)  # default to 1 if not set
 
 router = APIRouter()
 
 # Define a POST endpoint for uploading PDFs
-@router.post("/upload", response_model=UploadResponse)
+@router.post("/upload", response_model=UploadResponse, status_code=202)
 async def upload_pdf(
     file: UploadFile = File(...), 
-    db: Session = Depends(get_db),
-    rate_limit = Depends(RateLimiter(times=no_of_request, minutes=no_of_minutes))
+    queue = Depends(get_ingestion_queue),
+    rate_limit = Depends(FailOpenRateLimiter(times=no_of_request, minutes=no_of_minutes))
 ):
     try:
-        # Delegate the functionality to the service layer
-        result = upload_pdf_service(file, db)
+        # Delegate the functionality to the service layer; extraction, storage and
+        # indexing happen in background workers
+        job = await enqueue_upload_service(file, queue)
+    except HTTPException:
+        raise
     except Exception as e:
         # Handle unexpected exceptions gracefully
         raise HTTPException(status_code=500, detail=str(e))
 
-    # Return the result as a response
-    return {"id": result["id"], "filename": result["filename"], "message": "File successfully uploaded and text extracted."}
+    # Return the job as a response
+    if job["deduplicated"]:
+        message = "File already uploaded; the existing document is reused."
+    else:
+        message = "File accepted for processing."
+    return {
+        "job_id": job["id"],
+        "filename": job["filename"],
+        "status": job["status"],
+        "message": message,
+        "text_id": job["text_id"],
+    }
+
+# Define a GET endpoint for polling the progress of an upload
+@router.get("/jobs/{job_id}", response_model=JobStatusResponse)
+async def get_job_status(job_id: str, queue = Depends(get_ingestion_queue)):
+    if queue is None:
+        raise HTTPException(status_code=503, detail="PDF ingestion is unavailable. Please try again later.")
+    job = await queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+# Define a POST endpoint for asking several questions about one document.
+# Answers are streamed back as newline-delimited JSON, one line per question as it is answered.
+@router.post("/ask/batch")
+async def ask_batch(
+    request: BatchQuestionRequest,
+    rate_limit = Depends(FailOpenRateLimiter(times=no_of_request, minutes=no_of_minutes))
+):
+    if not is_valid_batch(request.questions):
+        raise HTTPException(
+            status_code=400, detail=f"'questions' must be a list of 1 to {MAX_BATCH_QUESTIONS} questions."
+        )
+    # The session is closed before the answers are streamed, so the connection returns to the pool
+    async with AsyncSessionLocal() as db:
+        content_hash = await get_document_hash(db, request.text_id)
+    if content_hash is None:
+        raise HTTPException(status_code=404, detail="PDF text not found.")
+
+    async def lines():
+        async with aclosing(answer_questions(request.questions, request.text_id, content_hash)) as results:
+            async for result in results:
+                yield json.dumps(result) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
 
 # Define a POST endpoint for asking questions
 # @router.post("/ask", response_model=AnswerResponse)
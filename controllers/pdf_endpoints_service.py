@@ -1,36 +1,301 @@
 from sqlalchemy.orm import Session
+from db.database import SessionLocal
 from db.models import PDFText
-from services.pdf_service import pdf_to_text
-from services.nlp_services import generate_answer
+from services.pdf_service import iter_pdf_pages
+from services.nlp_services import (
+    get_page_chunks,
+    embed_chunks,
+    build_document_index,
+    load_document_index,
+    text_hash,
+)
+from services.chunk_store import (
+    save_document,
+    save_alias,
+    mark_stored,
+    backfill_file_hash,
+    find_document_by_file_hash,
+    find_document_by_filename,
+)
 from botocore.exceptions import NoCredentialsError
-from aws.s3client import s3_client, S3_BUCKET_NAME
+from aws.s3client import start_upload, hash_object
+from services.concurrency import run_blocking
+from services.tracing import traced, trace, DEBUG_TIMINGS
+from services.job_queue import WorkerPool, create_job_queue, new_job, COMPLETED
 from fastapi import HTTPException
+import hashlib
+import logging
+from collections import namedtuple
+import os
+import tempfile
+from services.env import env_int, env_str
 
-def upload_pdf_service(file, db: Session):
+logger = logging.getLogger("pdf_chat_bot")
+
+# Size of the buffer used when spooling uploads to disk
+UPLOAD_BUFFER_SIZE = 1024 * 1024
+
+# Directory where uploads wait for an ingestion worker (must be shared by all workers of a host)
+INGESTION_STAGING_DIR = env_str("ingestion_staging_dir") or os.path.join(tempfile.gettempdir(), "pdf_ingestion")
+# Number of ingestion jobs processed at the same time by one worker process
+INGESTION_WORKERS = env_int("ingestion_workers", 2)
+# Attempts per job before it is marked as failed
+INGESTION_MAX_ATTEMPTS = env_int("ingestion_max_attempts", 3)
+
+# Document found by reuse_existing_document; `filename` is the S3 key of its PDF
+ExistingDocument = namedtuple("ExistingDocument", ["text_id", "content_hash", "stored", "filename"])
+
+# Queue and workers are created in startup (see start_ingestion)
+ingestion_queue = None
+ingestion_workers = None
+
+def validate_pdf_filename(filename: str):
     # Check if the uploaded file is a PDF
-    if not file.filename.endswith(".pdf"):
+    if not filename.endswith(".pdf"):
         raise HTTPException(status_code=400, detail="Invalid file type. Only PDFs are allowed.")
 
-    # Read the contents of the uploaded file
-    contents = file.file.read()  # Note: Using `file.file.read()` since this will be a file-like object
+@traced("spool")
+def spool_upload(file, path: str) -> str:
+    # Copy the upload to disk in fixed-size chunks, hashing the bytes on the way
+    digest = hashlib.sha256()
+    with open(path, "wb") as f:
+        while True:
+            block = file.file.read(UPLOAD_BUFFER_SIZE)
+            if not block:
+                break
+            digest.update(block)
+            f.write(block)
+    return digest.hexdigest()
 
-    # Process the PDF and extract the text
-    text = pdf_to_text(contents)
+def reuse_existing_document(db: Session, filename: str, file_hash: str):
+    # Return the document uploaded before with the same bytes, or None if the bytes are new.
+    # A stored document is reused as it is (text, S3 object and index), with `filename` recorded as an alias.
+    # One that is not stored was saved by an upload that failed before its PDF reached S3: the caller
+    # stores these identical bytes for it (see run_ingestion_job) instead of aliasing a missing file.
+    pdf_text = find_document_by_filename(db, filename)
+    if pdf_text is not None:
+        known_hash = pdf_text.file_hash
+        if known_hash is None:
+            known_hash = verify_legacy_document(db, pdf_text, file_hash)
+        if known_hash != file_hash:
+            raise HTTPException(status_code=409, detail=f"A different file named {filename} has already been uploaded.")
+    else:
+        pdf_text = find_document_by_file_hash(db, file_hash)
+        if pdf_text is None:
+            return None
+    if pdf_text.stored:
+        record_alias(db, filename, pdf_text)
+    return ExistingDocument(pdf_text.id, pdf_text.content_hash, pdf_text.stored, pdf_text.filename)
 
-    # Save the extracted text to PostgreSQL
-    pdf_text = PDFText(filename=file.filename, text=text)
-    db.add(pdf_text)
-    db.commit()
-    db.refresh(pdf_text)
+def verify_legacy_document(db: Session, pdf_text, file_hash: str) -> str:
+    # A document uploaded before file hashes were kept: its hash is that of the PDF stored for it,
+    # recorded so the next upload is checked without reading S3. If that PDF is missing, these
+    # bytes are taken as its file and stored for it like for a document that was never stored.
+    stored_hash = hash_object(pdf_text.filename)
+    stored = stored_hash is not None
+    if not stored:
+        stored_hash = file_hash
+    if backfill_file_hash(db, pdf_text.id, stored_hash, stored):
+        db.refresh(pdf_text)
+    return stored_hash
 
-    # Save the PDF to S3
+def record_alias(db: Session, filename: str, pdf_text):
+    if filename != pdf_text.filename:
+        save_alias(db, filename, pdf_text.id)
+
+def _mark_stored(db: Session, text_id: int, filename: str):
+    mark_stored(db, text_id)
+    record_alias(db, filename, db.get(PDFText, text_id))
+
+@traced("extract")
+def extract_pages(path: str) -> list:
+    # Extract the text page by page from the file, keeping page numbers
+    return list(iter_pdf_pages(path))
+
+def prepare_chunks(pages: list):
+    # Chunk the pages and embed the chunks (only embedding cache misses reach the API)
+    text = "".join(page.text for page in pages)
+    chunks = get_page_chunks(pages)
+    vectors, stats = embed_chunks(chunks)
+    return text, chunks, vectors, stats
+
+def begin_store_pdf(path: str, filename: str):
+    # Start uploading the PDF to S3 while the text is extracted; it is published by finish_store_pdf
     try:
-        s3_client.put_object(Bucket=S3_BUCKET_NAME, Key=file.filename, Body=contents)
-    except NoCredentialsError:
+        return start_upload(path, filename)
+    except NoCredentialsError as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-    # Return success response data
-    return {"id": pdf_text.id, "filename": file.filename}
+@traced("s3_upload")
+def finish_store_pdf(upload):
+    try:
+        upload.complete()
+    except NoCredentialsError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def store_pdf(path: str, filename: str):
+    # Save the PDF to S3
+    finish_store_pdf(begin_store_pdf(path, filename))
+
+def index_document(text_id: int, content_hash: str, chunks, vectors):
+    # Build the document's vector index once, so questions only embed the query.
+    # A failure here is not fatal: the index is rebuilt from the stored chunks on the first question.
+    try:
+        build_document_index(text_id, content_hash, chunks, vectors)
+    except Exception as e:
+        logger.error(f"Failed to build index for document {text_id}: {e}")
+
+def get_staging_path(job_id: str) -> str:
+    return os.path.join(INGESTION_STAGING_DIR, f"{job_id}.pdf")
+
+async def enqueue_upload_service(file, queue) -> dict:
+    # Accept an upload for background ingestion: only the file is spooled before returning a job
+    validate_pdf_filename(file.filename)
+    if queue is None:
+        # Ingestion did not start (see startup_report): refuse before spooling anything
+        raise HTTPException(status_code=503, detail="PDF ingestion is unavailable. Please try again later.")
+
+    job = new_job(filename=file.filename, text_id=None, embedding_cache_hit_rate=None, deduplicated=False)
+    os.makedirs(INGESTION_STAGING_DIR, exist_ok=True)
+    try:
+        job["file_hash"] = await run_blocking(spool_upload, file, get_staging_path(job["id"]))
+        existing = await run_blocking(_reuse_in_new_session, file.filename, job["file_hash"])
+
+        if existing is not None and existing.stored:
+            # Known bytes: the job is complete before it starts
+            remove_staged_upload(job)
+            job.update(status=COMPLETED, stage="completed", progress=1.0, text_id=existing.text_id, deduplicated=True)
+            return await queue.create(job, enqueue=False)
+        # New bytes, or a document whose PDF is not stored yet: the worker stores it
+        return await queue.create(job)
+    except Exception:
+        # Nothing will process the staged file if the job was not queued
+        remove_staged_upload(job)
+        raise
+
+def _reuse_in_new_session(filename: str, file_hash: str):
+    db = SessionLocal()
+    try:
+        return reuse_existing_document(db, filename, file_hash)
+    finally:
+        db.close()
+
+@traced("save")
+def _mark_stored_in_new_session(text_id: int, filename: str):
+    db = SessionLocal()
+    try:
+        _mark_stored(db, text_id, filename)
+    finally:
+        db.close()
+
+@traced("save")
+def _save_document_in_new_session(filename: str, text: str, chunks, vectors, file_hash: str):
+    db = SessionLocal()
+    try:
+        pdf_text = save_document(db, filename, text, text_hash(text), chunks, vectors, file_hash=file_hash)
+        return pdf_text.id, pdf_text.content_hash
+    finally:
+        db.close()
+
+async def process_ingestion_job(job: dict, report):
+    # Time the stages of the job; with debug_timings=1 they are saved on the completed job
+    with trace() as job_trace:
+        async def report_with_timings(stage_name: str, progress: float, **fields):
+            if DEBUG_TIMINGS and stage_name == "completed":
+                fields["timings"] = job_trace.summary()
+            await report(stage_name, progress, **fields)
+
+        await run_ingestion_job(job, report_with_timings)
+
+async def run_ingestion_job(job: dict, report):
+    # Worker side of an upload. Stages completed by an earlier attempt are skipped on retry.
+    path = get_staging_path(job["id"])
+    chunks = None
+    upload = None
+
+    if job.get("text_id") is None and job.get("file_hash") is not None:
+        # An identical upload may have been ingested since this one was queued
+        existing = await run_blocking(_reuse_in_new_session, job["filename"], job["file_hash"])
+        if existing is not None and existing.stored:
+            await report("completed", 1.0, text_id=existing.text_id, deduplicated=True)
+            remove_staged_upload(job)
+            return
+        if existing is not None:
+            # Its text is saved but its PDF never reached S3: store these bytes for it, under its key
+            fields = dict(
+                text_id=existing.text_id, content_hash=existing.content_hash, s3_key=existing.filename,
+                deduplicated=True,
+            )
+            job.update(fields)
+            await report("storing", 0.7, **fields)
+
+    try:
+        if job.get("text_id") is None:
+            # The PDF uploads to S3 in the background while the text is extracted and embedded
+            upload = await run_blocking(begin_store_pdf, path, job["filename"])
+            await report("extracting", 0.1)
+            pages = await run_blocking(extract_pages, path)
+            await report("embedding", 0.3)
+            text, chunks, vectors, stats = await run_blocking(prepare_chunks, pages)
+            await report("saving", 0.6)
+            text_id, content_hash = await run_blocking(
+                _save_document_in_new_session, job["filename"], text, chunks, vectors, job.get("file_hash")
+            )
+            await report(
+                "storing", 0.7,
+                text_id=text_id, content_hash=content_hash, embedding_cache_hit_rate=stats["embedding_cache_hit_rate"],
+            )
+        else:
+            text_id, content_hash = job["text_id"], job["content_hash"]
+
+        if job.get("stage") not in ("indexing", "completed"):
+            await report("storing", 0.7)
+            if upload is not None:
+                await run_blocking(finish_store_pdf, upload)
+            else:
+                await run_blocking(store_pdf, path, job.get("s3_key") or job["filename"])
+            await run_blocking(_mark_stored_in_new_session, text_id, job["filename"])
+    except Exception:
+        # A retry uploads the file again from the staging directory
+        if upload is not None:
+            await run_blocking(upload.abort)
+        raise
+
+    await report("indexing", 0.9)
+    if chunks is not None:
+        await run_blocking(index_document, text_id, content_hash, chunks, vectors)
+    else:
+        # Retried job: rebuild the index from the chunks saved by the earlier attempt
+        await run_blocking(load_document_index, text_id, content_hash)
+    await report("completed", 1.0)
+
+    remove_staged_upload(job)
+
+def remove_staged_upload(job: dict):
+    try:
+        os.remove(get_staging_path(job["id"]))
+    except FileNotFoundError:
+        pass
+
+def get_ingestion_queue():
+    return ingestion_queue
+
+def start_ingestion(redis=None):
+    # Create the job queue and start this process's bounded pool of ingestion workers
+    global ingestion_queue, ingestion_workers
+    ingestion_queue = create_job_queue(env_str("ingestion_queue_backend", "redis"), redis=redis)
+    ingestion_workers = WorkerPool(
+        ingestion_queue,
+        process_ingestion_job,
+        concurrency=INGESTION_WORKERS,
+        max_attempts=INGESTION_MAX_ATTEMPTS,
+        on_failure=remove_staged_upload,
+    )
+    ingestion_workers.start()
+
+async def stop_ingestion():
+    if ingestion_workers is not None:
+        await ingestion_workers.stop()
 
 
 # def ask_question_service(question: str, text_id: int, db: Session):
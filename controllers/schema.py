@@ -1,16 +1,43 @@
+from typing import List, Optional
 from pydantic import BaseModel
 
 # Define the UploadResponse model
 class UploadResponse(BaseModel):
-    id: int
+    job_id: str
     filename: str
+    status: str
     message: str
+    # Set right away when the same file was uploaded before
+    text_id: Optional[int] = None
+
+# Define the JobStatusResponse model
+class JobStatusResponse(BaseModel):
+    id: str
+    filename: str
+    status: str  # queued, running, completed or failed
+    stage: Optional[str] = None
+    progress: float
+    attempts: int
+    error: Optional[str] = None
+    # Set once the extracted text has been saved
+    text_id: Optional[int] = None
+    # Share of chunks whose embeddings were reused (None if indexing is deferred to the first question)
+    embedding_cache_hit_rate: Optional[float] = None
+    # True if the file was uploaded before and the existing document was reused
+    deduplicated: bool = False
+    # Milliseconds spent in each ingestion stage, with debug_timings=1
+    timings: Optional[dict] = None
 
 # Define the QuestionRequest model
 class QuestionRequest(BaseModel):
     text_id: int
     question: str
 
+# Define the BatchQuestionRequest model
+class BatchQuestionRequest(BaseModel):
+    text_id: int
+    questions: List[str]
+
 # Define the AnswerResponse model
 class AnswerResponse(BaseModel):
     answer: str
\ No newline at end of file
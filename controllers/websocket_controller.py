@@ -1,16 +1,26 @@
 import json
-import os
-import time
 import traceback
 from starlette.websockets import WebSocketState
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends
-from sqlalchemy.orm import Session
-from db.database import get_db
-from db.models import PDFText
-from services.nlp_services import generate_answer
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from db.database import AsyncSessionLocal
+from services.nlp_services import (
+    generate_answer,
+    stream_answer,
+    answer_questions,
+    answer_across_documents,
+    get_document_hash,
+    get_documents,
+    is_valid_batch,
+    MAX_BATCH_QUESTIONS,
+    MAX_QUERY_DOCUMENTS,
+)
+from services.rate_limiter import create_rate_limiter
+from services.metrics import Counter, Gauge
+from services.tracing import trace, DEBUG_TIMINGS
 from dotenv import load_dotenv
-from collections import defaultdict
+from contextlib import aclosing
 import logging
+from services.env import env_int, env_str
 
 load_dotenv()
 
@@ -18,11 +28,17 @@ logger = logging.getLogger("websocket_controller")
 logging.basicConfig(level=logging.INFO)
 
 # Rate limit constants
-MAX_MESSAGES_PER_SECOND = int(os.getenv("no_of_request"))
-TIME_WINDOW = int(os.getenv("time_window"))
+MAX_MESSAGES_PER_SECOND = env_int("no_of_request", 5)
+TIME_WINDOW = env_int("time_window", 1)
 
-# Rate-limiting storage
-message_counts = defaultdict(list)
+# Sliding-window limit per client IP, shared by all workers when backed by Redis
+rate_limiter = create_rate_limiter(
+    env_str("ws_rate_limit_backend", "redis"), MAX_MESSAGES_PER_SECOND, TIME_WINDOW
+)
+
+WEBSOCKET_CONNECTIONS = Gauge("websocket_connections", "Open WebSocket connections.")
+WEBSOCKET_CONNECTIONS_TOTAL = Counter("websocket_connections_total", "WebSocket connections accepted.")
+WEBSOCKET_MESSAGES = Counter("websocket_messages_total", "WebSocket messages received.")
 
 # Connection manager for WebSockets
 class ConnectionManager:
@@ -32,11 +48,14 @@ class ConnectionManager:
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
         self.active_connections.append(websocket)
+        WEBSOCKET_CONNECTIONS.inc()
+        WEBSOCKET_CONNECTIONS_TOTAL.inc()
         logger.info(f"Client connected: {websocket.client.host}")
 
     def disconnect(self, websocket: WebSocket):
         if websocket in self.active_connections:
             self.active_connections.remove(websocket)
+            WEBSOCKET_CONNECTIONS.dec()
             logger.info(f"Client disconnected: {websocket.client.host}")
 
     async def send_message(self, message: dict, websocket: WebSocket):
@@ -49,15 +68,20 @@ class ConnectionManager:
 manager = ConnectionManager()
 websocket_router = APIRouter()
 
+# With debug_timings=1, the last frame of each answer carries the milliseconds spent in each stage
+def with_timings(message: dict, message_trace) -> dict:
+    if DEBUG_TIMINGS:
+        message["timings"] = message_trace.summary()
+    return message
+
 @websocket_router.websocket("/ws/question")
-async def websocket_endpoint(websocket: WebSocket, db: Session = Depends(get_db)):
+async def websocket_endpoint(websocket: WebSocket):
     user_ip = websocket.headers.get("x-forwarded-for", websocket.client.host)
     logger.info(f"WebSocket request from IP: {user_ip}")
 
     await manager.connect(websocket)
     try:
         while True:
-            current_time = time.time()
 
             # Receive message
             try:
@@ -69,44 +93,102 @@ async def websocket_endpoint(websocket: WebSocket, db: Session = Depends(get_db)
                     {"error": "Invalid message format or error receiving data."}, websocket
                 )
                 continue
+            WEBSOCKET_MESSAGES.inc()
 
             # Rate limiting
-            timestamps = message_counts[user_ip]
-            message_counts[user_ip] = [
-                ts for ts in timestamps if current_time - ts < TIME_WINDOW
-            ]
-            if len(message_counts[user_ip]) >= MAX_MESSAGES_PER_SECOND:
+            if not await rate_limiter.allow(user_ip):
                 await manager.send_message(
                     {"error": "Rate limit exceeded. Please wait before sending more messages."},
                     websocket,
                 )
                 continue
 
-            message_counts[user_ip].append(current_time)
-
             # Validate input
             text_id = question_request.get("text_id")
             question = question_request.get("question")
+            # A "questions" list asks several questions about the document in one message
+            questions = question_request.get("questions")
+            batch = "questions" in question_request
+            # Clients opt in to incremental {"delta": ...} frames; others get a single {"answer": ...}
+            stream = question_request.get("stream", False) is True
+
+            # A "text_ids" list asks one question across several documents
+            text_ids = question_request.get("text_ids")
+
+            if text_ids is not None:
+                if not question or not (
+                    isinstance(text_ids, list)
+                    and 0 < len(text_ids) <= MAX_QUERY_DOCUMENTS
+                    and all(isinstance(document_id, int) for document_id in text_ids)
+                ):
+                    await manager.send_message(
+                        {"error": f"Invalid request. 'text_ids' must be a list of 1 to {MAX_QUERY_DOCUMENTS} "
+                                  "integers, and 'question' is required."},
+                        websocket,
+                    )
+                    continue
+                try:
+                    with trace() as message_trace:
+                        # A session per message, closed before the model is called: idle sockets hold no connection
+                        async with AsyncSessionLocal() as db:
+                            documents = await get_documents(db, list(set(text_ids)))
+                        missing = sorted(set(text_ids) - set(documents))
+                        if missing:
+                            await manager.send_message({"error": f"PDF text not found: {missing}."}, websocket)
+                            continue
+                        # {"answer": ..., "sources": [...]}; each source names its document
+                        response = await answer_across_documents(question, documents)
+                    await manager.send_message(with_timings(response, message_trace), websocket)
+                except Exception as e:
+                    logger.error(f"Error generating answer: {e}\n{traceback.format_exc()}")
+                    await manager.send_message(
+                        {"error": "Failed to process the question. Please try again later."}, websocket
+                    )
+                continue
 
-            if not isinstance(text_id, int) or not question:
+            if not isinstance(text_id, int) or not (question or batch):
                 await manager.send_message(
                     {"error": "Invalid request. 'text_id' must be an integer, and 'question' is required."},
                     websocket,
                 )
                 continue
-
-            # Fetch PDF text
-            pdf_text = db.query(PDFText).filter(PDFText.id == text_id).first()
-            if not pdf_text:
+            if batch and not is_valid_batch(questions):
                 await manager.send_message(
-                    {"error": "PDF text not found."}, websocket
+                    {"error": f"Invalid request. 'questions' must be a list of 1 to {MAX_BATCH_QUESTIONS} questions."},
+                    websocket,
                 )
                 continue
 
             # Generate answer
             try:
-                answer = generate_answer(question, pdf_text.text)
-                await manager.send_message({"answer": answer}, websocket)
+                with trace() as message_trace:
+                    # Fetch only the document's content hash; retrieval reads the top-k chunks itself
+                    async with AsyncSessionLocal() as db:
+                        content_hash = await get_document_hash(db, text_id)
+                    if content_hash is None:
+                        await manager.send_message(
+                            {"error": "PDF text not found."}, websocket
+                        )
+                        continue
+
+                    if batch:
+                        # One {"index": ..., "answer": ...} frame per question as it is answered, then {"done": true}
+                        async with aclosing(answer_questions(questions, text_id, content_hash)) as results:
+                            async for result in results:
+                                await manager.send_message(result, websocket)
+                        await manager.send_message(
+                            with_timings({"done": True, "count": len(questions)}, message_trace), websocket
+                        )
+                    elif stream:
+                        async with aclosing(stream_answer(question, text_id, content_hash)) as frames:
+                            async for frame in frames:
+                                if frame.get("done"):
+                                    frame = with_timings(frame, message_trace)
+                                await manager.send_message(frame, websocket)
+                    else:
+                        # {"answer": ..., "cache": ...}; "cache" tells whether the answer was cached
+                        response = await generate_answer(question, text_id, content_hash)
+                        await manager.send_message(with_timings(response, message_trace), websocket)
             except Exception as e:
                 logger.error(f"Error generating answer: {e}\n{traceback.format_exc()}")
                 await manager.send_message(
@@ -121,4 +203,5 @@ async def websocket_endpoint(websocket: WebSocket, db: Session = Depends(get_db)
             {"error": "An unexpected error occurred. Please try again later."}, websocket
         )
     finally:
-        db.close()  # Ensure the database session is closed
+        # Also after unexpected errors, so the connection count stays right
+        manager.disconnect(websocket)
@@ -1,15 +1,90 @@
-from sqlalchemy import create_engine
+import threading
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.orm import sessionmaker
 from .config import settings
+from services.env import env_int
 
 #creating connection String
 SQLALCHEMY_DATABASE_URL = f'postgresql://{settings.database_username}:{settings.database_password}@{settings.database_hostname}:{settings.database_port}/{settings.database_name}'
+# Same database through asyncpg, for request handlers
+ASYNC_SQLALCHEMY_DATABASE_URL = SQLALCHEMY_DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://", 1)
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+# Connection pool settings, per engine and per worker process
+DB_POOL_SIZE = env_int("db_pool_size", 5)
+DB_MAX_OVERFLOW = env_int("db_max_overflow", 10)
+DB_POOL_TIMEOUT = env_int("db_pool_timeout", 30)  # seconds to wait for a free connection
+DB_POOL_RECYCLE = env_int("db_pool_recycle", 1800)  # seconds before a connection is replaced
+
+POOL_OPTIONS = dict(
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    # Connections dropped by the server (idle timeouts, failover) are replaced before use
+    pool_pre_ping=True,
+)
+
+
+class PoolMetrics:
+    """
+    Counts connections checked out of an engine's pool, to tell how close it runs to saturation.
+    A saturated checkout takes the last connection the pool can open: the next one waits
+    up to db_pool_timeout seconds.
+    """
+
+    def __init__(self, engine, capacity: int):
+        self.capacity = capacity
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.checkouts = 0
+        self.saturated_checkouts = 0
+        self._lock = threading.Lock()
+        # Pool events fire on the engine's sync pool (async engines expose it as .sync_engine)
+        event.listen(engine, "checkout", self._on_checkout)
+        event.listen(engine, "checkin", self._on_checkin)
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        with self._lock:
+            self.in_use += 1
+            self.checkouts += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+            if self.in_use >= self.capacity:
+                self.saturated_checkouts += 1
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.in_use -= 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "capacity": self.capacity,
+                "in_use": self.in_use,
+                "peak_in_use": self.peak_in_use,
+                "checkouts": self.checkouts,
+                "saturated_checkouts": self.saturated_checkouts,
+                "utilization": round(self.in_use / self.capacity, 3) if self.capacity else 0.0,
+            }
+
+
+# Sync engine: ingestion workers, startup and code running in the blocking pool
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **POOL_OPTIONS)
+# Async engine: request handlers, so queries do not block the event loop.
+# Creating it opens no connection; the first query does.
+async_engine = create_async_engine(ASYNC_SQLALCHEMY_DATABASE_URL, **POOL_OPTIONS)
+
+pool_metrics = {
+    "sync": PoolMetrics(engine, DB_POOL_SIZE + DB_MAX_OVERFLOW),
+    "async": PoolMetrics(async_engine.sync_engine, DB_POOL_SIZE + DB_MAX_OVERFLOW),
+}
 
 # Create a SessionLocal class using the sessionmaker function
 SessionLocal = sessionmaker(autocommit=False,autoflush=False,bind=engine)
+# Async sessions are opened per message or request and closed before any slow work,
+# so a connection is only held while its queries run
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
 # Define a dependency function for getting a database session
@@ -18,4 +93,8 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+# Connection pool usage of both engines: {"sync": {...}, "async": {...}}
+def pool_stats() -> dict:
+    return {name: metrics.stats() for name, metrics in pool_metrics.items()}
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text
+from sqlalchemy import Column, Integer, String, Text, LargeBinary, ForeignKey, Boolean
 from .database import Base
 
 # Define the PDFText model
@@ -10,3 +10,30 @@ class PDFText(Base):
     id = Column(Integer, primary_key=True, index=True)  # Primary key column
     filename = Column(String, unique=True, index=True)  # Unique filename column, indexed
     text = Column(Text, nullable=False)  # Text column, cannot be null
+    content_hash = Column(String(64), nullable=True)  # sha256 of the text; null until the document is chunked
+    file_hash = Column(String(64), unique=True, index=True, nullable=True)  # sha256 of the uploaded bytes; null for older uploads
+    stored = Column(Boolean, nullable=False, default=False)  # True once the PDF is in S3; only stored documents are reused
+
+# Define the PDFAlias model
+class PDFAlias(Base):
+    # Set the table name for the model
+    __tablename__ = "pdf_aliases"
+
+    # Define the columns for the table
+    id = Column(Integer, primary_key=True, index=True)  # Primary key column
+    filename = Column(String, unique=True, index=True, nullable=False)  # Another name the same file was uploaded under
+    pdf_text_id = Column(Integer, ForeignKey("pdf_texts.id", ondelete="CASCADE"), nullable=False, index=True)
+
+# Define the PDFChunk model
+class PDFChunk(Base):
+    # Set the table name for the model
+    __tablename__ = "pdf_chunks"
+
+    # Define the columns for the table
+    id = Column(Integer, primary_key=True, index=True)  # Primary key column
+    pdf_text_id = Column(Integer, ForeignKey("pdf_texts.id", ondelete="CASCADE"), nullable=False, index=True)
+    chunk_index = Column(Integer, nullable=False)  # Position of the chunk in the document
+    page_start = Column(Integer, nullable=True)  # First page of the chunk (1-based), null if unknown
+    page_end = Column(Integer, nullable=True)  # Last page of the chunk (1-based), null if unknown
+    text = Column(Text, nullable=False)  # Chunk text
+    embedding = Column(LargeBinary, nullable=False)  # float32 embedding vector
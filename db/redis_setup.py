@@ -3,20 +3,42 @@ import redis.asyncio as redis
 from fastapi_limiter import FastAPILimiter
 import os
 import logging
+from services.env import env_int, env_str
 
 logger = logging.getLogger("pdf_chat_bot")
 
+# Connection created by setup_redis, shared by the rate limiter and other async users
+redis_connection = None
+# Synchronous, binary-safe client for blocking code paths (e.g. the embedding cache)
+sync_redis_connection = None
+
+def get_redis():
+    if redis_connection is None:
+        raise RuntimeError("Redis has not been set up yet.")
+    return redis_connection
+
+def get_redis_url():
+    # Get Redis credentials from environment variables
+    redis_host = env_str("REDIS_HOST", "localhost")
+    redis_port = env_int("REDIS_PORT", 6379)
+    return f"redis://{redis_host}:{redis_port}"
+
+def get_sync_redis():
+    global sync_redis_connection
+    if sync_redis_connection is None:
+        # Same server and credentials as setup_redis, but without response decoding so binary values round-trip
+        sync_redis_connection = Redis.from_url(get_redis_url(), password=os.getenv("REDIS_PASSWORD"))
+    return sync_redis_connection
+
 async def setup_redis():
+    global redis_connection
     try:
-        # Get Redis credentials from environment variables
-        redis_host = os.getenv("REDIS_HOST")
-        redis_port = int(os.getenv("REDIS_PORT")) 
         redis_password = os.getenv("REDIS_PASSWORD")
 
         # Connect to Redis (online instance)
         # redis_connection = Redis(host=redis_host, port=redis_port, password=redis_password, decode_responses=True)
         redis_connection = redis.from_url(
-            f"redis://{redis_host}:{redis_port}",
+            get_redis_url(),
             password=redis_password,
             encoding="utf-8",
             decode_responses=True,
@@ -2,8 +2,12 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from controllers.pdf_endpoints_controller import router
 from controllers.websocket_controller import websocket_router
+from controllers.health_controller import health_router
+from controllers.metrics_controller import metrics_router
 from dotenv import load_dotenv
 from startup import startup_event
+from controllers.pdf_endpoints_service import stop_ingestion
+from db.database import async_engine
 from contextlib import asynccontextmanager
 
 # Load environment variables
@@ -28,6 +32,9 @@ async def lifespan(app: FastAPI):
         raise
     finally:
         # Cleanup tasks if needed during shutdown
+        await stop_ingestion()
+        # Close the pooled connections of the async engine
+        await async_engine.dispose()
         logger.info("Application shutting down.")
 
 # Initialize FastAPI app with lifespan
@@ -45,6 +52,8 @@ app.add_middleware(
 # Include application routes
 app.include_router(router)
 app.include_router(websocket_router)
+app.include_router(health_router)
+app.include_router(metrics_router)
 
 # Root endpoint
 @app.get("/")
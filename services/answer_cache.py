@@ -0,0 +1,218 @@
+import re
+import json
+import time
+import hashlib
+import logging
+from collections import OrderedDict, defaultdict
+import numpy as np
+from services.env import env_float, env_int
+
+logger = logging.getLogger("pdf_chat_bot")
+
+# Cache of answers to repeated questions about the same document.
+# Tier 1 matches the normalized question exactly and is checked before anything else.
+# Tier 2 (optional) matches earlier questions whose embedding is similar enough,
+# using the question embedding that retrieval computes anyway.
+
+EXACT = "exact"
+SEMANTIC = "semantic"
+MISS = "miss"
+
+
+def normalize_question(question: str) -> str:
+    # Case, surrounding punctuation and repeated whitespace do not change the question
+    question = re.sub(r"\s+", " ", question.strip().lower())
+    return question.strip(" ?!.")
+
+
+def _question_key(question: str) -> str:
+    return hashlib.sha256(normalize_question(question).encode("utf-8")).hexdigest()
+
+
+def _unit(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class InMemoryAnswerStore:
+    """
+    Answers held by this process, with a TTL and LRU eviction beyond `max_entries`.
+    """
+
+    def __init__(self, max_entries: int, ttl: int):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # (doc_key, question_key) -> (expires_at, entry, vector)
+        self._by_document = defaultdict(set)
+
+    def _live(self, key):
+        item = self._entries.get(key)
+        if item is None:
+            return None
+        if item[0] < time.time():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return item
+
+    def _remove(self, key):
+        self._entries.pop(key, None)
+        self._by_document[key[0]].discard(key[1])
+        if not self._by_document[key[0]]:
+            del self._by_document[key[0]]
+
+    async def get(self, doc_key: str, question_key: str):
+        item = self._live((doc_key, question_key))
+        return item[1] if item else None
+
+    async def candidates(self, doc_key: str) -> list:
+        items = [self._live((doc_key, question_key)) for question_key in list(self._by_document.get(doc_key, ()))]
+        return [(item[2], item[1]) for item in items if item is not None and item[2] is not None]
+
+    async def set(self, doc_key: str, question_key: str, entry: dict, vector):
+        key = (doc_key, question_key)
+        self._remove(key)
+        self._entries[key] = (time.time() + self.ttl, entry, vector)
+        self._by_document[doc_key].add(question_key)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+
+class RedisAnswerStore:
+    """
+    Answers shared by all workers through Redis. Exact entries are plain keys with a TTL;
+    question embeddings for the semantic tier live in one hash per document, capped at
+    `max_per_document` fields. Eviction beyond the TTL relies on the server's maxmemory policy.
+    """
+
+    def __init__(self, get_client, ttl: int, max_per_document: int = 1000, prefix: str = "answers"):
+        self.get_client = get_client
+        self.ttl = ttl
+        self.max_per_document = max_per_document
+        self.prefix = prefix
+
+    async def get(self, doc_key: str, question_key: str):
+        data = await self.get_client().get(f"{self.prefix}:{doc_key}:{question_key}")
+        return json.loads(data) if data else None
+
+    async def candidates(self, doc_key: str) -> list:
+        fields = await self.get_client().hgetall(f"{self.prefix}:sem:{doc_key}")
+        items = [json.loads(value) for value in fields.values()]
+        return [(item["vector"], item["entry"]) for item in items]
+
+    async def set(self, doc_key: str, question_key: str, entry: dict, vector):
+        client = self.get_client()
+        await client.set(f"{self.prefix}:{doc_key}:{question_key}", json.dumps(entry), ex=self.ttl)
+        if vector is None:
+            return
+        semantic_key = f"{self.prefix}:sem:{doc_key}"
+        if await client.hlen(semantic_key) < self.max_per_document:
+            await client.hset(semantic_key, question_key, json.dumps({"vector": list(vector), "entry": entry}))
+            await client.expire(semantic_key, self.ttl)
+
+
+class AnswerCache:
+    """
+    Two-tier answer cache keyed by document id and content hash, so an edited document
+    never serves old answers. `similarity_threshold=None` disables the semantic tier.
+    """
+
+    def __init__(self, store, similarity_threshold: float = None):
+        self.store = store
+        self.similarity_threshold = similarity_threshold
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _doc_key(text_id: int, content_hash: str) -> str:
+        return f"{text_id}:{content_hash}"
+
+    async def get_exact(self, text_id: int, content_hash: str, question: str):
+        try:
+            entry = await self.store.get(self._doc_key(text_id, content_hash), _question_key(question))
+        except Exception as e:
+            logger.warning(f"Answer cache lookup failed: {e}")
+            return None
+        if entry is not None:
+            self.exact_hits += 1
+        return entry
+
+    async def get_similar(self, text_id: int, content_hash: str, query_vector):
+        entry = None
+        if self.similarity_threshold is not None:
+            try:
+                candidates = await self.store.candidates(self._doc_key(text_id, content_hash))
+            except Exception as e:
+                logger.warning(f"Answer cache lookup failed: {e}")
+                candidates = []
+            if candidates:
+                similarities = np.vstack([_unit(vector) for vector, _ in candidates]) @ _unit(query_vector)
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.similarity_threshold:
+                    entry = candidates[best][1]
+        if entry is not None:
+            self.semantic_hits += 1
+        else:
+            self.misses += 1
+        return entry
+
+    def record_miss(self):
+        # A question answered without the semantic lookup (e.g. by an exact lookup) after missing the exact tier
+        self.misses += 1
+
+    async def put(self, text_id: int, content_hash: str, question: str, query_vector, entry: dict):
+        # Questions answered by exact lookup have no embedding and are cached for the exact tier only
+        vector = None
+        if self.similarity_threshold is not None and query_vector is not None:
+            vector = [float(value) for value in query_vector]
+        try:
+            await self.store.set(self._doc_key(text_id, content_hash), _question_key(question), entry, vector)
+        except Exception as e:
+            logger.warning(f"Answer cache write failed: {e}")
+
+    def stats(self) -> dict:
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0,
+        }
+
+
+class DisabledAnswerCache(AnswerCache):
+    """
+    Answer cache that never stores anything (answer_cache_backend=none).
+    """
+
+    def __init__(self):
+        super().__init__(store=None)
+
+    async def get_exact(self, text_id, content_hash, question):
+        return None
+
+    async def get_similar(self, text_id, content_hash, query_vector):
+        self.misses += 1
+        return None
+
+    async def put(self, text_id, content_hash, question, query_vector, entry):
+        pass
+
+
+def create_answer_cache(name: str) -> AnswerCache:
+    """
+    Create the cache named by `answer_cache_backend`: "memory" (default), "redis" or "none".
+    """
+    ttl = env_int("answer_cache_ttl", 3600)
+    # The semantic tier serves an answer given to a different question: opt-in, off unless a threshold is set
+    threshold = env_float("answer_cache_similarity")
+    if name == "none":
+        return DisabledAnswerCache()
+    if name == "memory":
+        return AnswerCache(InMemoryAnswerStore(env_int("answer_cache_max_entries", 10000), ttl), threshold)
+    if name == "redis":
+        from db.redis_setup import get_redis
+        return AnswerCache(RedisAnswerStore(get_redis, ttl), threshold)
+    raise ValueError(f"Unknown answer cache backend '{name}'. Available: memory, redis, none")
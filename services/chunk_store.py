@@ -0,0 +1,188 @@
+import numpy as np
+from langchain_core.documents import Document
+from sqlalchemy.exc import IntegrityError
+from db.models import PDFChunk, PDFText, PDFAlias
+
+# Storage of document chunks and their embeddings in the database (table pdf_chunks),
+# with a brute-force NumPy search that works on any database, including SQLite.
+
+
+def encode_vector(vector) -> bytes:
+    return np.asarray(vector, dtype=np.float32).tobytes()
+
+
+def decode_vector(data: bytes) -> np.ndarray:
+    return np.frombuffer(data, dtype=np.float32)
+
+
+def _chunk_rows(text_id: int, chunks: list, vectors: list) -> list:
+    return [
+        PDFChunk(
+            pdf_text_id=text_id,
+            chunk_index=chunk["chunk_index"],
+            page_start=chunk["page_start"],
+            page_end=chunk["page_end"],
+            text=chunk["text"],
+            embedding=encode_vector(vector),
+        )
+        for chunk, vector in zip(chunks, vectors)
+    ]
+
+
+def save_document(db, filename: str, text: str, content_hash: str, chunks: list, vectors: list,
+                  file_hash: str = None) -> PDFText:
+    # Save the text and its chunks in one transaction
+    pdf_text = PDFText(filename=filename, text=text, content_hash=content_hash, file_hash=file_hash)
+    db.add(pdf_text)
+    db.flush()
+    db.add_all(_chunk_rows(pdf_text.id, chunks, vectors))
+    db.commit()
+    db.refresh(pdf_text)
+    return pdf_text
+
+
+def save_legacy_chunks(db, text_id: int, content_hash: str, chunks: list, vectors: list) -> bool:
+    """
+    Store chunks for a document saved before chunks were kept in the database.
+    Setting the content hash only where it is still null makes concurrent callers race safely:
+    the row lock lets one transaction win, and the others return False without writing chunks.
+    """
+    claimed = (
+        db.query(PDFText)
+        .filter(PDFText.id == text_id, PDFText.content_hash.is_(None))
+        .update({PDFText.content_hash: content_hash}, synchronize_session=False)
+    )
+    if not claimed:
+        db.rollback()
+        return False
+    db.add_all(_chunk_rows(text_id, chunks, vectors))
+    db.commit()
+    return True
+
+
+def mark_stored(db, text_id: int):
+    # The document's PDF has been published to S3: later uploads of the same bytes may reuse the document
+    db.query(PDFText).filter(PDFText.id == text_id).update({PDFText.stored: True}, synchronize_session=False)
+    db.commit()
+
+
+def backfill_file_hash(db, text_id: int, file_hash: str, stored: bool) -> bool:
+    """
+    Record the file hash of a document uploaded before file hashes were kept.
+    Only set where it is still null, so concurrent uploads race safely; returns False if the
+    hash was set meanwhile or belongs to another document.
+    """
+    try:
+        updated = (
+            db.query(PDFText)
+            .filter(PDFText.id == text_id, PDFText.file_hash.is_(None))
+            .update({PDFText.file_hash: file_hash, PDFText.stored: stored}, synchronize_session=False)
+        )
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        return False
+    return bool(updated)
+
+
+def find_document_by_file_hash(db, file_hash: str):
+    return db.query(PDFText).filter(PDFText.file_hash == file_hash).first()
+
+
+def find_document_by_filename(db, filename: str):
+    # A filename is either the name a document was first uploaded under or one of its aliases
+    pdf_text = db.query(PDFText).filter(PDFText.filename == filename).first()
+    if pdf_text is None:
+        alias = db.query(PDFAlias).filter(PDFAlias.filename == filename).first()
+        if alias is not None:
+            pdf_text = db.get(PDFText, alias.pdf_text_id)
+    return pdf_text
+
+
+def save_alias(db, filename: str, text_id: int):
+    # Record `filename` as another name of an existing document
+    db.add(PDFAlias(filename=filename, pdf_text_id=text_id))
+    try:
+        db.commit()
+    except IntegrityError:
+        # A concurrent upload of the same file under the same name recorded it first
+        db.rollback()
+
+
+def load_chunks(db, text_id: int) -> list:
+    return (
+        db.query(PDFChunk)
+        .filter(PDFChunk.pdf_text_id == text_id)
+        .order_by(PDFChunk.chunk_index)
+        .all()
+    )
+
+
+def chunk_metadata(chunk) -> dict:
+    return {"chunk": chunk.chunk_index, "page_start": chunk.page_start, "page_end": chunk.page_end}
+
+
+def chunk_to_document(chunk) -> Document:
+    return Document(page_content=chunk.text, metadata=chunk_metadata(chunk))
+
+
+def search_chunks_numpy(db, text_id: int, query_vector, k: int) -> list:
+    """
+    Return the `k` chunks of a document closest to `query_vector` (L2 distance, like FAISS).
+    Only the embeddings are read to rank; text is fetched for the top `k` chunks only.
+    """
+    return search_chunks_numpy_batch(db, text_id, [query_vector], k)[0]
+
+
+def search_chunks_numpy_batch(db, text_id: int, query_vectors: list, k: int) -> list:
+    """
+    Return the `k` closest chunks for each of several query vectors, ranking all of them
+    with one matrix product over the document's embeddings.
+    """
+    rows = db.query(PDFChunk.id, PDFChunk.embedding).filter(PDFChunk.pdf_text_id == text_id).all()
+    if not rows:
+        return [[] for _ in query_vectors]
+
+    matrix = np.vstack([decode_vector(embedding) for _, embedding in rows])
+    queries = np.asarray(query_vectors, dtype=np.float32)
+    # |m - q|^2 = |m|^2 - 2 m.q + |q|^2, without materializing every difference
+    distances = (matrix ** 2).sum(axis=1)[None, :] - 2 * queries @ matrix.T + (queries ** 2).sum(axis=1)[:, None]
+
+    k = min(k, len(rows))
+    top = np.argpartition(distances, k - 1, axis=1)[:, :k]
+    ranked = [row[np.argsort(query_distances[row])] for row, query_distances in zip(top, distances)]
+    ids = [[rows[i][0] for i in row] for row in ranked]
+
+    wanted = {chunk_id for row in ids for chunk_id in row}
+    chunks = {chunk.id: chunk for chunk in db.query(PDFChunk).filter(PDFChunk.id.in_(wanted))}
+    return [[chunk_to_document(chunks[chunk_id]) for chunk_id in row] for row in ids]
+
+
+def search_chunks_numpy_multi(db, text_ids: list, query_vector, k: int) -> list:
+    """
+    Return the `k` chunks closest to `query_vector` across several documents, as one
+    filtered query over their embeddings. Each chunk's metadata names its document (`text_id`).
+    """
+    rows = (
+        db.query(PDFChunk.id, PDFChunk.embedding)
+        .filter(PDFChunk.pdf_text_id.in_(text_ids))
+        .all()
+    )
+    if not rows:
+        return []
+
+    matrix = np.vstack([decode_vector(embedding) for _, embedding in rows])
+    query = np.asarray(query_vector, dtype=np.float32)
+    distances = ((matrix - query) ** 2).sum(axis=1)
+
+    k = min(k, len(rows))
+    top = np.argpartition(distances, k - 1)[:k]
+    top = top[np.argsort(distances[top])]
+    ids = [rows[i][0] for i in top]
+
+    chunks = {chunk.id: chunk for chunk in db.query(PDFChunk).filter(PDFChunk.id.in_(ids))}
+    docs = []
+    for chunk_id in ids:
+        chunk = chunks[chunk_id]
+        docs.append(Document(page_content=chunk.text, metadata=dict(chunk_metadata(chunk), text_id=chunk.pdf_text_id)))
+    return docs
@@ -0,0 +1,40 @@
+import asyncio
+import weakref
+import contextvars
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from services.env import env_int
+
+# Shared helpers that keep blocking work (FAISS, PyMuPDF, synchronous DB/S3 calls) off the event loop
+
+# Size of the thread pool used for blocking work
+BLOCKING_WORKERS = env_int("blocking_workers", 8)
+# Maximum number of questions answered at the same time by one worker
+MAX_CONCURRENT_QUESTIONS = env_int("max_concurrent_questions", 16)
+
+blocking_executor = ThreadPoolExecutor(max_workers=BLOCKING_WORKERS, thread_name_prefix="blocking")
+
+# One semaphore per event loop (i.e. per uvicorn worker)
+_question_slots = weakref.WeakKeyDictionary()
+
+
+async def run_blocking(func, *args, **kwargs):
+    """
+    Run a blocking function in the bounded thread pool and await its result.
+    The caller's context variables (e.g. the request trace) are visible to the function.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(blocking_executor, partial(context.run, func, *args, **kwargs))
+
+
+def question_slots() -> asyncio.Semaphore:
+    """
+    Return the semaphore limiting concurrent questions on the current event loop.
+    """
+    loop = asyncio.get_running_loop()
+    slots = _question_slots.get(loop)
+    if slots is None:
+        slots = asyncio.Semaphore(MAX_CONCURRENT_QUESTIONS)
+        _question_slots[loop] = slots
+    return slots
@@ -0,0 +1,112 @@
+import re
+import math
+from langchain_core.documents import Document
+from services.env import env_int
+
+# Assembly of the context sent to the model: retrieved chunks are deduplicated, re-ranked
+# against the question and packed into a token budget, instead of sending every chunk whole.
+
+# Gemini averages about 4 characters per token on English text; close enough for budgeting
+# without a remote count_tokens call per question
+CHARS_PER_TOKEN = 4
+# Largest estimated number of context tokens sent per question; 0 sends every retrieved chunk
+CONTEXT_TOKEN_BUDGET = env_int("context_token_budget", 3000)
+
+_WORD = re.compile(r"\w+")
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "does", "do", "for", "from", "how", "in", "is", "it",
+    "of", "on", "or", "that", "the", "this", "to", "was", "what", "when", "where", "which", "who", "why", "with",
+}
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def query_terms(text: str) -> set:
+    return {word for word in _WORD.findall(text.lower()) if word not in _STOPWORDS}
+
+
+def _overlap(first: str, second: str, probe: int = 32) -> int:
+    # Length of the longest end of `first` that `second` starts with (the splitter's chunk overlap)
+    head = second[:probe]
+    if not head:
+        return 0
+    position = first.find(head, max(len(first) - len(second), 0))
+    while position != -1:
+        if second.startswith(first[position:]):
+            return len(first) - position
+        position = first.find(head, position + 1)
+    return 0
+
+
+def dedupe_spans(docs: list) -> list:
+    """
+    Drop repeated chunks and trim the text a chunk shares with a neighbouring chunk of the
+    same document that is already kept, so overlapping spans are sent once.
+    """
+    kept = {}  # (text_id, chunk) -> original text of kept chunks
+    seen = set()
+    spans = []
+    for doc in docs:
+        text = doc.page_content
+        if text in seen:
+            continue
+        seen.add(text)
+
+        text_id, chunk = doc.metadata.get("text_id"), doc.metadata.get("chunk")
+        if chunk is not None:
+            previous = kept.get((text_id, chunk - 1))
+            following = kept.get((text_id, chunk + 1))
+            kept[(text_id, chunk)] = text
+            if previous is not None:
+                text = text[_overlap(previous, text):]
+            if following is not None:
+                text = text[:len(text) - _overlap(text, following)]
+        if text.strip():
+            spans.append(Document(page_content=text, metadata=doc.metadata))
+    return spans
+
+
+def rerank(question: str, docs: list) -> list:
+    """
+    Order spans by their retrieval rank blended with the share of question terms they contain,
+    which favours spans naming the identifiers and names the question asks about.
+    """
+    terms = query_terms(question)
+    count = len(docs)
+
+    def score(item):
+        rank, doc = item
+        coverage = len(terms & query_terms(doc.page_content)) / len(terms) if terms else 0.0
+        return 0.5 * (1 - rank / count) + 0.5 * coverage
+
+    return [doc for _, doc in sorted(enumerate(docs), key=score, reverse=True)]
+
+
+def pack_context(question: str, docs: list, token_budget: int = None):
+    """
+    Return (spans, stats): the best deduplicated spans that fit in `token_budget` estimated
+    tokens, most relevant first, with stats on what was sent.
+    """
+    token_budget = CONTEXT_TOKEN_BUDGET if token_budget is None else token_budget
+    spans = dedupe_spans(docs)
+    ranked = rerank(question, spans)
+
+    packed = []
+    tokens = 0
+    for doc in ranked:
+        doc_tokens = estimate_tokens(doc.page_content)
+        if token_budget and tokens + doc_tokens > token_budget:
+            if not packed:
+                # Never send an empty context: cut the best span to the budget
+                doc = Document(page_content=doc.page_content[:token_budget * CHARS_PER_TOKEN], metadata=doc.metadata)
+                packed.append(doc)
+                tokens = estimate_tokens(doc.page_content)
+            # A smaller span further down may still fit
+            continue
+        packed.append(doc)
+        tokens += doc_tokens
+
+    stats = {"candidates": len(docs), "spans": len(spans), "packed": len(packed), "context_tokens": tokens}
+    return packed, stats
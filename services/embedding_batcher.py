@@ -0,0 +1,125 @@
+import time
+import asyncio
+import logging
+import weakref
+import contextvars
+
+logger = logging.getLogger("pdf_chat_bot")
+
+# Coalescing of concurrent question embeddings: questions arriving within a few milliseconds
+# of each other on one worker are embedded in one request instead of one request each.
+
+
+class _LoopState:
+    # Batching state of one event loop (one uvicorn worker)
+    def __init__(self):
+        self.futures = {}  # text -> future, for every text queued or being embedded
+        self.queued = {}  # text -> time it was queued, for the next batch
+        self.timer = None
+        self.tasks = set()
+
+
+class EmbeddingBatcher:
+    """
+    Collects texts embedded concurrently on an event loop for up to `max_latency_ms`, or
+    until `max_batch` distinct texts, and embeds them with one `embed_batch(texts)` call.
+    A text already queued or being embedded is not sent again: its callers share the result.
+    """
+
+    def __init__(self, embed_batch, max_batch: int = 32, max_latency_ms: float = 5):
+        self.embed_batch = embed_batch
+        self.max_batch = max(1, max_batch)
+        self.max_latency = max_latency_ms / 1000
+        self._states = weakref.WeakKeyDictionary()
+        self.requests = 0
+        self.deduplicated = 0
+        self.batches = 0
+        self.batched_texts = 0
+        self.max_batch_size = 0
+        self.queued_seconds = 0.0
+        self.max_queued_seconds = 0.0
+
+    def _state(self, loop) -> _LoopState:
+        state = self._states.get(loop)
+        if state is None:
+            state = _LoopState()
+            self._states[loop] = state
+        return state
+
+    async def embed(self, text: str) -> list:
+        loop = asyncio.get_running_loop()
+        state = self._state(loop)
+        self.requests += 1
+
+        future = state.futures.get(text)
+        if future is not None:
+            self.deduplicated += 1
+        else:
+            future = loop.create_future()
+            # Mark a failure as retrieved even if every caller has gone away
+            future.add_done_callback(lambda done: done.cancelled() or done.exception())
+            state.futures[text] = future
+            state.queued[text] = time.perf_counter()
+            if len(state.queued) >= self.max_batch:
+                self._flush(loop, state)
+            elif state.timer is None:
+                state.timer = loop.call_later(self.max_latency, self._flush, loop, state)
+        # A caller that is cancelled (client disconnected) does not cancel the others
+        return await asyncio.shield(future)
+
+    def _flush(self, loop, state: _LoopState):
+        if state.timer is not None:
+            state.timer.cancel()
+            state.timer = None
+        if not state.queued:
+            return
+        queued, state.queued = state.queued, {}
+        # In an empty context: the batch is shared, so its stages belong to no one request's trace
+        # (each caller times its own wait), whichever caller's embed() or timer started it
+        task = loop.create_task(self._run(state, queued), context=contextvars.Context())
+        state.tasks.add(task)
+        task.add_done_callback(state.tasks.discard)
+
+    async def _run(self, state: _LoopState, queued: dict):
+        texts = list(queued)
+        started = time.perf_counter()
+        waits = [started - queued_at for queued_at in queued.values()]
+        self.batches += 1
+        self.batched_texts += len(texts)
+        self.max_batch_size = max(self.max_batch_size, len(texts))
+        self.queued_seconds += sum(waits)
+        self.max_queued_seconds = max(self.max_queued_seconds, max(waits))
+        error = None
+        try:
+            vectors = await self.embed_batch(texts)
+            if len(vectors) != len(texts):
+                raise ValueError(f"Embedding model returned {len(vectors)} vectors for {len(texts)} texts")
+            for text, vector in zip(texts, vectors):
+                future = state.futures.pop(text)
+                if not future.done():
+                    future.set_result(vector)
+        except Exception as e:
+            error = e
+            logger.error(f"Embedding batch of {len(texts)} questions failed: {e}")
+        finally:
+            # Fail every caller not answered yet, also when the batch is cancelled, so none waits
+            # forever; later calls with the same texts start a new batch
+            for text in texts:
+                future = state.futures.pop(text, None)
+                if future is None or future.done():
+                    continue
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "deduplicated": self.deduplicated,
+            "batches": self.batches,
+            "average_batch_size": self.batched_texts / self.batches if self.batches else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "average_queued_ms": 1000 * self.queued_seconds / self.batched_texts if self.batched_texts else 0.0,
+            "max_queued_ms": 1000 * self.max_queued_seconds,
+        }
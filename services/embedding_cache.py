@@ -0,0 +1,195 @@
+import sqlite3
+import hashlib
+import threading
+import logging
+from array import array
+from langchain_core.embeddings import Embeddings
+from services.env import env_int, env_str
+
+logger = logging.getLogger("pdf_chat_bot")
+
+# Content-addressed cache of chunk embeddings.
+# A chunk is keyed by hash(model name + chunk text), so re-uploads and lightly edited
+# revisions of a PDF only send their new chunks to the embedding API.
+
+
+def _encode(vector) -> bytes:
+    return array("f", vector).tobytes()
+
+
+def _decode(data: bytes) -> list:
+    vector = array("f")
+    vector.frombytes(data)
+    return vector.tolist()
+
+
+class EmbeddingStore:
+    """
+    Base class for embedding cache backends.
+    """
+
+    def mget(self, keys: list) -> list:
+        raise NotImplementedError
+
+    def mset(self, items: dict):
+        raise NotImplementedError
+
+
+class NullEmbeddingStore(EmbeddingStore):
+    """
+    Disables caching while keeping hit/miss accounting.
+    """
+
+    def mget(self, keys: list) -> list:
+        return [None] * len(keys)
+
+    def mset(self, items: dict):
+        pass
+
+
+class SQLiteEmbeddingStore(EmbeddingStore):
+    """
+    Stores embeddings as float32 blobs in a local SQLite file, opened on first use.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = None
+
+    def _connect(self):
+        # Called with the lock held
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+            )
+            self._connection.commit()
+        return self._connection
+
+    def mget(self, keys: list) -> list:
+        if not keys:
+            return []
+        found = {}
+        with self._lock:
+            connection = self._connect()
+            # Stay below SQLite's limit on bound parameters
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = connection.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                )
+                found.update((key, _decode(vector)) for key, vector in rows)
+        return [found.get(key) for key in keys]
+
+    def mset(self, items: dict):
+        with self._lock:
+            connection = self._connect()
+            connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(key, _encode(vector)) for key, vector in items.items()],
+            )
+            connection.commit()
+
+
+class RedisEmbeddingStore(EmbeddingStore):
+    """
+    Stores embeddings as float32 blobs in Redis, shared by all workers.
+    `get_client` returns a binary-safe synchronous client (see db.redis_setup.get_sync_redis).
+    """
+
+    def __init__(self, get_client, prefix: str = "emb:", ttl: int = None):
+        self.get_client = get_client
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def mget(self, keys: list) -> list:
+        if not keys:
+            return []
+        values = self.get_client().mget([self.prefix + key for key in keys])
+        return [_decode(value) if value is not None else None for value in values]
+
+    def mset(self, items: dict):
+        pipeline = self.get_client().pipeline(transaction=False)
+        for key, vector in items.items():
+            pipeline.set(self.prefix + key, _encode(vector), ex=self.ttl)
+        pipeline.execute()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps an embeddings client so that document embeddings are looked up in a store first
+    and only cache misses are sent to the underlying model. Queries are not cached.
+    `query_batch_kwargs` are the arguments that make the model's embed_documents embed
+    queries (e.g. the query task type); None if it cannot, and queries are embedded one by one.
+    """
+
+    def __init__(self, embeddings, store: EmbeddingStore, model_name: str, query_batch_kwargs: dict = None):
+        self.embeddings = embeddings
+        self.store = store
+        self.model_name = model_name
+        self.query_batch_kwargs = query_batch_kwargs
+
+    def cache_key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    def embed_documents_with_stats(self, texts: list):
+        """
+        Embed `texts` and return (vectors, hits, misses).
+        Identical texts within one call are embedded once, so `misses` counts the texts
+        sent to the model and every other text (cached, or a repeat) is a hit.
+        """
+        keys = [self.cache_key(text) for text in texts]
+        try:
+            cached = self.store.mget(keys)
+        except Exception as e:
+            # The cache is an optimization; fall back to embedding everything
+            logger.warning(f"Embedding cache lookup failed: {e}")
+            cached = [None] * len(keys)
+
+        missing = {}
+        for key, text, vector in zip(keys, texts, cached):
+            if vector is None:
+                missing.setdefault(key, text)
+
+        if missing:
+            new_vectors = dict(zip(missing, self.embeddings.embed_documents(list(missing.values()))))
+            try:
+                self.store.mset(new_vectors)
+            except Exception as e:
+                logger.warning(f"Embedding cache write failed: {e}")
+        else:
+            new_vectors = {}
+
+        vectors = [vector if vector is not None else new_vectors[key] for key, vector in zip(keys, cached)]
+        return vectors, len(texts) - len(missing), len(missing)
+
+    def embed_documents(self, texts: list) -> list:
+        return self.embed_documents_with_stats(texts)[0]
+
+    def embed_query(self, text: str) -> list:
+        return self.embeddings.embed_query(text)
+
+    async def aembed_query(self, text: str) -> list:
+        return await self.embeddings.aembed_query(text)
+
+    def embed_queries(self, texts: list) -> list:
+        # Several queries in one request where the model allows it
+        if self.query_batch_kwargs is None:
+            return [self.embeddings.embed_query(text) for text in texts]
+        return self.embeddings.embed_documents(texts, **self.query_batch_kwargs)
+
+
+def create_embedding_store(name: str):
+    """
+    Create the cache backend named by `embedding_cache_backend`: "sqlite" (default), "redis" or "none".
+    """
+    if name == "none":
+        return NullEmbeddingStore()
+    if name == "sqlite":
+        return SQLiteEmbeddingStore(env_str("embedding_cache_path", "embedding_cache.sqlite3"))
+    if name == "redis":
+        from db.redis_setup import get_sync_redis
+        return RedisEmbeddingStore(get_sync_redis, ttl=env_int("embedding_cache_ttl"))
+    raise ValueError(f"Unknown embedding cache backend '{name}'. Available: sqlite, redis, none")
@@ -0,0 +1,244 @@
+import os
+import re
+import math
+import time
+import queue
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import namedtuple
+from concurrent.futures import Future
+from langchain_core.embeddings import Embeddings
+from services.env import env_float, env_int, env_str
+
+logger = logging.getLogger("pdf_chat_bot")
+
+# Embedding providers: the Google embedding API, or a model running on this machine's CPU.
+# A provider is the embeddings client plus what the rest of the pipeline needs to know about it:
+# the model name (part of embedding cache keys) and the arguments that make embed_documents
+# embed queries (see CachedEmbeddings). Vectors of different providers are not comparable, so
+# switching provider means re-indexing: the chunk embeddings stored at ingestion belong to one model.
+
+EmbeddingProvider = namedtuple("EmbeddingProvider", ["embeddings", "model_name", "query_batch_kwargs"])
+
+# Largest number of texts encoded in one forward pass, and how long the first text of a
+# batch waits for others to join it
+EMBEDDING_BATCH_SIZE = env_int("embedding_batch_size", 32)
+EMBEDDING_BATCH_WAIT_MS = env_float("embedding_batch_wait_ms", 5)
+
+_WORD = re.compile(r"\w+")
+
+
+class HashingEncoder:
+    """
+    Deterministic bag-of-words encoder with no model: each word is hashed to a dimension and a
+    sign, and vectors are L2-normalized. Only texts sharing words are similar, which is enough
+    for tests and offline benchmarks of the pipeline.
+    """
+
+    def __init__(self, dimensions: int = 512):
+        self.dimensions = dimensions
+
+    def encode(self, texts: list) -> list:
+        vectors = []
+        for text in texts:
+            vector = [0.0] * self.dimensions
+            for word in _WORD.findall(text.lower()):
+                digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+                bucket = int.from_bytes(digest, "little")
+                vector[bucket % self.dimensions] += 1.0 if bucket >> 63 else -1.0
+            norm = math.sqrt(sum(value * value for value in vector))
+            vectors.append([value / norm for value in vector] if norm else vector)
+        return vectors
+
+
+class SentenceTransformerEncoder:
+    """
+    Sentence-transformers model on the CPU, optionally through ONNX Runtime (`runtime="onnx"`).
+    Requires `pip install sentence-transformers` (plus `optimum[onnxruntime]` for ONNX).
+    """
+
+    def __init__(self, model_name: str, runtime: str = "torch", batch_size: int = 32):
+        # Imported here so the other providers do not require sentence-transformers
+        from sentence_transformers import SentenceTransformer
+        kwargs = {"backend": runtime} if runtime != "torch" else {}
+        self.model = SentenceTransformer(model_name, device="cpu", **kwargs)
+        self.batch_size = batch_size
+
+    def encode(self, texts: list) -> list:
+        return self.model.encode(
+            texts, batch_size=self.batch_size, normalize_embeddings=True, convert_to_numpy=True
+        ).tolist()
+
+
+class MicroBatchingEmbeddings(Embeddings):
+    """
+    Embeddings computed by a local encoder on one inference thread. Texts submitted at the
+    same time by different callers (WebSocket questions, ingestion jobs) are collected for up
+    to `max_wait_ms`, or until `max_batch` texts, and encoded in one forward pass, which costs
+    far less CPU than one pass per text. The wait only applies under load (the previous batch
+    had more than one text), so a lone caller is not delayed. Large document batches are split
+    into `max_batch` pieces so queries are not stuck behind a whole document.
+    """
+
+    def __init__(self, encoder, max_batch: int = 32, max_wait_ms: float = 5):
+        self.encoder = encoder
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait_ms / 1000
+        self.batches = 0
+        self.texts = 0
+        self._last_batch_size = 0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _submit(self, texts: list) -> Future:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="embedding-inference", daemon=True)
+                self._thread.start()
+        future = Future()
+        self._queue.put((texts, future))
+        return future
+
+    def _collect(self) -> list:
+        items = [self._queue.get()]
+        size = len(items[0][0])
+        deadline = time.monotonic() + (self.max_wait if self._last_batch_size > 1 else 0)
+        while size < self.max_batch:
+            # Texts already queued always join; new ones are waited for until the deadline
+            timeout = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            items.append(item)
+            size += len(item[0])
+        return items
+
+    def _run(self):
+        while True:
+            items = self._collect()
+            texts = [text for item_texts, _ in items for text in item_texts]
+            self._last_batch_size = len(texts)
+            try:
+                vectors = self.encoder.encode(texts)
+            except Exception as e:
+                logger.error(f"Embedding batch of {len(texts)} texts failed: {e}")
+                for _, future in items:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.texts += len(texts)
+            offset = 0
+            for item_texts, future in items:
+                future.set_result(vectors[offset:offset + len(item_texts)])
+                offset += len(item_texts)
+
+    def embed_documents(self, texts: list, **kwargs) -> list:
+        # Local models embed queries and documents alike, so kwargs such as a task type are ignored
+        futures = [
+            self._submit(texts[start:start + self.max_batch]) for start in range(0, len(texts), self.max_batch)
+        ]
+        return [vector for future in futures for vector in future.result()]
+
+    def embed_query(self, text: str) -> list:
+        return self._submit([text]).result()[0]
+
+    async def aembed_query(self, text: str) -> list:
+        # Awaits the inference thread directly, without holding a thread of the blocking pool
+        return (await asyncio.wrap_future(self._submit([text])))[0]
+
+    async def aembed_documents(self, texts: list) -> list:
+        futures = [
+            self._submit(texts[start:start + self.max_batch]) for start in range(0, len(texts), self.max_batch)
+        ]
+        return [vector for part in await asyncio.gather(*map(asyncio.wrap_future, futures)) for vector in part]
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "texts": self.texts,
+            "average_batch_size": self.texts / self.batches if self.batches else 0.0,
+        }
+
+
+class LazyEmbeddings(Embeddings):
+    """
+    Builds the embeddings client with `build()` on first use, or on `warm()` during startup,
+    so configuring a provider reads no credentials, loads no model and makes no network call.
+    """
+
+    def __init__(self, build):
+        self._build = build
+        self._embeddings = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self._embeddings is None:
+            with self._lock:
+                if self._embeddings is None:
+                    self._embeddings = self._build()
+        return self._embeddings
+
+    def warm(self):
+        self.get()
+
+    def stats(self) -> dict:
+        # Batching stats of the local providers; {} before the client is built or for the Google API
+        embeddings = self._embeddings
+        return embeddings.stats() if hasattr(embeddings, "stats") else {}
+
+    def embed_documents(self, texts: list, **kwargs) -> list:
+        return self.get().embed_documents(texts, **kwargs)
+
+    def embed_query(self, text: str) -> list:
+        return self.get().embed_query(text)
+
+    async def aembed_query(self, text: str) -> list:
+        return await self.get().aembed_query(text)
+
+    async def aembed_documents(self, texts: list) -> list:
+        return await self.get().aembed_documents(texts)
+
+
+def _google_embeddings(model: str):
+    # Imported here so the local providers do not require the Google SDK or credentials
+    from google.oauth2.service_account import Credentials
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+    credentials = Credentials.from_service_account_file(os.getenv("GOOGLE_APPLICATION_CREDENTIALS"))
+    return GoogleGenerativeAIEmbeddings(credentials=credentials, model=model)
+
+
+def create_embeddings(name: str) -> EmbeddingProvider:
+    """
+    Create the provider named by `embedding_provider`: "google" (default), "local"
+    (sentence-transformers model on the CPU) or "hashing" (deterministic, no model or network).
+    The client itself is built on first use (see LazyEmbeddings).
+    """
+    if name == "google":
+        model = "models/embedding-001"
+        return EmbeddingProvider(
+            LazyEmbeddings(lambda: _google_embeddings(model)), model, {"task_type": "retrieval_query"}
+        )
+    if name == "local":
+        model = env_str("local_embedding_model", "sentence-transformers/all-MiniLM-L6-v2")
+        runtime = env_str("local_embedding_runtime", "torch")
+        return EmbeddingProvider(
+            LazyEmbeddings(lambda: MicroBatchingEmbeddings(
+                SentenceTransformerEncoder(model, runtime, EMBEDDING_BATCH_SIZE), EMBEDDING_BATCH_SIZE, EMBEDDING_BATCH_WAIT_MS,
+            )),
+            f"local:{model}",
+            {},
+        )
+    if name == "hashing":
+        dimensions = env_int("hashing_embedding_dimensions", 512)
+        return EmbeddingProvider(
+            LazyEmbeddings(lambda: MicroBatchingEmbeddings(
+                HashingEncoder(dimensions), EMBEDDING_BATCH_SIZE, EMBEDDING_BATCH_WAIT_MS,
+            )),
+            f"hashing:{dimensions}",
+            {},
+        )
+    raise ValueError(f"Unknown embedding provider '{name}'. Available: google, local, hashing")
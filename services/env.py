@@ -0,0 +1,27 @@
+import os
+
+# Optional settings read from the environment (or .env). A key left blank, as in sample.env,
+# counts as unset: python-dotenv loads it as "", which int() and float() would reject.
+
+
+def env_str(name: str, default: str = None):
+    value = os.getenv(name)
+    if value is None or not value.strip():
+        return default
+    return value.strip()
+
+
+def env_int(name: str, default: int = None):
+    value = env_str(name)
+    return int(value) if value is not None else default
+
+
+def env_float(name: str, default: float = None):
+    value = env_str(name)
+    return float(value) if value is not None else default
+
+
+def env_bool(name: str, default: bool = False) -> bool:
+    # 1/0, like the other switches of .env
+    value = env_str(name)
+    return bool(int(value)) if value is not None else default
@@ -0,0 +1,301 @@
+import json
+import time
+import uuid
+import asyncio
+import logging
+from services.env import env_int
+
+logger = logging.getLogger("pdf_chat_bot")
+
+# Background job queue with status tracking, used for PDF ingestion.
+# Jobs are plain dicts so they can be stored as JSON in Redis:
+#   {"id", "status": queued|running|completed|failed, "stage", "progress", "attempts", "error", ...}
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+
+# Seconds a worker process's heartbeat is kept; once it has expired, the jobs the process
+# had taken are put back in the queue by the other processes (see RedisJobQueue.recover)
+CONSUMER_TTL = 30
+HEARTBEAT_INTERVAL = CONSUMER_TTL / 3
+
+
+def new_job(**fields) -> dict:
+    job = {
+        "id": uuid.uuid4().hex,
+        "status": QUEUED,
+        "stage": None,
+        "progress": 0.0,
+        "attempts": 0,
+        "error": None,
+        "created_at": time.time(),
+    }
+    job.update(fields)
+    return job
+
+
+class InMemoryJobQueue:
+    """
+    Job queue local to one process. Used in tests and single-worker deployments.
+    """
+
+    def __init__(self):
+        self._jobs = {}
+        self._queue = None
+
+    def _pending(self) -> asyncio.Queue:
+        # Created lazily so the queue binds to the running event loop
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        return self._queue
+
+    async def create(self, job: dict, enqueue: bool = True) -> dict:
+        self._jobs[job["id"]] = dict(job)
+        if enqueue:
+            await self.enqueue(job["id"])
+        return job
+
+    async def enqueue(self, job_id: str):
+        await self._pending().put(job_id)
+
+    async def dequeue(self, timeout: float):
+        try:
+            return await asyncio.wait_for(self._pending().get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def get(self, job_id: str):
+        job = self._jobs.get(job_id)
+        return dict(job) if job is not None else None
+
+    async def update(self, job_id: str, **fields) -> dict:
+        self._jobs[job_id].update(fields)
+        return dict(self._jobs[job_id])
+
+    # Jobs of an in-process queue end with the process: nothing to acknowledge or recover
+    async def ack(self, job_id: str):
+        pass
+
+    async def heartbeat(self):
+        pass
+
+    async def release(self):
+        pass
+
+    async def recover(self) -> int:
+        return 0
+
+
+class RedisJobQueue:
+    """
+    Job queue shared by all workers through Redis: a list of pending job ids
+    and one JSON record per job, kept for `ttl` seconds.
+
+    A dequeued job id moves atomically to the processing list of this process and stays
+    there until acknowledged, so a job is never lost with the process running it: while
+    the process lives it refreshes a heartbeat, and once the heartbeat has expired any
+    other process (or its successor) moves its unacknowledged jobs back to the queue.
+    """
+
+    def __init__(self, redis, prefix: str = "ingestion", ttl: int = 24 * 3600):
+        self.redis = redis
+        self.queue_key = f"{prefix}:queue"
+        self.job_prefix = f"{prefix}:job:"
+        self.ttl = ttl
+        self.consumer_id = uuid.uuid4().hex
+        self.processing_prefix = f"{prefix}:processing:"
+        self.processing_key = self.processing_prefix + self.consumer_id
+        self.heartbeat_prefix = f"{prefix}:consumer:"
+
+    async def create(self, job: dict, enqueue: bool = True) -> dict:
+        await self.redis.set(self.job_prefix + job["id"], json.dumps(job), ex=self.ttl)
+        if enqueue:
+            await self.enqueue(job["id"])
+        return job
+
+    async def enqueue(self, job_id: str):
+        await self.redis.lpush(self.queue_key, job_id)
+
+    async def dequeue(self, timeout: float):
+        return await self.redis.blmove(self.queue_key, self.processing_key, max(1, int(timeout)), "RIGHT", "LEFT")
+
+    async def get(self, job_id: str):
+        data = await self.redis.get(self.job_prefix + job_id)
+        return json.loads(data) if data else None
+
+    async def update(self, job_id: str, **fields) -> dict:
+        job = await self.get(job_id) or {"id": job_id}
+        job.update(fields)
+        await self.redis.set(self.job_prefix + job_id, json.dumps(job), ex=self.ttl)
+        return job
+
+    async def ack(self, job_id: str):
+        # The job is done with (completed, failed or requeued for a retry)
+        await self.redis.lrem(self.processing_key, 1, job_id)
+
+    async def heartbeat(self):
+        await self.redis.set(self.heartbeat_prefix + self.consumer_id, 1, ex=CONSUMER_TTL)
+
+    async def release(self):
+        # On shutdown: jobs interrupted by the stop are recovered without waiting for the heartbeat to expire
+        await self.redis.delete(self.heartbeat_prefix + self.consumer_id)
+
+    async def recover(self) -> int:
+        """
+        Move the unacknowledged jobs of processes without a heartbeat back to the queue, next in line.
+        """
+        recovered = 0
+        async for key in self.redis.scan_iter(match=self.processing_prefix + "*"):
+            consumer_id = key[len(self.processing_prefix):]
+            if consumer_id == self.consumer_id or await self.redis.exists(self.heartbeat_prefix + consumer_id):
+                continue
+            while await self.redis.lmove(key, self.queue_key, "RIGHT", "RIGHT") is not None:
+                recovered += 1
+        if recovered:
+            logger.warning(f"Requeued {recovered} ingestion jobs left by stopped workers")
+        return recovered
+
+
+class WorkerPool:
+    """
+    Runs `handler(job, report)` for queued jobs with at most `concurrency` jobs at once.
+    `report(stage, progress)` records progress on the job. Failed jobs are retried
+    up to `max_attempts` times with a linear backoff of `retry_delay` seconds;
+    `on_failure(job)` is called once a job has failed for good; so is a job whose
+    every attempt was interrupted by its process stopping. A worker that cannot
+    reach the queue logs the error and tries again, waiting up to `max_error_delay` seconds.
+    """
+
+    def __init__(self, queue, handler, concurrency: int = 2, max_attempts: int = 3, retry_delay: float = 1.0,
+                 on_failure=None, max_error_delay: float = 30.0):
+        self.queue = queue
+        self.handler = handler
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.on_failure = on_failure
+        self.max_error_delay = max_error_delay
+        self._tasks = []
+        # Pending retries; kept referenced so they are not garbage-collected, and cancelled by stop()
+        self._retry_tasks = set()
+        self._stopping = False
+        self._workers_started = False
+
+    def start(self):
+        # The workers are started by _maintain once the first heartbeat is recorded
+        self._stopping = False
+        self._workers_started = False
+        self._tasks = [asyncio.create_task(self._maintain())]
+
+    def _start_workers(self):
+        self._tasks += [asyncio.create_task(self._run()) for _ in range(self.concurrency)]
+        self._workers_started = True
+        logger.info(f"Started {self.concurrency} ingestion workers")
+
+    async def stop(self):
+        self._stopping = True
+        tasks = self._tasks + list(self._retry_tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+        self._retry_tasks.clear()
+        try:
+            await self.queue.release()
+        except Exception:
+            logger.exception("Could not release the ingestion queue")
+
+    async def _maintain(self):
+        # Heartbeat of this process, and recovery of the jobs of processes that died.
+        # Nothing is dequeued before the first heartbeat: until it exists, another process's
+        # recover() would take this one for dead and requeue the jobs it had just dequeued.
+        while not self._stopping:
+            try:
+                await self.queue.heartbeat()
+                if not self._workers_started:
+                    self._start_workers()
+                await self.queue.recover()
+            except Exception:
+                logger.exception("Ingestion queue heartbeat failed")
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+
+    async def _run(self):
+        # An error (e.g. Redis unreachable) must not end the worker: ingestion would stop for good
+        errors = 0
+        while not self._stopping:
+            try:
+                await self._run_once()
+                errors = 0
+            except Exception:
+                errors += 1
+                delay = min(2 ** (errors - 1), self.max_error_delay)
+                logger.exception(f"Ingestion worker error, retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def _run_once(self):
+        job_id = await self.queue.dequeue(timeout=1)
+        if job_id is None:
+            return
+        job = await self.queue.get(job_id)
+        if job is None:
+            logger.warning(f"Dropping unknown job {job_id}")
+            await self.queue.ack(job_id)
+            return
+        await self.process(job)
+
+    async def process(self, job: dict):
+        job_id = job["id"]
+        attempts = job["attempts"] + 1
+
+        async def report(stage: str, progress: float, **fields):
+            await self.queue.update(job_id, stage=stage, progress=progress, **fields)
+
+        if attempts > self.max_attempts:
+            # Recovered job whose attempts all stopped with their process (e.g. a PDF that crashes the worker)
+            await self._fail(job_id, attempts - 1, "Worker stopped while processing the job")
+            return
+
+        try:
+            await self.queue.update(job_id, status=RUNNING, attempts=attempts, error=None)
+            await self.handler(await self.queue.get(job_id), report)
+        except Exception as e:
+            if attempts < self.max_attempts:
+                logger.warning(f"Job {job_id} failed (attempt {attempts}), retrying: {e}")
+                await self.queue.update(job_id, status=QUEUED, error=str(e))
+                task = asyncio.create_task(self._retry_later(job_id, self.retry_delay * attempts))
+                self._retry_tasks.add(task)
+                task.add_done_callback(self._retry_tasks.discard)
+            else:
+                await self._fail(job_id, attempts, str(e))
+            return
+
+        await self.queue.update(job_id, status=COMPLETED, progress=1.0)
+        await self.queue.ack(job_id)
+
+    async def _fail(self, job_id: str, attempts: int, error: str):
+        logger.error(f"Job {job_id} failed after {attempts} attempts: {error}")
+        job = await self.queue.update(job_id, status=FAILED, error=error)
+        await self.queue.ack(job_id)
+        if self.on_failure is not None:
+            self.on_failure(job)
+
+    async def _retry_later(self, job_id: str, delay: float):
+        # Acknowledged once requeued, so a stop during the delay leaves it for recovery
+        await asyncio.sleep(delay)
+        await self.queue.enqueue(job_id)
+        await self.queue.ack(job_id)
+
+
+def create_job_queue(name: str, redis=None):
+    """
+    Create the queue named by `ingestion_queue_backend`: "redis" (default) or "memory".
+    """
+    if name == "memory":
+        return InMemoryJobQueue()
+    if name == "redis":
+        if redis is None:
+            raise RuntimeError("The redis job queue needs a Redis connection")
+        return RedisJobQueue(redis, ttl=env_int("ingestion_job_ttl", 24 * 3600))
+    raise ValueError(f"Unknown job queue backend '{name}'. Available: redis, memory")
@@ -0,0 +1,153 @@
+import re
+import math
+import heapq
+import pickle
+from collections import Counter, defaultdict
+from langchain_core.documents import Document
+from services.vector_stores import VectorStoreRegistry
+
+# Per-document lexical (BM25) index, stored next to the FAISS index of the document.
+# Dense retrieval misses exact identifiers, clause numbers and names; the lexical ranking
+# catches them, and questions that name such terms can be answered without embedding them.
+
+# Words, keeping identifiers such as "14.2", "INV-2024-001" or "ISO/IEC" in one token
+_TOKEN = re.compile(r"\w+(?:[.\-/]\w+)*")
+_QUOTED = re.compile(r'"([^"]+)"')
+# Constant of reciprocal rank fusion; 60 is the value from the original paper
+RRF_K = 60
+
+
+def tokenize(text: str) -> list:
+    return _TOKEN.findall(text.lower())
+
+
+def is_identifier(token: str) -> bool:
+    # Codes and references rather than words: letters mixed with digits ("INV-2024-001", "C4821"),
+    # numbers joined by punctuation ("14.2", "2020-01-31") or upper-case acronyms joined by punctuation
+    # ("ISO/IEC"). Plain numbers ("2020"), hyphenated words ("long-term") and very short tokens ("7", "Q3")
+    # are too common or ambiguous to look up on their own.
+    if len(token) < 3:
+        return False
+    has_digit = any(c.isdigit() for c in token)
+    has_letter = any(c.isalpha() for c in token)
+    joined = not token.replace("_", "").isalnum()
+    return (has_digit and has_letter) or (joined and (has_digit or token.isupper()))
+
+
+def identifier_terms(text: str) -> set:
+    return {token.lower() for token in _TOKEN.findall(text) if is_identifier(token)}
+
+
+class BM25Index:
+    """
+    Okapi BM25 over the chunks of one document. Holds the chunk text and metadata so
+    results are returned as documents without reading the vector index.
+    """
+
+    def __init__(self, docs: list, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.docs = [(doc.page_content, dict(doc.metadata)) for doc in docs]
+        self.lengths = []
+        postings = defaultdict(dict)  # term -> {chunk position: term frequency}
+        for position, (text, _) in enumerate(self.docs):
+            terms = tokenize(text)
+            self.lengths.append(len(terms))
+            for term, count in Counter(terms).items():
+                postings[term][position] = count
+        self.postings = dict(postings)
+        self.average_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 1.0
+
+    def __len__(self):
+        return len(self.docs)
+
+    def nbytes(self) -> int:
+        # Approximate: chunk text plus ~64 bytes per posting entry
+        return sum(len(text) for text, _ in self.docs) + 64 * sum(len(chunks) for chunks in self.postings.values())
+
+    def _document(self, position: int) -> Document:
+        text, metadata = self.docs[position]
+        return Document(page_content=text, metadata=dict(metadata))
+
+    def _scores(self, terms) -> dict:
+        scores = defaultdict(float)
+        for term in set(terms):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (len(self.docs) - len(postings) + 0.5) / (len(postings) + 0.5))
+            for position, frequency in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[position] / self.average_length)
+                scores[position] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+        return scores
+
+    def search(self, query: str, k: int) -> list:
+        """
+        Return the `k` best chunks for `query` as (document, score) pairs, best first.
+        """
+        top = heapq.nlargest(k, self._scores(tokenize(query)).items(), key=lambda item: item[1])
+        return [(self._document(position), score) for position, score in top]
+
+    def exact_search(self, query: str, k: int) -> list:
+        """
+        Return the chunks containing every identifier and quoted phrase of `query`, best first.
+        Returns an empty list if it names none, or if no chunk or more than half of `k` chunks
+        contain them all: then the lookup is too weak to skip ranking by meaning, and the caller
+        falls back to hybrid retrieval.
+        """
+        identifiers = identifier_terms(query)
+        phrases = [phrase.lower() for phrase in _QUOTED.findall(query) if phrase.strip()]
+        if not identifiers and not phrases:
+            return []
+
+        if identifiers:
+            candidates = None
+            for term in identifiers:
+                chunks = set(self.postings.get(term, ()))
+                candidates = chunks if candidates is None else candidates & chunks
+        else:
+            candidates = set(range(len(self.docs)))
+        candidates = [
+            position for position in candidates
+            if all(phrase in self.docs[position][0].lower() for phrase in phrases)
+        ]
+        if not candidates or len(candidates) > max(1, k // 2):
+            return []
+
+        scores = self._scores(tokenize(query))
+        candidates.sort(key=lambda position: scores.get(position, 0.0), reverse=True)
+        return [self._document(position) for position in candidates]
+
+
+def reciprocal_rank_fusion(rankings: list, k: int) -> list:
+    """
+    Merge several rankings of documents into one, scoring each chunk by the sum of
+    1 / (RRF_K + rank) over the rankings it appears in.
+    """
+    scores = defaultdict(float)
+    docs = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking):
+            key = (doc.metadata.get("text_id"), doc.metadata.get("chunk"), doc.page_content[:64])
+            scores[key] += 1 / (RRF_K + rank + 1)
+            docs.setdefault(key, doc)
+    return [docs[key] for key in heapq.nlargest(k, scores, key=scores.get)]
+
+
+class LexicalIndexRegistry(VectorStoreRegistry):
+    """
+    Loads and saves BM25 indexes by namespace, with the same content hash checks,
+    build locking and optional cache as vector indexes.
+    """
+
+    def __init__(self, backend, cache=None):
+        super().__init__(backend, embeddings=None, cache=cache, mmap=False)
+
+    def _encode(self, namespace: str, content_hash: str, index) -> bytes:
+        return pickle.dumps(index)
+
+    def _decode(self, data: bytes):
+        return pickle.loads(data)
+
+    def _delete_blobs(self, data: bytes):
+        pass
@@ -0,0 +1,145 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from langchain.chains.question_answering import load_qa_chain
+from langchain.prompts import PromptTemplate
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from services.env import env_float
+
+logger = logging.getLogger("pdf_chat_bot")
+
+# Chat model clients and QA chains, built once per process and per (model, temperature)
+# instead of once per question. A client keeps its connection to the model API, so
+# questions after the first reuse it. Built during startup (warm) or on first use.
+
+
+class EchoChatModel(BaseChatModel):
+    """
+    Local stand-in for the chat model: answers with the first line of the prompt's context,
+    after `delay` seconds. Selected with `llm_provider=fake`, for tests and offline benchmarks.
+    """
+
+    delay: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "echo"
+
+    def _answer(self, messages) -> str:
+        prompt = messages[-1].content
+        context = prompt.split("Context:", 1)[-1].strip()
+        return context.splitlines()[0] if context else ""
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        time.sleep(self.delay)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self._answer(messages)))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        await asyncio.sleep(self.delay)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self._answer(messages)))])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.delay)
+        for position, word in enumerate(self._answer(messages).split(" ")):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word if position == 0 else " " + word))
+
+
+def _google_chat_model(model: str, temperature: float):
+    # Imported here so the fake provider does not require the Google SDK or an API key
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    return ChatGoogleGenerativeAI(model=model, temperature=temperature, google_api_key=os.getenv("google_api_key"))
+
+
+def _fake_chat_model(model: str, temperature: float):
+    return EchoChatModel(delay=env_float("fake_llm_delay", 0))
+
+
+# Available providers, selected with the `llm_provider` environment variable
+PROVIDERS = {
+    "google": _google_chat_model,
+    "fake": _fake_chat_model,
+}
+
+
+class LLMClients:
+    """
+    Builds chat models and QA chains on first use and keeps them, keyed by (model, temperature).
+    Records how long construction and model calls take.
+    """
+
+    def __init__(self, provider: str, model: str, temperature: float, prompt_template: str = None):
+        if provider not in PROVIDERS:
+            raise ValueError(f"Unknown LLM provider '{provider}'. Available: {sorted(PROVIDERS)}")
+        self.provider = provider
+        self.model = model
+        self.temperature = temperature
+        self.prompt_template = prompt_template
+        self._models = {}
+        self._chains = {}
+        self._prompt = None
+        # Reentrant: building a chain builds its chat model under the same lock
+        self._lock = threading.RLock()
+        self.constructions = 0
+        self.construction_seconds = 0.0
+        self.calls = 0
+        self.call_seconds = 0.0
+        self.max_call_seconds = 0.0
+
+    def _key(self, model: str = None, temperature: float = None):
+        return (model or self.model, self.temperature if temperature is None else temperature)
+
+    def _build(self, cache: dict, key, build):
+        # Checked again under the lock so concurrent first questions build once
+        value = cache.get(key)
+        if value is not None:
+            return value
+        with self._lock:
+            value = cache.get(key)
+            if value is None:
+                start = time.perf_counter()
+                value = build()
+                elapsed = time.perf_counter() - start
+                self.constructions += 1
+                self.construction_seconds += elapsed
+                logger.info(f"Built {type(value).__name__} for {key[0]} (temperature {key[1]}) in {elapsed * 1000:.1f} ms")
+                cache[key] = value
+        return value
+
+    def prompt(self) -> PromptTemplate:
+        if self._prompt is None:
+            self._prompt = PromptTemplate(template=self.prompt_template, input_variables=["context", "question"])
+        return self._prompt
+
+    def chat_model(self, model: str = None, temperature: float = None):
+        key = self._key(model, temperature)
+        return self._build(self._models, key, lambda: PROVIDERS[self.provider](*key))
+
+    def qa_chain(self, model: str = None, temperature: float = None):
+        key = self._key(model, temperature)
+        return self._build(
+            self._chains, key, lambda: load_qa_chain(self.chat_model(*key), chain_type="stuff", prompt=self.prompt())
+        )
+
+    def warm(self):
+        """
+        Build the default chat model and QA chain, so the first question does not pay for it.
+        """
+        self.qa_chain()
+
+    def record_call(self, seconds: float):
+        self.calls += 1
+        self.call_seconds += seconds
+        self.max_call_seconds = max(self.max_call_seconds, seconds)
+
+    def stats(self) -> dict:
+        return {
+            "constructions": self.constructions,
+            "construction_ms": 1000 * self.construction_seconds,
+            "calls": self.calls,
+            "average_call_ms": 1000 * self.call_seconds / self.calls if self.calls else 0.0,
+            "max_call_ms": 1000 * self.max_call_seconds,
+        }
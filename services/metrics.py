@@ -0,0 +1,139 @@
+import math
+import threading
+
+# Minimal Prometheus metrics: counters, gauges and histograms kept in this process, plus
+# collectors that turn the stats() of the caches, batchers and pools into gauges at scrape time.
+# Rendered in the Prometheus text exposition format (version 0.0.4) by GET /metrics.
+
+PREFIX = "pdf_chat_bot_"
+
+# Seconds; covers a cache hit (well under 1 ms) to a slow model call
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: tuple, values: tuple) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(str(value))}"' for name, value in zip(labels, values))
+    return "{" + pairs + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), registry=None):
+        self.name = PREFIX + name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        (registry or default_registry).register(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels[name] for name in self.labels)
+
+    def samples(self) -> list:
+        # [(name, label names, label values, value)]
+        with self._lock:
+            return [(self.name, self.labels, key, value) for key, value in sorted(self._values.items())]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS, registry=None):
+        super().__init__(name, help, labels, registry)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    def samples(self) -> list:
+        with self._lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        samples = []
+        for key, (counts, total) in values:
+            for bound, count in zip(self.buckets, counts):
+                samples.append((self.name + "_bucket", self.labels + ("le",), key + (_format_value(bound),), count))
+            samples.append((self.name + "_sum", self.labels, key, total))
+            samples.append((self.name + "_count", self.labels, key, counts[-1]))
+        return samples
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = []
+        # name -> function returning {key: number}, exposed as gauges named <name>_<key>
+        self.collectors = {}
+
+    def register(self, metric: Metric):
+        self.metrics.append(metric)
+
+    def add_collector(self, name: str, collect):
+        self.collectors[name] = collect
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, values, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels, values)} {_format_value(value)}")
+        for collector_name, collect in self.collectors.items():
+            try:
+                stats = collect()
+            except Exception:
+                # A failing component must not break the scrape
+                continue
+            for key, value in stats.items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                name = f"{PREFIX}{collector_name}_{key}"
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+# Metrics of this worker process, served by GET /metrics
+registry = default_registry = MetricsRegistry()
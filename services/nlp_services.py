@@ -1,46 +1,342 @@
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-import os
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
-import google.generativeai as genai
+import time
+import asyncio
+import heapq
+import hashlib
+import logging
+from bisect import bisect_right
+from itertools import chain
 from langchain_community.vectorstores import FAISS
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.chains.question_answering import load_qa_chain
-from langchain.prompts import PromptTemplate
+from services.vector_stores import VectorStoreRegistry, VectorStoreCache, create_backend, search_by_vectors, build_index
+from services.embedding_cache import CachedEmbeddings, create_embedding_store
+from services.embedding_providers import create_embeddings
+from services.embedding_batcher import EmbeddingBatcher
+from services.llm_clients import LLMClients
+from services.concurrency import run_blocking, question_slots, BLOCKING_WORKERS
+from services.answer_cache import create_answer_cache, EXACT, SEMANTIC, MISS
+from services.context_packing import pack_context, estimate_tokens
+from services.tracing import traced, stage, record_stage
+from services.metrics import Counter
+from services.lexical_index import BM25Index, LexicalIndexRegistry, reciprocal_rank_fusion
+from services.chunk_store import (
+    load_chunks,
+    chunk_metadata,
+    chunk_to_document,
+    decode_vector,
+    save_legacy_chunks,
+    search_chunks_numpy,
+    search_chunks_numpy_batch,
+    search_chunks_numpy_multi,
+)
+from services.pdf_service import PageText
+from sqlalchemy import select
+from db.database import SessionLocal
+from db.models import PDFText
+from langchain_core.documents import Document
 from google.auth import exceptions, credentials
 import google.auth  # Import google.auth for authentication
-from google.oauth2.service_account import Credentials
 from dotenv import load_dotenv
+from services.env import env_bool, env_float, env_int, env_str
 load_dotenv()
 
 # LLM implementation using langchain and google_genai for answering any question on pdf that user may have
 
 
-credentials = Credentials.from_service_account_file(os.getenv('GOOGLE_APPLICATION_CREDENTIALS'))
-# Initialize Embeddings client (for vector search)
-# Use the correct model for embeddings (e.g., text-bison or another embedding-supported model)
-embeddings = GoogleGenerativeAIEmbeddings(
-    credentials=credentials, 
-    model="models/embedding-001"
-)  # Updated model name for embeddings
-genai.configure(api_key=os.getenv("google_api_key"))
+# Initialize Embeddings client (for vector search): the Google embedding API by default,
+# or a local CPU model ("local", "hashing") that needs no network access
+embedding_provider = create_embeddings(env_str("embedding_provider", "google"))
+EMBEDDING_MODEL = embedding_provider.model_name
+embeddings = embedding_provider.embeddings
+
+# Chunk embeddings are cached by hash(model + chunk text), so only new chunks reach the embedding API
+# Batches of questions are embedded in one request (with the query task type for Google)
+cached_embeddings = CachedEmbeddings(
+    embeddings,
+    create_embedding_store(env_str("embedding_cache_backend", "sqlite")),
+    EMBEDDING_MODEL,
+    query_batch_kwargs=embedding_provider.query_batch_kwargs,
+)
+
+logger = logging.getLogger("pdf_chat_bot")
+
+# Loaded indexes kept in memory, bounded by vector_cache_max_bytes (default 512 MB)
+vector_store_cache = VectorStoreCache(env_int("vector_cache_max_bytes", 512 * 1024 * 1024))
+
+# Index type of newly built indexes: flat (exact), fp16, int8, ivf or pq (see services/vector_stores.py).
+# Existing indexes keep the type they were built with until they are rebuilt.
+VECTOR_INDEX_TYPE = env_str("vector_index_type", "flat")
+
+# One FAISS index per document, keyed by PDFText.id, stored on the configured backend (local or s3).
+# Indexes on local disk are memory-mapped unless vector_index_mmap=0.
+vector_store_registry = VectorStoreRegistry(
+    create_backend(env_str("vector_store_backend", "local")), embeddings, cache=vector_store_cache,
+    mmap=env_bool("vector_index_mmap", True),
+)
+
+# BM25 index per document, stored next to its vector index ("<text_id>.bm25")
+lexical_index_registry = LexicalIndexRegistry(
+    create_backend(env_str("vector_store_backend", "local"), suffix=".bm25"),
+    cache=VectorStoreCache(env_int("lexical_cache_max_bytes", 128 * 1024 * 1024), sizeof=BM25Index.nbytes),
+)
+
+# "hybrid" fuses the vector and BM25 rankings and answers exact lookups without embedding; "vector" is dense only
+RETRIEVAL_MODE = env_str("retrieval_mode", "hybrid")
+
+# Retrieval of the top-k chunks: "faiss" (per-document index) or "numpy" (brute force over stored embeddings)
+RETRIEVAL_BACKEND = env_str("retrieval_backend", "faiss")
+RETRIEVAL_K = env_int("retrieval_k", 8)
+
+# Size of the chunks documents are split into at ingestion, in characters. Small chunks retrieve
+# precise spans; the context packer then fills the token budget with the best of them.
+CHUNK_SIZE = env_int("chunk_size", 2000)
+CHUNK_OVERLAP = env_int("chunk_overlap", 200)
+
+# Largest number of questions accepted in one batch request
+MAX_BATCH_QUESTIONS = env_int("max_batch_questions", 50)
+
+# Multi-document questions: largest number of documents and chunks sent to the model in total
+MAX_QUERY_DOCUMENTS = env_int("max_query_documents", 500)
+MULTI_DOCUMENT_K = env_int("multi_document_k", 8)
+
+def is_valid_batch(questions) -> bool:
+    return (
+        isinstance(questions, list)
+        and 0 < len(questions) <= MAX_BATCH_QUESTIONS
+        and all(isinstance(question, str) and question.strip() for question in questions)
+    )
+
+# Answers to repeated questions, keyed by document and normalized question (plus a similarity tier)
+answer_cache = create_answer_cache(env_str("answer_cache_backend", "memory"))
+
+# Function to compute the content hash used to decide when an index is stale
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def get_index_namespace(text_id: int) -> str:
+    return str(text_id)
 
 # Function to split text into chunks
 def get_text_chunks(text):
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=10000, chunk_overlap=1000)
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
     chunks = text_splitter.split_text(text)
     return chunks
 
-# Function to create and save the vector store
-def get_vector_store(text_chunks):
-    # Embedding model for FAISS
-    if len(text_chunks) == 0:
+# Split extracted pages into chunks, keeping the span of pages each chunk comes from
+@traced("chunk")
+def get_page_chunks(pages):
+    text = "".join(page.text for page in pages)
+    page_offsets = []
+    offset = 0
+    for page in pages:
+        page_offsets.append(offset)
+        offset += len(page.text)
+
+    def page_at(position):
+        return pages[max(bisect_right(page_offsets, position) - 1, 0)].page_number
+
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, add_start_index=True
+    )
+    chunks = []
+    for chunk_index, doc in enumerate(text_splitter.create_documents([text])):
+        start = max(doc.metadata.get("start_index", 0), 0)
+        chunks.append({
+            "chunk_index": chunk_index,
+            "text": doc.page_content,
+            "page_start": page_at(start),
+            "page_end": page_at(start + len(doc.page_content) - 1),
+        })
+    return chunks
+
+# Embed chunks, returning the vectors with embedding cache stats
+@traced("embed_chunks")
+def embed_chunks(chunks):
+    if len(chunks) == 0:
         raise ValueError("No text chunks were created. Please check the input text.")
-    vector_store = FAISS.from_texts(text_chunks, embedding=embeddings)
-    vector_store.save_local("faiss_index")  # Save the index locally
+    # Only cache misses are sent to the embedding API
+    vectors, hits, misses = cached_embeddings.embed_documents_with_stats([chunk["text"] for chunk in chunks])
+    stats = {
+        "chunks": len(chunks),
+        "embedding_cache_hits": hits,
+        "embedding_cache_misses": misses,
+        "embedding_cache_hit_rate": hits / len(chunks),
+    }
+    return vectors, stats
 
-# Create a conversational chain using Chat-based model
-def get_conversational_chain():
-    prompt_template = """
+# Function to create the vector store from chunks and their precomputed embeddings (no API calls)
+def get_vector_store(chunks, vectors):
+    vector_store = FAISS.from_embeddings(
+        zip([chunk["text"] for chunk in chunks], vectors),
+        embedding=cached_embeddings,
+        metadatas=[
+            {"chunk": chunk["chunk_index"], "page_start": chunk["page_start"], "page_end": chunk["page_end"]}
+            for chunk in chunks
+        ],
+    )
+    # Same vectors in the same order, so the docstore mapping of the flat index still applies
+    if VECTOR_INDEX_TYPE != "flat":
+        vector_store.index = build_index(vectors, VECTOR_INDEX_TYPE)
+    return vector_store
+
+# Build and persist the FAISS and BM25 indexes of a document from its chunks
+@traced("index_build")
+def build_document_index(text_id: int, content_hash: str, chunks, vectors):
+    vector_store = get_vector_store(chunks, vectors)
+    vector_store_registry.save(get_index_namespace(text_id), content_hash, vector_store)
+    lexical_index_registry.save(get_index_namespace(text_id), content_hash, get_lexical_index(chunks))
+    logger.info(f"Built FAISS and BM25 indexes for document {text_id}: {len(chunks)} chunks")
+    return vector_store
+
+def get_lexical_index(chunks):
+    return BM25Index([
+        Document(
+            page_content=chunk["text"],
+            metadata={"chunk": chunk["chunk_index"], "page_start": chunk["page_start"], "page_end": chunk["page_end"]},
+        )
+        for chunk in chunks
+    ])
+
+# Rebuild the FAISS index of a document from the chunks and embeddings stored in the database
+@traced("index_build")
+def build_document_index_from_db(text_id: int):
+    with SessionLocal() as db:
+        rows = load_chunks(db, text_id)
+    if not rows:
+        raise ValueError(f"No chunks stored for document {text_id}.")
+    chunks = [dict(chunk_metadata(row), chunk_index=row.chunk_index, text=row.text) for row in rows]
+    return get_vector_store(chunks, [decode_vector(row.embedding).tolist() for row in rows])
+
+# Load the persisted index of a document, rebuilding it only if the content hash has changed
+@traced("index_load")
+def load_document_index(text_id: int, content_hash: str):
+    return vector_store_registry.get_or_build(
+        get_index_namespace(text_id),
+        content_hash,
+        lambda: build_document_index_from_db(text_id),
+    )
+
+# Same for the BM25 index; documents indexed before it existed get it from their stored chunks
+def load_lexical_index(text_id: int, content_hash: str):
+    def build():
+        with SessionLocal() as db:
+            rows = load_chunks(db, text_id)
+        return BM25Index([chunk_to_document(row) for row in rows])
+
+    return lexical_index_registry.get_or_build(get_index_namespace(text_id), content_hash, build)
+
+# Chunk and embed a document stored before chunks were kept in the database; returns its content hash
+def index_legacy_document(text_id: int):
+    with SessionLocal() as db:
+        pdf_text = db.query(PDFText).filter(PDFText.id == text_id).first()
+        if pdf_text.content_hash is not None:
+            return pdf_text.content_hash
+        # Page boundaries of legacy documents are unknown
+        chunks = get_page_chunks([PageText(None, pdf_text.text)])
+        vectors, _ = embed_chunks(chunks)
+        content_hash = text_hash(pdf_text.text)
+        save_legacy_chunks(db, text_id, content_hash, chunks, vectors)
+    return content_hash
+
+# Find the chunks most relevant to a query vector (blocking: runs in the blocking pool).
+# With the question, the dense ranking is fused with the BM25 ranking in hybrid mode.
+@traced("retrieve")
+def retrieve_chunks(text_id: int, content_hash: str, query_vector, k: int, question: str = None):
+    if RETRIEVAL_BACKEND == "numpy":
+        with SessionLocal() as db:
+            docs = search_chunks_numpy(db, text_id, query_vector, k)
+    else:
+        vector_store = load_document_index(text_id, content_hash)
+        docs = vector_store.similarity_search_by_vector(query_vector, k=k)
+    if question is None:
+        return docs
+    return fuse_lexical_ranking(text_id, content_hash, [question], [docs], k)[0]
+
+# Same as retrieve_chunks for several query vectors at once, as one matrix query (blocking)
+@traced("retrieve")
+def retrieve_chunks_batch(text_id: int, content_hash: str, query_vectors, k: int, questions: list = None):
+    if RETRIEVAL_BACKEND == "numpy":
+        with SessionLocal() as db:
+            all_docs = search_chunks_numpy_batch(db, text_id, query_vectors, k)
+    else:
+        vector_store = load_document_index(text_id, content_hash)
+        all_docs = search_by_vectors(vector_store, query_vectors, k)
+    if questions is None:
+        return all_docs
+    return fuse_lexical_ranking(text_id, content_hash, questions, all_docs, k)
+
+# Merge each dense ranking with the BM25 ranking of its question by reciprocal rank fusion (blocking)
+@traced("lexical_fusion")
+def fuse_lexical_ranking(text_id: int, content_hash: str, questions: list, all_docs: list, k: int):
+    if RETRIEVAL_MODE != "hybrid":
+        return all_docs
+    lexical_index = load_lexical_index(text_id, content_hash)
+    return [
+        reciprocal_rank_fusion([docs, [doc for doc, _ in lexical_index.search(question, k)]], k)
+        for question, docs in zip(questions, all_docs)
+    ]
+
+# Chunks containing every identifier or quoted phrase the question names (blocking).
+# When there are few enough, they answer the question without embedding it; otherwise [].
+@traced("exact_match")
+def find_exact_matches(text_id: int, content_hash: str, question: str):
+    if RETRIEVAL_MODE != "hybrid":
+        return []
+    return load_lexical_index(text_id, content_hash).exact_search(question, RETRIEVAL_K)
+
+# Search a group of documents one after the other, returning (document, distance) pairs (blocking)
+def _search_document_group(documents: list, query_vector, k: int):
+    results = []
+    for text_id, content_hash in documents:
+        vector_store = load_document_index(text_id, content_hash)
+        for doc, distance in vector_store.similarity_search_with_score_by_vector(query_vector, k=k):
+            # Copies, so the documents held by the cached index are not modified
+            results.append((Document(page_content=doc.page_content, metadata=dict(doc.metadata, text_id=text_id)), distance))
+    return results
+
+# Find the top-k chunks for one query vector across several documents ({text_id: content_hash}).
+# Indexes are searched in parallel, one group of documents per blocking worker, and the results
+# are merged by distance (all indexes use the same embedding model, so distances are comparable).
+@traced("retrieve")
+async def retrieve_documents_multi(query_vector, documents: dict, k: int):
+    if RETRIEVAL_BACKEND == "numpy":
+        def search():
+            with SessionLocal() as db:
+                return search_chunks_numpy_multi(db, list(documents), query_vector, k)
+        return await run_blocking(search)
+
+    items = list(documents.items())
+    groups = [items[i::BLOCKING_WORKERS] for i in range(min(BLOCKING_WORKERS, len(items)))]
+    results = await asyncio.gather(*(run_blocking(_search_document_group, group, query_vector, k) for group in groups))
+    return [doc for doc, _ in heapq.nsmallest(k, chain.from_iterable(results), key=lambda item: item[1])]
+
+# Content hash of a stored document, or None if there is no such document (`db` is an AsyncSession).
+# Documents stored before chunking are chunked once, on their first question.
+@traced("document_lookup")
+async def get_document_hash(db, text_id: int):
+    result = await db.execute(select(PDFText.id, PDFText.content_hash).where(PDFText.id == text_id))
+    pdf_text = result.first()
+    if not pdf_text:
+        return None
+    if pdf_text.content_hash is None:
+        return await run_blocking(index_legacy_document, pdf_text.id)
+    return pdf_text.content_hash
+
+# {text_id: (filename, content_hash)} for the documents that exist among `text_ids`
+@traced("document_lookup")
+async def get_documents(db, text_ids: list):
+    result = await db.execute(
+        select(PDFText.id, PDFText.filename, PDFText.content_hash).where(PDFText.id.in_(text_ids))
+    )
+    rows = result.all()
+    documents = {}
+    for row in rows:
+        content_hash = row.content_hash
+        if content_hash is None:
+            content_hash = await run_blocking(index_legacy_document, row.id)
+        documents[row.id] = (row.filename, content_hash)
+    return documents
+
+PROMPT_TEMPLATE = """
     Answer the question as detailed as possible from the provided context, make sure to provide all the details, 
     if the answer is not in the provided context just say, "Answer is not available in the context", 
     don't provide the wrong answer.
@@ -51,32 +347,108 @@ def get_conversational_chain():
     Answer:
     """
 
-    # Use a Chat-based model for answering questions
-    model = ChatGoogleGenerativeAI(model="gemini-pro", temperature=0.3)  # Chat model for context-based answering
+NO_DOCUMENTS_MESSAGE = "No relevant documents found in the index."
 
-    # Prepare the prompt template
-    prompt = PromptTemplate(template=prompt_template, input_variables=["context", "question"])
-    
-    # Load the QA chain with the model and prompt
-    chain = load_qa_chain(model, chain_type="stuff", prompt=prompt)
+# Chat model and QA chain, built once per process (warmed at startup) instead of once per question
+llm_clients = LLMClients(
+    env_str("llm_provider", "google"),
+    env_str("llm_model", "gemini-pro"),
+    env_float("llm_temperature", 0.3),
+    PROMPT_TEMPLATE,
+)
+
+# What is sent to and received from the chat model; tokens are estimated like the context budget
+LLM_REQUESTS = Counter("llm_requests_total", "Chat model calls.", labels=("model",))
+LLM_PROMPT_TOKENS = Counter("llm_prompt_tokens_total", "Estimated prompt tokens sent to the chat model.", labels=("model",))
+LLM_PROMPT_BYTES = Counter("llm_prompt_bytes_total", "Bytes of prompt sent to the chat model.", labels=("model",))
+LLM_COMPLETION_TOKENS = Counter(
+    "llm_completion_tokens_total", "Estimated tokens received from the chat model.", labels=("model",)
+)
+LLM_COMPLETION_BYTES = Counter("llm_completion_bytes_total", "Bytes received from the chat model.", labels=("model",))
+
+def record_llm_usage(prompt: str, completion: str):
+    model = llm_clients.model
+    LLM_REQUESTS.inc(model=model)
+    LLM_PROMPT_TOKENS.inc(estimate_tokens(prompt), model=model)
+    LLM_PROMPT_BYTES.inc(len(prompt.encode()), model=model)
+    LLM_COMPLETION_TOKENS.inc(estimate_tokens(completion), model=model)
+    LLM_COMPLETION_BYTES.inc(len(completion.encode()), model=model)
+
+# Pack the retrieved chunks into the context token budget.
+# Returns the spans to send and the estimated number of prompt tokens.
+@traced("pack_context")
+def prepare_context(question: str, docs):
+    spans, stats = pack_context(question, docs)
+    prompt_tokens = stats["context_tokens"] + estimate_tokens(PROMPT_TEMPLATE) + estimate_tokens(question)
+    logger.debug(f"Packed {stats['packed']} of {stats['candidates']} chunks, about {prompt_tokens} prompt tokens")
+    return spans, prompt_tokens
+
+# Prepare the prompt template
+def get_prompt():
+    return llm_clients.prompt()
 
-    return chain
+# Use a Chat-based model for answering questions
+def get_chat_model():
+    return llm_clients.chat_model()
+
+# The conversational chain using the Chat-based model
+def get_conversational_chain():
+    return llm_clients.qa_chain()
+
+# Embed the question (the only embedding call made per question), batched with concurrent questions
+@traced("embed_question")
+async def embed_question(user_question):
+    return await query_batcher.embed(user_question)
+
+# Fetch the top-k chunks most similar to the question; the search runs in the blocking pool
+async def retrieve_documents(query_vector, text_id: int, content_hash: str, question: str = None):
+    return await run_blocking(retrieve_chunks, text_id, content_hash, query_vector, RETRIEVAL_K, question)
+
+# Embed several questions in one request
+@traced("embed_questions")
+async def embed_questions(questions):
+    return await run_blocking(cached_embeddings.embed_queries, questions)
+
+# Questions asked at the same moment by different clients are embedded in one request;
+# the same question asked twice meanwhile is embedded once
+query_batcher = EmbeddingBatcher(
+    embed_questions,
+    max_batch=env_int("query_batch_size", 32),
+    max_latency_ms=env_float("query_batch_latency_ms", 5),
+)
+
+# Describe the chunks an answer was based on (and their document, for multi-document questions)
+def get_sources(docs):
+    sources = []
+    for doc in docs:
+        source = {
+            "chunk": doc.metadata.get("chunk"),
+            "page_start": doc.metadata.get("page_start"),
+            "page_end": doc.metadata.get("page_end"),
+            "text": doc.page_content[:200],
+        }
+        if "text_id" in doc.metadata:
+            source["text_id"] = doc.metadata["text_id"]
+        sources.append(source)
+    return sources
 
 # Function to handle user input and return a response
-def user_input(user_question):
-    # Load the saved FAISS index and use the embeddings model
-    new_db = FAISS.load_local("faiss_index", embeddings,allow_dangerous_deserialization = True)
-    
+@traced("llm")
+async def user_input(user_question, docs):
     # Check if similarity search returns any documents
-    docs = new_db.similarity_search(user_question)
     if not docs:  # No documents found
-        return "No relevant documents found in the index."
+        return NO_DOCUMENTS_MESSAGE
 
     # Prepare the QA chain
     chain = get_conversational_chain()
 
-    # Generate response from the chain
-    response = chain({"input_documents": docs, "question": user_question}, return_only_outputs=True)
+    # Generate response from the chain without blocking the event loop
+    start = time.perf_counter()
+    response = await chain.ainvoke({"input_documents": docs, "question": user_question}, return_only_outputs=True)
+    llm_clients.record_call(time.perf_counter() - start)
+    # The "stuff" chain sends the chunks joined by blank lines in the prompt template
+    context = "\n\n".join(doc.page_content for doc in docs)
+    record_llm_usage(get_prompt().format(context=context, question=user_question), response.get("output_text", ""))
     
     # Check if the response contains the necessary output
     if "output_text" in response:
@@ -84,14 +456,183 @@ def user_input(user_question):
     else:
         return "No answer was found for your question."
 
-# Main function to generate the answer based on provided text and user question
-def generate_answer(question: str, text: str):
-    # Step 1: Split text into chunks
-    
-    text_chunks = get_text_chunks(text)
-    # Step 2: Create and save the vector store
-    get_vector_store(text_chunks)
-    # Step 3: Use the user input function to fetch a response based on the question
-    response = user_input(question)
-    
-    return response
+# Main function to generate the answer to a question about a stored document.
+# Returns {"answer": ..., "cache": "exact" | "semantic" | "miss", "prompt_tokens": ...}
+async def generate_answer(question: str, text_id: int, content_hash: str):
+    # Repeated questions are answered from the cache without embedding, retrieval or a model call
+    cached = await answer_cache.get_exact(text_id, content_hash, question)
+    if cached is not None:
+        return {"answer": cached["answer"], "cache": EXACT, "prompt_tokens": 0}
+
+    # At most max_concurrent_questions questions are processed at once by this worker
+    async with question_slots():
+        # Step 1: Retrieve only the top-k chunks of the document and pack the best into the budget.
+        # Questions naming identifiers found in few chunks skip the embedding call altogether.
+        query_vector = None
+        docs = await run_blocking(find_exact_matches, text_id, content_hash, question)
+        if docs:
+            answer_cache.record_miss()
+        else:
+            query_vector = await embed_question(question)
+            cached = await answer_cache.get_similar(text_id, content_hash, query_vector)
+            if cached is not None:
+                return {"answer": cached["answer"], "cache": SEMANTIC, "prompt_tokens": 0}
+            docs = await retrieve_documents(query_vector, text_id, content_hash, question)
+        docs, prompt_tokens = prepare_context(question, docs)
+        # Step 2: Use the user input function to fetch a response based on the question
+        response = await user_input(question, docs)
+
+    await answer_cache.put(text_id, content_hash, question, query_vector, {"answer": response, "sources": get_sources(docs)})
+    return {"answer": response, "cache": MISS, "prompt_tokens": prompt_tokens}
+
+# Streaming variant of generate_answer: yields {"delta": ...} frames as tokens arrive,
+# then a final {"done": True, "sources": [...], "cache": ..., "prompt_tokens": ...} frame
+async def stream_answer(question: str, text_id: int, content_hash: str):
+    cached = await answer_cache.get_exact(text_id, content_hash, question)
+    if cached is not None:
+        yield {"delta": cached["answer"]}
+        yield {"done": True, "sources": cached["sources"], "cache": EXACT, "prompt_tokens": 0}
+        return
+
+    async with question_slots():
+        query_vector = None
+        docs = await run_blocking(find_exact_matches, text_id, content_hash, question)
+        if docs:
+            answer_cache.record_miss()
+        else:
+            query_vector = await embed_question(question)
+            cached = await answer_cache.get_similar(text_id, content_hash, query_vector)
+            if cached is not None:
+                yield {"delta": cached["answer"]}
+                yield {"done": True, "sources": cached["sources"], "cache": SEMANTIC, "prompt_tokens": 0}
+                return
+            docs = await retrieve_documents(query_vector, text_id, content_hash, question)
+        if not docs:
+            yield {"delta": NO_DOCUMENTS_MESSAGE}
+            yield {"done": True, "sources": [], "cache": MISS, "prompt_tokens": 0}
+            return
+
+        # Same prompt as the "stuff" chain: packed spans joined into one context
+        docs, prompt_tokens = prepare_context(question, docs)
+        context = "\n\n".join(doc.page_content for doc in docs)
+        prompt = get_prompt().format(context=context, question=question)
+        parts = []
+        # Only the time spent waiting for the model counts as "llm", not the time this generator
+        # is suspended while the caller sends a token to a (possibly slow) client
+        model_seconds = 0.0
+        tokens = get_chat_model().astream(prompt).__aiter__()
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    chunk = await tokens.__anext__()
+                except StopAsyncIteration:
+                    break
+                finally:
+                    model_seconds += time.perf_counter() - start
+                if chunk.content:
+                    parts.append(chunk.content)
+                    yield {"delta": chunk.content}
+        finally:
+            record_stage("llm", model_seconds)
+        llm_clients.record_call(model_seconds)
+        record_llm_usage(prompt, "".join(parts))
+
+    sources = get_sources(docs)
+    await answer_cache.put(text_id, content_hash, question, query_vector, {"answer": "".join(parts), "sources": sources})
+    yield {"done": True, "sources": sources, "cache": MISS, "prompt_tokens": prompt_tokens}
+
+# Answer several questions about one document. Questions share one embedding request and one
+# index search; model calls run concurrently within question_slots. Yields
+# {"index": ..., "question": ..., "answer": ..., "cache": ..., "prompt_tokens": ...} (or "error") as each answer is ready.
+async def answer_questions(questions: list, text_id: int, content_hash: str):
+    def result(index, answer, cache, prompt_tokens=0):
+        return {
+            "index": index, "question": questions[index], "answer": answer, "cache": cache, "prompt_tokens": prompt_tokens,
+        }
+
+    pending = []
+    for index, question in enumerate(questions):
+        cached = await answer_cache.get_exact(text_id, content_hash, question)
+        if cached is not None:
+            yield result(index, cached["answer"], EXACT)
+        else:
+            pending.append(index)
+    if not pending:
+        return
+
+    # Questions answered by an exact lookup are not embedded
+    exact_docs = await run_blocking(
+        lambda: [find_exact_matches(text_id, content_hash, questions[index]) for index in pending]
+    )
+    lookups = [(index, None, docs) for index, docs in zip(pending, exact_docs) if docs]
+    pending = [index for index, docs in zip(pending, exact_docs) if not docs]
+    for _ in lookups:
+        answer_cache.record_miss()
+
+    misses = []
+    if pending:
+        query_vectors = await embed_questions([questions[index] for index in pending])
+        for index, query_vector in zip(pending, query_vectors):
+            cached = await answer_cache.get_similar(text_id, content_hash, query_vector)
+            if cached is not None:
+                yield result(index, cached["answer"], SEMANTIC)
+            else:
+                misses.append((index, query_vector))
+    if not misses and not lookups:
+        return
+
+    all_docs = []
+    if misses:
+        all_docs = await run_blocking(
+            retrieve_chunks_batch,
+            text_id,
+            content_hash,
+            [query_vector for _, query_vector in misses],
+            RETRIEVAL_K,
+            [questions[index] for index, _ in misses],
+        )
+
+    async def answer(index, query_vector, docs):
+        docs, prompt_tokens = prepare_context(questions[index], docs)
+        # A failed model call fails its own question only
+        try:
+            async with question_slots():
+                response = await user_input(questions[index], docs)
+        except Exception as e:
+            logger.error(f"Failed to answer question {index} of a batch on document {text_id}: {e}")
+            return {"index": index, "question": questions[index], "error": "Failed to process the question."}
+        entry = {"answer": response, "sources": get_sources(docs)}
+        await answer_cache.put(text_id, content_hash, questions[index], query_vector, entry)
+        return result(index, response, MISS, prompt_tokens)
+
+    lookups += [(index, query_vector, docs) for (index, query_vector), docs in zip(misses, all_docs)]
+    tasks = [asyncio.create_task(answer(index, query_vector, docs)) for index, query_vector, docs in lookups]
+    try:
+        for next_answer in asyncio.as_completed(tasks):
+            yield await next_answer
+    finally:
+        # The client went away: stop the model calls still running
+        for task in tasks:
+            task.cancel()
+
+# Answer one question using several documents ({text_id: (filename, content_hash)}).
+# Chunks come from a global top-k over all of them; each one is labelled with its document in the
+# prompt so the model can compare and attribute. Answers are not cached (the cache is per document).
+async def answer_across_documents(question: str, documents: dict):
+    async with question_slots():
+        query_vector = await embed_question(question)
+        docs = await retrieve_documents_multi(
+            query_vector, {text_id: content_hash for text_id, (_, content_hash) in documents.items()}, MULTI_DOCUMENT_K
+        )
+        docs, prompt_tokens = prepare_context(question, docs)
+        labelled = [
+            Document(page_content=f"[{documents[doc.metadata['text_id']][0]}]\n{doc.page_content}", metadata=doc.metadata)
+            for doc in docs
+        ]
+        response = await user_input(question, labelled)
+
+    sources = get_sources(docs)
+    for source in sources:
+        source["filename"] = documents[source["text_id"]][0]
+    return {"answer": response, "sources": sources, "cache": MISS, "prompt_tokens": prompt_tokens}
@@ -1,19 +1,77 @@
+import os
+import multiprocessing
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
 import pymupdf
+from services.env import env_int
 
-# this helper function convert  raw pdf data to string text found in pdf
+# this helper module converts raw pdf data to the string text found in the pdf
+
+# Text of one page, with its 1-based page number
+PageText = namedtuple("PageText", ["page_number", "text"])
+
+# Documents with at least this many pages are split across the process pool
+PARALLEL_MIN_PAGES = env_int("pdf_parallel_min_pages", 64)
+# Number of extraction processes
+EXTRACTION_WORKERS = env_int("pdf_extraction_workers") or os.cpu_count() or 1
+# Pages handled by one task; also bounds how much text a worker holds at once
+PAGES_PER_TASK = env_int("pdf_pages_per_task", 16)
+
+_process_pool = None
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    # Created on first use so small uploads and tests never start worker processes.
+    # Workers are spawned, not forked: the server forking itself while its executor threads, event
+    # loop and connection pools hold locks could leave a child blocked on a lock nobody releases.
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(
+            max_workers=EXTRACTION_WORKERS, mp_context=multiprocessing.get_context("spawn")
+        )
+    return _process_pool
 
 
 def pdf_to_text(contents: bytes) -> str:
     # Open the PDF file from the provided binary contents
     pdf = pymupdf.open(stream=contents, filetype="pdf")
 
-    # Initialize an empty string to store the extracted text
-    text = ""
+    # Extract the text from every page and join it once (repeated string concatenation is quadratic)
+    return "".join(page.get_text() for page in pdf)
+
+
+def _extract_page_range(path: str, start: int, stop: int) -> list:
+    # Runs in a worker process: each worker opens the file itself, so the PDF is never pickled
+    with pymupdf.open(path) as pdf:
+        return [PageText(number + 1, pdf[number].get_text()) for number in range(start, stop)]
+
+
+def iter_pdf_pages(path: str, workers: int = None):
+    """
+    Yield a PageText for every page of the PDF at `path`, in page order, as pages are extracted.
+    Large documents are split into page ranges processed by a pool of processes; at most
+    two ranges per worker are in flight, so memory stays bounded regardless of document size.
+    """
+    workers = EXTRACTION_WORKERS if workers is None else workers
+    with pymupdf.open(path) as pdf:
+        page_count = pdf.page_count
+        if workers <= 1 or page_count < PARALLEL_MIN_PAGES:
+            for page in pdf:
+                yield PageText(page.number + 1, page.get_text())
+            return
+
+    pool = get_process_pool()
+    ranges = iter([(start, min(start + PAGES_PER_TASK, page_count)) for start in range(0, page_count, PAGES_PER_TASK)])
+    pending = deque(pool.submit(_extract_page_range, path, *page_range) for page_range in islice(ranges, 2 * workers))
+    while pending:
+        pages = pending.popleft().result()
+        next_range = next(ranges, None)
+        if next_range is not None:
+            pending.append(pool.submit(_extract_page_range, path, *next_range))
+        yield from pages
 
-    # Iterate over each page in the PDF
-    for page in pdf:
-        # Extract the text from the current page and append it to the text variable
-        text += page.get_text()
 
-    # Return the extracted text
-    return text
\ No newline at end of file
+def pdf_file_to_text(path: str) -> str:
+    # Extract the whole text of the PDF at `path` using the page engine
+    return "".join(page.text for page in iter_pdf_pages(path))
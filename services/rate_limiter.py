@@ -0,0 +1,129 @@
+import time
+import math
+import logging
+from collections import OrderedDict
+from fastapi import HTTPException, Request, Response
+from fastapi_limiter.depends import RateLimiter
+
+logger = logging.getLogger("pdf_chat_bot")
+
+# Sliding-window rate limiting for WebSocket messages.
+# Both backends use the sliding window counter algorithm: one counter for the current fixed
+# window and one for the previous, with the previous count weighted by how much of it still
+# overlaps the sliding window. That is O(1) work and O(1) memory per key.
+
+
+def _window(now: float, window: int):
+    # Index of the current fixed window and the fraction of it that has elapsed
+    index = math.floor(now / window)
+    return index, now / window - index
+
+
+class InMemoryRateLimiter:
+    """
+    Rate limiter local to one process, for tests and single-worker deployments.
+    Keys idle for two windows are dropped, so memory does not grow with every new client.
+    """
+
+    def __init__(self, limit: int, window: int, clock=time.time):
+        self.limit = limit
+        self.window = window
+        self.clock = clock
+        self._counters = OrderedDict()  # key -> [window index, current count, previous count]
+
+    def _expire(self, index: int):
+        # Keys are ordered by last use, so only the stale ones at the front are visited
+        while self._counters:
+            key, counter = next(iter(self._counters.items()))
+            if counter[0] >= index - 1:
+                break
+            del self._counters[key]
+
+    async def allow(self, key: str) -> bool:
+        index, elapsed = _window(self.clock(), self.window)
+        self._expire(index)
+
+        counter = self._counters.pop(key, None) or [index, 0, 0]
+        if counter[0] != index:
+            # Roll the windows forward; a gap of more than one window clears both counts
+            counter = [index, 0, counter[1] if counter[0] == index - 1 else 0]
+        self._counters[key] = counter
+
+        if counter[2] * (1 - elapsed) + counter[1] >= self.limit:
+            return False
+        counter[1] += 1
+        return True
+
+
+# Runs atomically on the server, so all workers share one limit per key
+SLIDING_WINDOW_SCRIPT = """
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+local previous = tonumber(redis.call('GET', KEYS[2]) or '0')
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local elapsed = tonumber(ARGV[3])
+if previous * (1 - elapsed) + current >= limit then
+    return 0
+end
+redis.call('INCR', KEYS[1])
+redis.call('EXPIRE', KEYS[1], window * 2)
+return 1
+"""
+
+
+class RedisRateLimiter:
+    """
+    Rate limiter shared by all workers through Redis, using a Lua script on the
+    connection from setup_redis. Counters expire on their own after two windows.
+    """
+
+    def __init__(self, get_client, limit: int, window: int, prefix: str = "ws_rate", clock=time.time):
+        self.get_client = get_client
+        self.limit = limit
+        self.window = window
+        self.prefix = prefix
+        self.clock = clock
+        self._script = None
+
+    async def allow(self, key: str) -> bool:
+        index, elapsed = _window(self.clock(), self.window)
+        # The hash tag keeps both counters of a key in the same cluster slot
+        keys = [f"{self.prefix}:{{{key}}}:{index}", f"{self.prefix}:{{{key}}}:{index - 1}"]
+        try:
+            if self._script is None:
+                self._script = self.get_client().register_script(SLIDING_WINDOW_SCRIPT)
+            return bool(await self._script(keys=keys, args=[self.limit, self.window, elapsed]))
+        except Exception as e:
+            # Fail open: an unavailable Redis should not disconnect every user
+            logger.warning(f"Rate limit check failed: {e}")
+            return True
+
+
+class FailOpenRateLimiter(RateLimiter):
+    """
+    fastapi-limiter dependency for the HTTP routes that lets requests through when Redis
+    cannot be reached (or was never set up), like RedisRateLimiter does for WebSocket messages.
+    """
+
+    async def __call__(self, request: Request, response: Response):
+        try:
+            return await super().__call__(request, response)
+        except HTTPException:
+            # 429 Too Many Requests
+            raise
+        except Exception as e:
+            # Fail open: an unavailable Redis should not turn every request into a 500
+            logger.warning(f"Rate limit check failed: {e}")
+
+
+def create_rate_limiter(name: str, limit: int, window: int):
+    """
+    Create the limiter named by `ws_rate_limit_backend`: "redis" (default) or "memory".
+    """
+    if name == "memory":
+        return InMemoryRateLimiter(limit, window)
+    if name == "redis":
+        from db.redis_setup import get_redis
+        return RedisRateLimiter(get_redis, limit, window)
+    raise ValueError(f"Unknown rate limiter backend '{name}'. Available: redis, memory")
+
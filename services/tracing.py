@@ -0,0 +1,89 @@
+import time
+import inspect
+import functools
+from contextlib import contextmanager
+from contextvars import ContextVar
+from services.metrics import Histogram
+from services.env import env_bool
+
+# Per-stage latency of questions and uploads. Every stage is recorded in the stage histogram of
+# GET /metrics; the stages of the current request are also added up in its trace, which is
+# returned with the response when debug_timings=1. Stages may nest (e.g. "retrieve" includes
+# "index_load"), so the stages of a trace do not add up to its total.
+
+DEBUG_TIMINGS = env_bool("debug_timings", False)
+
+STAGE_SECONDS = Histogram("stage_seconds", "Time spent in each stage of answering questions and ingesting uploads.",
+                          labels=("stage",))
+
+
+class Trace:
+    """
+    Time spent in each stage by one request (a WebSocket message or an ingestion job).
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = {}
+
+    def add(self, name: str, seconds: float):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def summary(self) -> dict:
+        # Milliseconds per stage and since the request started, for a response
+        timings = {name: round(seconds * 1000, 2) for name, seconds in self.stages.items()}
+        timings["total"] = round((time.perf_counter() - self.start) * 1000, 2)
+        return timings
+
+
+# Trace of the request being handled; run_blocking carries it into the thread pool
+_current_trace = ContextVar("trace", default=None)
+
+
+@contextmanager
+def trace():
+    """
+    Collect the stages timed in the block (and in tasks and blocking calls it starts) into the yielded Trace.
+    """
+    current = Trace()
+    token = _current_trace.set(current)
+    try:
+        yield current
+    finally:
+        _current_trace.reset(token)
+
+
+def record_stage(name: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, stage=name)
+    current = _current_trace.get()
+    if current is not None:
+        current.add(name, seconds)
+
+
+@contextmanager
+def stage(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+
+def traced(name: str):
+    """
+    Decorator timing every call of a function (sync or async) as stage `name`.
+    """
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                with stage(name):
+                    return await func(*args, **kwargs)
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with stage(name):
+                    return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
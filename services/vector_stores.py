@@ -0,0 +1,409 @@
+import os
+import math
+import pickle
+import tempfile
+import threading
+import logging
+from collections import defaultdict, OrderedDict
+import numpy as np
+import faiss
+from langchain_community.vectorstores import FAISS
+from services.env import env_int, env_str
+
+logger = logging.getLogger("pdf_chat_bot")
+
+# Storage for per-document FAISS indexes. Every document lives in its own namespace
+# (its PDFText.id), so concurrent questions on different documents never share an index.
+
+
+class VectorStoreBackend:
+    """
+    Base class for index storage backends.
+    A backend stores one opaque blob per namespace.
+    """
+
+    def read(self, namespace: str):
+        raise NotImplementedError
+
+    def write(self, namespace: str, data: bytes):
+        raise NotImplementedError
+
+    def delete(self, namespace: str):
+        raise NotImplementedError
+
+    def local_path(self, namespace: str):
+        # Path of the stored blob if it is a file on this host (so it can be memory-mapped), else None
+        return None
+
+
+class LocalDiskBackend(VectorStoreBackend):
+    """
+    Stores each namespace as a single file under `root`.
+    Writes go to a temporary file that is atomically renamed into place,
+    so readers only ever see a complete index.
+    """
+
+    def __init__(self, root: str, suffix: str = ".faiss"):
+        self.root = root
+        self.suffix = suffix
+
+    def _path(self, namespace: str) -> str:
+        return os.path.join(self.root, f"{namespace}{self.suffix}")
+
+    def read(self, namespace: str):
+        try:
+            with open(self._path(namespace), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def write(self, namespace: str, data: bytes):
+        # The directory is created on first write, not when the backend is configured
+        os.makedirs(self.root, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, prefix=f".{namespace}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self._path(namespace))
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def delete(self, namespace: str):
+        try:
+            os.remove(self._path(namespace))
+        except FileNotFoundError:
+            pass
+
+    def local_path(self, namespace: str):
+        path = self._path(namespace)
+        return path if os.path.exists(path) else None
+
+
+class S3Backend(VectorStoreBackend):
+    """
+    Stores each namespace as one S3 object under `prefix`.
+    A single PUT replaces the object atomically, so no temporary keys are needed.
+    `get_client` returns the S3 client, which is only created when an index is first read or written.
+    """
+
+    def __init__(self, get_client, bucket: str, prefix: str = "faiss_index/", suffix: str = ".faiss"):
+        self.get_client = get_client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.suffix = suffix
+
+    def _key(self, namespace: str) -> str:
+        return f"{self.prefix}{namespace}{self.suffix}"
+
+    def read(self, namespace: str):
+        client = self.get_client()
+        try:
+            response = client.get_object(Bucket=self.bucket, Key=self._key(namespace))
+        except client.exceptions.NoSuchKey:
+            return None
+        return response["Body"].read()
+
+    def write(self, namespace: str, data: bytes):
+        self.get_client().put_object(Bucket=self.bucket, Key=self._key(namespace), Body=data)
+
+    def delete(self, namespace: str):
+        self.get_client().delete_object(Bucket=self.bucket, Key=self._key(namespace))
+
+
+def _local_backend(suffix: str):
+    return LocalDiskBackend(env_str("faiss_index_dir", "faiss_index"), suffix=suffix)
+
+
+def _s3_backend(suffix: str):
+    # Imported here so the local backend does not require S3 to be configured
+    from aws.s3client import get_s3_client, S3_BUCKET_NAME
+    return S3Backend(get_s3_client, S3_BUCKET_NAME, prefix=env_str("faiss_s3_prefix", "faiss_index/"), suffix=suffix)
+
+
+# Available backends, selected with the `vector_store_backend` environment variable.
+# A factory takes the file suffix, which tells apart the kinds of index stored for one document.
+BACKENDS = {
+    "local": _local_backend,
+    "s3": _s3_backend,
+}
+
+
+def register_backend(name: str, factory):
+    BACKENDS[name] = factory
+
+
+def create_backend(name: str, suffix: str = ".faiss") -> VectorStoreBackend:
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown vector store backend '{name}'. Available: {sorted(BACKENDS)}")
+    return BACKENDS[name](suffix)
+
+
+# Index types (vector_index_type), from largest and exact to smallest and approximate:
+# - flat: float32 vectors, exact search (FAISS.from_embeddings' own index)
+# - fp16 / int8: vectors stored as float16 (2x smaller) or 8-bit scalars (4x smaller), exhaustive search
+# - ivf: float32 vectors clustered into inverted lists; only `vector_index_nprobe` lists are searched
+# - pq: product quantization, 8 dimensions per byte (32x smaller)
+# Types that need training fall back to a simpler one for documents with too few chunks to train them.
+INDEX_TYPES = ("flat", "fp16", "int8", "ivf", "pq")
+
+# Inverted lists searched per query by IVF indexes (more is slower and closer to exact)
+IVF_NPROBE = env_int("vector_index_nprobe", 8)
+# FAISS wants about 39 training vectors per IVF list, and 256 for the 8-bit PQ codebooks
+MIN_VECTORS_PER_LIST = 39
+MIN_PQ_VECTORS = 256
+
+# Read flags for memory-mapped indexes: IVF lists are mapped by every FAISS version; flat, fp16, int8
+# and PQ codes only by versions with IO_FLAG_MMAP_IFC (older ones read them into memory)
+MMAP_FLAGS = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY | getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+
+
+def index_factory_string(index_type: str, count: int, dimensions: int) -> str:
+    """
+    FAISS index_factory description of `index_type` for `count` vectors.
+    """
+    if index_type == "flat":
+        return "Flat"
+    if index_type == "fp16":
+        return "SQfp16"
+    if index_type == "int8":
+        return "SQ8"
+    if index_type == "ivf":
+        lists = min(int(4 * math.sqrt(count)), count // MIN_VECTORS_PER_LIST)
+        return f"IVF{lists},Flat" if lists >= 2 else "Flat"
+    if index_type == "pq":
+        subquantizers = max(m for m in range(1, dimensions // 8 + 1) if dimensions % m == 0) if dimensions >= 8 else 0
+        if count < MIN_PQ_VECTORS or not subquantizers:
+            return "SQ8"
+        return f"PQ{subquantizers}"
+    raise ValueError(f"Unknown vector index type '{index_type}'. Available: {', '.join(INDEX_TYPES)}")
+
+
+def set_search_parameters(index):
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = min(IVF_NPROBE, ivf.nlist)
+
+
+def build_index(vectors, index_type: str):
+    """
+    Build a FAISS index of `index_type` over `vectors`, in their order (ids 0..n-1).
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    count, dimensions = vectors.shape
+    index = faiss.index_factory(dimensions, index_factory_string(index_type, count, dimensions))
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    set_search_parameters(index)
+    return index
+
+
+def index_bytes(index) -> int:
+    # Bytes held by the vectors of an index (codes, plus IVF centroids)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        return ivf.ntotal * (ivf.code_size + 8) + ivf.nlist * ivf.d * 4
+    return index.ntotal * getattr(index, "code_size", index.d * 4)
+
+
+def estimate_store_bytes(vector_store) -> int:
+    # Vectors (unless memory-mapped: those live in the shared page cache), plus the chunk text held by the docstore
+    vector_bytes = 0 if getattr(vector_store, "memory_mapped", False) else index_bytes(vector_store.index)
+    text_bytes = sum(len(doc.page_content) for doc in vector_store.docstore._dict.values())
+    return vector_bytes + text_bytes
+
+
+def search_by_vectors(vector_store, query_vectors: list, k: int) -> list:
+    """
+    Return the `k` closest documents for each query vector, using one index.search
+    call for all of them instead of one similarity search per query.
+    """
+    _, rows = vector_store.index.search(np.asarray(query_vectors, dtype=np.float32), k)
+    return [
+        [vector_store.docstore.search(vector_store.index_to_docstore_id[i]) for i in row if i != -1]
+        for row in rows
+    ]
+
+
+class VectorStoreCache:
+    """
+    Process-wide LRU cache of loaded FAISS indexes, bounded by an approximate byte budget.
+    Entries are tagged with their content hash, so a changed document is a miss.
+    `sizeof` estimates the bytes held by an entry.
+    """
+
+    def __init__(self, max_bytes: int, sizeof=estimate_store_bytes):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # namespace -> (content_hash, vector_store, size)
+        self._lock = threading.Lock()
+
+    def get(self, namespace: str, content_hash: str):
+        with self._lock:
+            entry = self._entries.get(namespace)
+            if entry is None or entry[0] != content_hash:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(namespace)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, namespace: str, content_hash: str, vector_store):
+        size = self.sizeof(vector_store)
+        with self._lock:
+            self._remove(namespace)
+            # An index larger than the whole budget is served from the backend instead
+            if size > self.max_bytes:
+                return
+            while self._entries and self.current_bytes + size > self.max_bytes:
+                evicted, entry = self._entries.popitem(last=False)
+                self.current_bytes -= entry[2]
+                self.evictions += 1
+                logger.info(f"Evicted vector index {evicted} from cache")
+            self._entries[namespace] = (content_hash, vector_store, size)
+            self.current_bytes += size
+
+    def invalidate(self, namespace: str):
+        with self._lock:
+            self._remove(namespace)
+
+    def _remove(self, namespace: str):
+        entry = self._entries.pop(namespace, None)
+        if entry is not None:
+            self.current_bytes -= entry[2]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+class VectorStoreRegistry:
+    """
+    Loads and saves FAISS indexes by namespace on top of a storage backend.
+    Each stored index carries the content hash of the text it was built from,
+    so a stale index is never returned. Loaded indexes are kept in an optional
+    in-memory cache so hot documents skip the backend read and unpickling.
+
+    The FAISS index is stored as its own blob ("<namespace>@<hash>"), next to the
+    docstore, so that with `mmap` and a local backend it is memory-mapped: the worker
+    processes of a host share one copy in the page cache instead of each reading it.
+    """
+
+    def __init__(self, backend: VectorStoreBackend, embeddings, cache: VectorStoreCache = None, mmap: bool = True):
+        self.backend = backend
+        self.embeddings = embeddings
+        self.cache = cache
+        self.mmap = mmap
+        self._locks = defaultdict(threading.Lock)
+        self._locks_guard = threading.Lock()
+
+    def _lock_for(self, namespace: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks[namespace]
+
+    def load(self, namespace: str, content_hash: str):
+        if self.cache is not None:
+            vector_store = self.cache.get(namespace, content_hash)
+            if vector_store is not None:
+                return vector_store
+
+        data = self.backend.read(namespace)
+        if data is None:
+            return None
+        payload = pickle.loads(data)
+        if payload["content_hash"] != content_hash:
+            return None
+        vector_store = self._decode(payload["index"])
+        if vector_store is None:
+            return None
+        if self.cache is not None:
+            self.cache.put(namespace, content_hash, vector_store)
+        return vector_store
+
+    def save(self, namespace: str, content_hash: str, vector_store):
+        previous = self.backend.read(namespace)
+        previous = pickle.loads(previous) if previous is not None else None
+        payload = {"content_hash": content_hash, "index": self._encode(namespace, content_hash, vector_store)}
+        self.backend.write(namespace, pickle.dumps(payload))
+        # The blobs of the index this one replaces (built from other text)
+        if previous is not None and previous["content_hash"] != content_hash:
+            self._delete_blobs(previous["index"])
+        if self.cache is not None:
+            self.cache.put(namespace, content_hash, vector_store)
+        logger.info(f"Saved vector index for namespace {namespace}")
+
+    def _encode(self, namespace: str, content_hash: str, vector_store) -> bytes:
+        # The index blob is written first, so a payload never points at a missing index
+        index_key = f"{namespace}@{content_hash[:16]}"
+        self.backend.write(index_key, faiss.serialize_index(vector_store.index).tobytes())
+        return pickle.dumps({
+            "index_key": index_key,
+            "docstore": vector_store.docstore,
+            "index_to_docstore_id": vector_store.index_to_docstore_id,
+        })
+
+    def _decode(self, data: bytes):
+        fields = pickle.loads(data)
+        if isinstance(fields, tuple):
+            # Stored before indexes had their own blob: FAISS.serialize_to_bytes
+            return FAISS.deserialize_from_bytes(data, self.embeddings, allow_dangerous_deserialization=True)
+        index, memory_mapped = self._read_index(fields["index_key"])
+        if index is None:
+            return None
+        set_search_parameters(index)
+        vector_store = FAISS(self.embeddings, index, fields["docstore"], fields["index_to_docstore_id"])
+        vector_store.memory_mapped = memory_mapped
+        return vector_store
+
+    def _read_index(self, index_key: str):
+        # (index, memory-mapped?); the index is read into memory from remote backends
+        path = self.backend.local_path(index_key) if self.mmap else None
+        if path is not None:
+            index = faiss.read_index(path, MMAP_FLAGS)
+            return index, hasattr(faiss, "IO_FLAG_MMAP_IFC") or faiss.try_extract_index_ivf(index) is not None
+        data = self.backend.read(index_key)
+        if data is None:
+            return None, False
+        return faiss.deserialize_index(np.frombuffer(data, dtype=np.uint8)), False
+
+    def get_or_build(self, namespace: str, content_hash: str, build):
+        vector_store = self.load(namespace, content_hash)
+        if vector_store is not None:
+            return vector_store
+
+        # Only one thread builds a given namespace; the others wait and load its result
+        with self._lock_for(namespace):
+            vector_store = self.load(namespace, content_hash)
+            if vector_store is None:
+                vector_store = build()
+                self.save(namespace, content_hash, vector_store)
+            return vector_store
+
+    def delete(self, namespace: str):
+        if self.cache is not None:
+            self.cache.invalidate(namespace)
+        data = self.backend.read(namespace)
+        if data is not None:
+            self._delete_blobs(pickle.loads(data)["index"])
+        self.backend.delete(namespace)
+
+    def _delete_blobs(self, data: bytes):
+        # Blobs stored next to the payload
+        fields = pickle.loads(data)
+        if isinstance(fields, dict):
+            self.backend.delete(fields["index_key"])
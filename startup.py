@@ -1,13 +1,18 @@
 from fastapi import FastAPI
+import os
+import time
+import asyncio
 import logging
+from sqlalchemy import text
+from db import redis_setup
 from db.redis_setup import setup_redis  # Your redis setup function
-from aws.s3client import ensure_bucket_exists, S3_BUCKET_NAME
+from aws.s3client import ensure_bucket_exists, check_bucket, S3_BUCKET_NAME
 from db import models
-from db.database import engine
-import google.auth
-from google.auth import exceptions
-from google.oauth2.service_account import Credentials
-import os
+from db.database import engine, async_engine
+from controllers.pdf_endpoints_service import start_ingestion
+from services import nlp_services
+from services.concurrency import run_blocking
+from services.env import env_float, env_str
 
 logger = logging.getLogger("pdf_chat_bot")
 
@@ -16,39 +21,122 @@ logger = logging.getLogger("pdf_chat_bot")
 # 2) Connection to PostgreSQL is established
 # 3) Connection to Redis for rate limiter is established
 # 4) Authentication for using google generative ai is complete
+# 5) The chat model and embedding clients are built before the first question
+# Nothing here runs at import: clients are created by these phases or on first use.
+# Independent phases run concurrently; a failed phase is logged and reported by
+# GET /health/ready instead of stopping the worker from booting.
+
+# Longest time a startup phase or readiness check may take, in seconds
+STARTUP_TIMEOUT = env_float("startup_timeout", 10)
+READINESS_TIMEOUT = env_float("readiness_timeout", 2)
+
+# Outcome and duration of each startup phase: name -> {"ok": ..., "ms": ..., "error": ...}
+startup_report = {}
 
-async def startup_event(app: FastAPI):
-    """
-    Startup event for initializing services like Redis, Google Cloud, Database, and S3.
-    """
-    # Setup Redis for rate limiting
-    try:
-        redis = await setup_redis()  # Call Redis setup function
-    except Exception as e:
-        logger.error(f"Redis setup failed: {e}")
-        raise e
 
-    # Ensure the S3 bucket exists
+async def timed(coroutine, timeout: float) -> dict:
+    # Await a startup step or check; returns {"ok": ..., "ms": ..., "error": ...}
+    start = time.perf_counter()
     try:
-        ensure_bucket_exists(S3_BUCKET_NAME)
-        logger.info(f"S3 bucket '{S3_BUCKET_NAME}' ensured.")
+        await asyncio.wait_for(coroutine, timeout)
+        outcome = {"ok": True}
     except Exception as e:
-        logger.error(f"Error ensuring S3 bucket: {e}")
+        outcome = {"ok": False, "error": str(e) or type(e).__name__}
+    outcome["ms"] = round((time.perf_counter() - start) * 1000, 1)
+    return outcome
 
+
+async def run_phase(name: str, coroutine) -> bool:
+    """
+    Run one startup phase, log how long it took and record the outcome in startup_report.
+    """
+    outcome = await timed(coroutine, STARTUP_TIMEOUT)
+    startup_report[name] = outcome
+    if outcome["ok"]:
+        logger.info(f"Startup phase '{name}' completed in {outcome['ms']} ms")
+    else:
+        logger.error(f"Startup phase '{name}' failed after {outcome['ms']} ms: {outcome['error']}")
+    return outcome["ok"]
+
+
+def check_google_credentials():
     # Authenticate with Google Cloud
-    try:
-        GOOGLE_CREDENTIALS_PATH = os.getenv('GOOGLE_APPLICATION_CREDENTIALS')
-        if not GOOGLE_CREDENTIALS_PATH:
-            raise ValueError("Google Cloud credentials file path not set.")
-        credentials = Credentials.from_service_account_file(GOOGLE_CREDENTIALS_PATH)
-        creds, project = google.auth.default()
-        logger.info(f"Successfully authenticated. Project: {project}")
-    except exceptions.DefaultCredentialsError:
-        logger.error("Google Cloud authentication failed.")
+    import google.auth
+    from google.oauth2.service_account import Credentials
+    google_credentials_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
+    if not google_credentials_path:
+        raise ValueError("Google Cloud credentials file path not set.")
+    Credentials.from_service_account_file(google_credentials_path)
+    _, project = google.auth.default()
+    logger.info(f"Successfully authenticated. Project: {project}")
+
 
+def create_tables():
     # Create database tables if they don't exist
+    models.Base.metadata.create_all(bind=engine)
+
+
+async def check_database():
+    # Through the async engine, which serves the request handlers
+    async with async_engine.connect() as connection:
+        await connection.execute(text("SELECT 1"))
+
+
+async def check_redis():
+    await redis_setup.get_redis().ping()
+
+
+def warm_clients():
+    # Build the chat model, QA chain and embeddings client once, so the first question does not pay for it
+    nlp_services.llm_clients.warm()
+    nlp_services.embeddings.warm()
+
+
+async def startup_event(app: FastAPI):
+    """
+    Startup event for initializing services like Redis, Google Cloud, Database, and S3.
+    """
+    start = time.perf_counter()
+    phases = [
+        # Setup Redis for rate limiting
+        run_phase("redis", setup_redis()),
+        # Ensure the S3 bucket exists
+        run_phase("s3", run_blocking(ensure_bucket_exists, S3_BUCKET_NAME)),
+        run_phase("database", run_blocking(create_tables)),
+        run_phase("clients", run_blocking(warm_clients)),
+    ]
+    # Only needed when a Google model is in use (not with the local or fake providers)
+    if "google" in (env_str("embedding_provider", "google"), nlp_services.llm_clients.provider):
+        phases.append(run_phase("google_auth", run_blocking(check_google_credentials)))
+    await asyncio.gather(*phases)
+
+    # Start the background ingestion workers for uploads (the redis backend needs the Redis phase)
     try:
-        models.Base.metadata.create_all(bind=engine)
-        logger.info("Database tables created successfully.")
+        if env_str("ingestion_queue_backend", "redis") == "redis" and not startup_report["redis"]["ok"]:
+            raise RuntimeError("Redis is unavailable for the ingestion queue")
+        start_ingestion(redis_setup.redis_connection)
+        startup_report["ingestion"] = {"ok": True, "ms": 0.0}
+        logger.info("Ingestion workers started.")
     except Exception as e:
-        logger.error(f"Error creating database tables: {e}")
+        startup_report["ingestion"] = {"ok": False, "ms": 0.0, "error": str(e)}
+        logger.error(f"Starting ingestion workers failed: {e}")
+
+    logger.info(f"Startup completed in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+
+# Dependencies checked by the readiness endpoint on every request
+READINESS_CHECKS = {
+    "database": check_database,
+    "redis": check_redis,
+    "s3": lambda: run_blocking(check_bucket, S3_BUCKET_NAME),
+}
+
+
+async def check_readiness() -> dict:
+    """
+    Check every dependency concurrently and return {name: {"ok": ..., "ms": ..., "error": ...}}.
+    """
+    async def check(name, func):
+        return name, await timed(func(), READINESS_TIMEOUT)
+
+    return dict(await asyncio.gather(*(check(name, func) for name, func in READINESS_CHECKS.items())))
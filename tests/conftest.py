@@ -1,18 +1,37 @@
+import os
 import pytest
+import asyncio
+import tempfile
+import threading
+import time
+import uvicorn
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
-from db.database import Base
+from sqlalchemy.pool import StaticPool, NullPool
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from db.database import Base, PoolMetrics
 from sqlalchemy.orm import Session
 from fastapi.testclient import TestClient
 from main import app
 
-# Use SQLite in-memory database for testing
-SQLALCHEMY_TEST_DATABASE_URL = "sqlite:///:memory:"
+# Use a temporary SQLite database for testing, a file so the sync and async engines share it
+TEST_DATABASE_PATH = os.path.join(tempfile.mkdtemp(), "test.db")
+SQLALCHEMY_TEST_DATABASE_URL = f"sqlite:///{TEST_DATABASE_PATH}"
+ASYNC_SQLALCHEMY_TEST_DATABASE_URL = f"sqlite+aiosqlite:///{TEST_DATABASE_PATH}"
 
 # Create engine and session for the test database
-engine = create_engine(SQLALCHEMY_TEST_DATABASE_URL, connect_args={"check_same_thread": False})
+# StaticPool shares a single connection with the threads used by WebSocket tests
+engine = create_engine(
+    SQLALCHEMY_TEST_DATABASE_URL, connect_args={"check_same_thread": False}, poolclass=StaticPool
+)
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine for request handlers (aiosqlite), with its connection usage counted.
+# NullPool: TestClient runs each WebSocket connection on its own event loop
+async_engine = create_async_engine(ASYNC_SQLALCHEMY_TEST_DATABASE_URL, poolclass=NullPool)
+TestingAsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+testing_pool_metrics = PoolMetrics(async_engine.sync_engine, capacity=4)
+
 @pytest.fixture(scope="module")
 def test_db():
     # Create tables
@@ -28,3 +47,52 @@ def test_db():
 def client():
     # Use FastAPI TestClient for API tests
     return TestClient(app)
+
+
+class FakeQAChain:
+    """
+    Stands in for the Gemini QA chain.
+    Answers with the best matching chunk so tests can tell which index was searched,
+    optionally after an asynchronous delay simulating model latency.
+    """
+
+    def __init__(self, delay: float = 0):
+        self.delay = delay
+
+    async def ainvoke(self, inputs, return_only_outputs=True):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        return {"output_text": inputs["input_documents"][0].page_content}
+
+
+class FakeChatModel:
+    """
+    Stands in for the Gemini chat model in streaming mode.
+    Streams the first line of the context back word by word.
+    """
+
+    async def astream(self, prompt):
+        from langchain_core.messages import AIMessageChunk
+        context = prompt.split("Context:", 1)[1].strip().splitlines()[0]
+        for word in context.split(" "):
+            yield AIMessageChunk(content=word + " ")
+
+
+@pytest.fixture
+def live_server():
+    """
+    Run the app in a real uvicorn server (single event loop, no lifespan) on a free port
+    and yield its WebSocket base URL.
+    """
+    config = uvicorn.Config(app, host="127.0.0.1", port=0, lifespan="off", log_level="warning")
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    try:
+        yield f"ws://127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        thread.join()
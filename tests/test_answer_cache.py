@@ -0,0 +1,66 @@
+import pytest
+from unittest.mock import patch
+from services.answer_cache import AnswerCache, InMemoryAnswerStore, create_answer_cache, normalize_question
+
+ENTRY = {"answer": "Friday", "sources": []}
+
+
+@pytest.fixture
+def cache():
+    return AnswerCache(InMemoryAnswerStore(max_entries=100, ttl=60), similarity_threshold=0.9)
+
+
+def test_questions_are_normalized():
+    assert normalize_question("  What is the   DEADLINE? ") == normalize_question("what is the deadline")
+
+
+@pytest.mark.asyncio
+async def test_exact_hit_after_put(cache):
+    """
+    Test that the same question about the same document is an exact hit.
+    """
+    await cache.put(1, "hash", "What is the deadline?", [1.0, 0.0], ENTRY)
+
+    assert await cache.get_exact(1, "hash", "what is the deadline") == ENTRY
+    assert await cache.get_exact(2, "hash", "what is the deadline") is None
+    assert await cache.get_exact(1, "new-hash", "what is the deadline") is None
+
+
+@pytest.mark.asyncio
+async def test_semantic_hit_above_threshold(cache):
+    """
+    Test that a differently worded question with a similar embedding is a semantic hit,
+    and a dissimilar one is a miss.
+    """
+    await cache.put(1, "hash", "What is the deadline?", [1.0, 0.0], ENTRY)
+
+    assert await cache.get_similar(1, "hash", [0.99, 0.05]) == ENTRY
+    assert await cache.get_similar(1, "hash", [0.0, 1.0]) is None
+    assert cache.stats()["semantic_hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+@pytest.mark.asyncio
+async def test_entries_expire_and_are_evicted():
+    """
+    Test TTL expiry and LRU eviction beyond the entry limit.
+    """
+    expired = AnswerCache(InMemoryAnswerStore(max_entries=100, ttl=-1))
+    await expired.put(1, "hash", "question", [1.0], ENTRY)
+    assert await expired.get_exact(1, "hash", "question") is None
+
+    small = AnswerCache(InMemoryAnswerStore(max_entries=2, ttl=60))
+    for question in ("first", "second", "third"):
+        await small.put(1, "hash", question, [1.0], ENTRY)
+    assert await small.get_exact(1, "hash", "first") is None
+    assert await small.get_exact(1, "hash", "third") == ENTRY
+
+
+def test_semantic_tier_is_opt_in():
+    """
+    Test that reworded questions are only answered from the cache when a similarity threshold is set.
+    """
+    with patch.dict("os.environ", {"answer_cache_similarity": ""}):
+        assert create_answer_cache("memory").similarity_threshold is None
+    with patch.dict("os.environ", {"answer_cache_similarity": "0.95"}):
+        assert create_answer_cache("memory").similarity_threshold == 0.95
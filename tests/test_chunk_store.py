@@ -0,0 +1,98 @@
+from unittest.mock import patch
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from sqlalchemy.orm import Session
+from db.models import PDFText, PDFChunk
+from services import nlp_services
+from services.chunk_store import save_document, search_chunks_numpy, search_chunks_numpy_batch, search_chunks_numpy_multi
+from services.embedding_cache import CachedEmbeddings, NullEmbeddingStore
+from services.pdf_service import PageText
+from tests.conftest import TestingSessionLocal
+
+
+def make_chunks(texts):
+    return [{"chunk_index": i, "text": text, "page_start": i + 1, "page_end": i + 1} for i, text in enumerate(texts)]
+
+
+def test_page_chunks_keep_page_spans():
+    """
+    Test that chunks record the first and last page their text comes from.
+    """
+    pages = [PageText(number, f"page {number} " * 1000) for number in (1, 2, 3)]
+
+    chunks = nlp_services.get_page_chunks(pages)
+
+    assert len(chunks) > 1
+    assert chunks[0]["page_start"] == 1
+    assert chunks[-1]["page_end"] == 3
+    for chunk in chunks:
+        assert f"page {chunk['page_start']}" in chunk["text"]
+        assert f"page {chunk['page_end']}" in chunk["text"]
+
+
+def test_numpy_search_returns_top_k_in_order(test_db: Session):
+    """
+    Test that the brute-force search ranks chunks by distance and returns only k of them.
+    """
+    pdf_text = save_document(
+        test_db, "numpy_search.pdf", "alpha beta gamma", "hash",
+        make_chunks(["alpha", "beta", "gamma"]),
+        [[1.0, 0.0], [0.0, 1.0], [5.0, 5.0]],
+    )
+
+    docs = search_chunks_numpy(test_db, pdf_text.id, [0.9, 0.1], k=2)
+
+    assert [doc.page_content for doc in docs] == ["alpha", "beta"]
+    assert docs[0].metadata == {"chunk": 0, "page_start": 1, "page_end": 1}
+
+
+def test_numpy_batch_search_matches_single_searches(test_db: Session):
+    """
+    Test that ranking several queries in one matrix query gives the same chunks as one search per query.
+    """
+    pdf_text = save_document(
+        test_db, "numpy_batch.pdf", "a b c d", "hash",
+        make_chunks(["a", "b", "c", "d"]),
+        [[0.0, 0.0], [1.0, 0.0], [0.0, 2.0], [3.0, 3.0]],
+    )
+    queries = [[0.1, 0.0], [2.9, 2.8], [0.0, 1.9]]
+
+    batch = search_chunks_numpy_batch(test_db, pdf_text.id, queries, k=2)
+
+    assert len(batch) == len(queries)
+    for query, docs in zip(queries, batch):
+        single = search_chunks_numpy(test_db, pdf_text.id, query, k=2)
+        assert [doc.page_content for doc in docs] == [doc.page_content for doc in single]
+    assert [doc.page_content for doc in batch[1]] == ["d", "c"]
+
+
+def test_numpy_multi_search_merges_documents(test_db: Session):
+    """
+    Test that searching several documents returns one global top-k naming each chunk's document.
+    """
+    first = save_document(test_db, "multi_a.pdf", "a1 a2", "hash-a", make_chunks(["a1", "a2"]), [[0.0, 0.0], [9.0, 9.0]])
+    second = save_document(test_db, "multi_b.pdf", "b1 b2", "hash-b", make_chunks(["b1", "b2"]), [[1.0, 1.0], [0.5, 0.0]])
+    other = save_document(test_db, "multi_c.pdf", "c1", "hash-c", make_chunks(["c1"]), [[0.0, 0.1]])
+
+    docs = search_chunks_numpy_multi(test_db, [first.id, second.id], [0.0, 0.0], k=3)
+
+    assert [doc.page_content for doc in docs] == ["a1", "b2", "b1"]
+    assert [doc.metadata["text_id"] for doc in docs] == [first.id, second.id, second.id]
+    assert other.id not in {doc.metadata["text_id"] for doc in docs}
+
+
+def test_legacy_document_is_chunked_once(test_db: Session):
+    """
+    Test that a document stored before chunking gets its chunks on first use only.
+    """
+    pdf_text = PDFText(filename="legacy.pdf", text="legacy document text")
+    test_db.add(pdf_text)
+    test_db.commit()
+    fake_embeddings = CachedEmbeddings(DeterministicFakeEmbedding(size=8), NullEmbeddingStore(), "fake")
+
+    with patch.object(nlp_services, "SessionLocal", TestingSessionLocal), \
+            patch.object(nlp_services, "cached_embeddings", fake_embeddings):
+        first = nlp_services.index_legacy_document(pdf_text.id)
+        second = nlp_services.index_legacy_document(pdf_text.id)
+
+    assert first == second == nlp_services.text_hash("legacy document text")
+    assert test_db.query(PDFChunk).filter(PDFChunk.pdf_text_id == pdf_text.id).count() == 1
@@ -0,0 +1,66 @@
+from langchain_core.documents import Document
+from services.context_packing import dedupe_spans, rerank, pack_context, estimate_tokens
+
+
+def chunk(text, index, text_id=None):
+    metadata = {"chunk": index, "page_start": 1, "page_end": 1}
+    if text_id is not None:
+        metadata["text_id"] = text_id
+    return Document(page_content=text, metadata=metadata)
+
+
+def test_overlapping_neighbours_are_sent_once():
+    """
+    Test that the text two neighbouring chunks share is kept once, whichever ranked first.
+    """
+    overlap = "shared sentence between both chunks. "
+    first = chunk("The first chunk ends with a " + overlap, 0)
+    second = chunk(overlap + "and the second chunk goes on.", 1)
+
+    for docs in ([first, second], [second, first]):
+        spans = dedupe_spans(docs)
+        assert "".join(span.page_content for span in sorted(spans, key=lambda span: span.metadata["chunk"])) \
+            == "The first chunk ends with a " + overlap + "and the second chunk goes on."
+
+
+def test_duplicates_and_other_documents_are_not_merged():
+    """
+    Test that identical chunks are dropped and chunks of different documents are never trimmed.
+    """
+    text = "identical boilerplate text repeated in the retrieved results"
+    spans = dedupe_spans([chunk(text, 0, text_id=1), chunk(text, 0, text_id=1), chunk(text + "!", 1, text_id=2)])
+
+    assert [span.page_content for span in spans] == [text, text + "!"]
+
+
+def test_rerank_prefers_spans_with_question_terms():
+    """
+    Test that a lower-ranked span naming the clause asked about moves to the front.
+    """
+    docs = [chunk("general payment terms of the agreement", 0), chunk("clause 14.2 covers termination", 1)]
+
+    assert rerank("What does clause 14.2 say?", docs)[0].metadata["chunk"] == 1
+
+
+def test_packing_respects_the_token_budget():
+    """
+    Test that spans are packed up to the budget, skipping spans that do not fit, and that the
+    token count of what was packed is reported.
+    """
+    docs = [chunk("a" * 400, 0), chunk("b" * 400, 2), chunk("c" * 40, 4)]
+
+    packed, stats = pack_context("question", docs, token_budget=120)
+
+    assert [doc.page_content[0] for doc in packed] == ["a", "c"]
+    assert stats["context_tokens"] == estimate_tokens("a" * 400) + estimate_tokens("c" * 40) <= 120
+    assert stats["candidates"] == 3 and stats["packed"] == 2
+
+
+def test_oversized_best_span_is_truncated():
+    """
+    Test that the context is never empty when the best span alone exceeds the budget.
+    """
+    packed, stats = pack_context("question", [chunk("x" * 1000, 0)], token_budget=50)
+
+    assert len(packed) == 1
+    assert stats["context_tokens"] == 50
@@ -0,0 +1,22 @@
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import QueuePool
+from db.database import PoolMetrics
+
+
+def test_pool_metrics_count_saturation(tmp_path):
+    """
+    Test that checkouts, peak usage and checkouts taking the pool's last connection are counted.
+    """
+    engine = create_engine(f"sqlite:///{tmp_path / 'pool.db'}", poolclass=QueuePool, pool_size=2, max_overflow=1)
+    metrics = PoolMetrics(engine, capacity=3)
+
+    connections = [engine.connect() for _ in range(3)]
+    for connection in connections:
+        connection.execute(text("SELECT 1"))
+    busy = metrics.stats()
+    for connection in connections:
+        connection.close()
+    idle = metrics.stats()
+
+    assert (busy["in_use"], busy["utilization"], busy["saturated_checkouts"]) == (3, 1.0, 1)
+    assert (idle["in_use"], idle["peak_in_use"], idle["checkouts"]) == (0, 3, 3)
@@ -0,0 +1,143 @@
+import asyncio
+import contextvars
+import pytest
+from services.embedding_batcher import EmbeddingBatcher
+
+
+class RecordingModel:
+    """
+    Fake batch embedder that records every batch and answers after `delay` seconds.
+    """
+
+    def __init__(self, delay: float = 0.01, fail: bool = False):
+        self.delay = delay
+        self.fail = fail
+        self.batches = []
+
+    async def embed_batch(self, texts):
+        self.batches.append(list(texts))
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("embedding API unavailable")
+        return [[float(len(text))] for text in texts]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_are_coalesced():
+    """
+    Test that questions embedded at the same moment go out as one batch and each caller
+    gets the vector of its own question.
+    """
+    model = RecordingModel()
+    batcher = EmbeddingBatcher(model.embed_batch, max_batch=32, max_latency_ms=5)
+    questions = [f"question {'x' * i}" for i in range(10)]
+
+    vectors = await asyncio.gather(*(batcher.embed(question) for question in questions))
+
+    assert vectors == [[float(len(question))] for question in questions]
+    assert model.batches == [questions]
+    assert batcher.stats()["average_batch_size"] == 10
+
+
+@pytest.mark.asyncio
+async def test_identical_in_flight_requests_are_embedded_once():
+    """
+    Test that a question already queued or being embedded is not sent again.
+    """
+    model = RecordingModel(delay=0.05)
+    batcher = EmbeddingBatcher(model.embed_batch, max_batch=32, max_latency_ms=1)
+
+    first = asyncio.create_task(batcher.embed("When is the deadline?"))
+    await asyncio.sleep(0.01)  # the first batch is now being embedded
+    vectors = await asyncio.gather(first, batcher.embed("When is the deadline?"), batcher.embed("When is the deadline?"))
+
+    assert vectors[0] == vectors[1] == vectors[2]
+    assert model.batches == [["When is the deadline?"]]
+    assert batcher.stats()["deduplicated"] == 2
+
+
+@pytest.mark.asyncio
+async def test_full_batches_are_sent_without_waiting():
+    """
+    Test that max_batch distinct questions are sent at once, before the latency timer fires.
+    """
+    model = RecordingModel(delay=0)
+    batcher = EmbeddingBatcher(model.embed_batch, max_batch=4, max_latency_ms=1000)
+
+    await asyncio.wait_for(asyncio.gather(*(batcher.embed(f"q{i}") for i in range(8))), timeout=0.5)
+
+    assert [len(batch) for batch in model.batches] == [4, 4]
+    assert batcher.stats()["max_queued_ms"] < 500
+
+
+@pytest.mark.asyncio
+async def test_failed_batch_fails_its_callers_and_recovers():
+    """
+    Test that an embedding error reaches every caller of the batch and the next call retries.
+    """
+    model = RecordingModel(fail=True)
+    batcher = EmbeddingBatcher(model.embed_batch, max_batch=32, max_latency_ms=1)
+
+    results = await asyncio.gather(batcher.embed("a"), batcher.embed("b"), return_exceptions=True)
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+    model.fail = False
+    assert await batcher.embed("a") == [1.0]
+
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_does_not_cancel_shared_request():
+    """
+    Test that a disconnected client sharing a request does not cancel it for the others.
+    """
+    model = RecordingModel(delay=0.05)
+    batcher = EmbeddingBatcher(model.embed_batch, max_batch=32, max_latency_ms=1)
+
+    leaving = asyncio.create_task(batcher.embed("shared question"))
+    staying = asyncio.create_task(batcher.embed("shared question"))
+    await asyncio.sleep(0.01)
+    leaving.cancel()
+
+    assert await staying == [float(len("shared question"))]
+
+
+@pytest.mark.asyncio
+async def test_short_batch_fails_every_caller():
+    """
+    Test that a model returning fewer vectors than texts fails the whole batch
+    instead of leaving the callers without a vector waiting forever.
+    """
+    async def embed_batch(texts):
+        return [[1.0]]
+
+    batcher = EmbeddingBatcher(embed_batch, max_batch=32, max_latency_ms=1)
+
+    results = await asyncio.wait_for(
+        asyncio.gather(batcher.embed("a"), batcher.embed("b"), return_exceptions=True), timeout=0.5
+    )
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+@pytest.mark.asyncio
+async def test_batch_runs_outside_the_callers_context():
+    """
+    Test that the shared batch does not run in the context of the caller that started it,
+    so its stages are not added to that caller's trace.
+    """
+    request = contextvars.ContextVar("request", default=None)
+    seen = []
+
+    async def embed_batch(texts):
+        seen.append(request.get())
+        return [[1.0] for _ in texts]
+
+    batcher = EmbeddingBatcher(embed_batch, max_batch=2, max_latency_ms=1)
+
+    async def ask(name, text):
+        request.set(name)
+        return await batcher.embed(text)
+
+    await asyncio.gather(ask("first", "a"), ask("second", "b"))
+    await asyncio.gather(ask("third", "c"))
+
+    assert seen == [None, None]
@@ -0,0 +1,67 @@
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from services.embedding_cache import CachedEmbeddings, SQLiteEmbeddingStore
+
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    """
+    Deterministic fake embedding model that records every text sent to it.
+    """
+    calls: list = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return super().embed_documents(texts)
+
+
+@pytest.fixture
+def model():
+    return CountingEmbeddings(size=16, calls=[])
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SQLiteEmbeddingStore(str(tmp_path / "embeddings.sqlite3"))
+
+
+def test_only_cache_misses_are_embedded(model, store):
+    """
+    Test that a revised document only sends its new chunks to the model and
+    that the vectors match what the model would have returned.
+    """
+    cached = CachedEmbeddings(model, store, "fake-model")
+
+    _, hits, misses = cached.embed_documents_with_stats(["chunk a", "chunk b"])
+    assert (hits, misses) == (0, 2)
+
+    vectors, hits, misses = cached.embed_documents_with_stats(["chunk a", "chunk b", "chunk c"])
+    assert (hits, misses) == (2, 1)
+    assert model.calls == [["chunk a", "chunk b"], ["chunk c"]]
+    assert vectors == pytest.approx(model.embed_documents(["chunk a", "chunk b", "chunk c"]), abs=1e-6)
+
+
+def test_duplicate_chunks_are_embedded_once(model, store):
+    """
+    Test that identical chunks within one upload are sent to the model once,
+    and that the repeats count as hits.
+    """
+    cached = CachedEmbeddings(model, store, "fake-model")
+
+    vectors, hits, misses = cached.embed_documents_with_stats(["same", "same", "other"])
+
+    assert (hits, misses) == (1, 2)
+    assert model.calls == [["same", "other"]]
+    assert vectors[0] == vectors[1]
+
+    _, hits, misses = cached.embed_documents_with_stats(["same", "new", "new", "new"])
+    assert (hits, misses) == (3, 1)
+
+
+def test_cache_key_includes_model_name(model, store):
+    """
+    Test that switching embedding models does not reuse vectors from the old model.
+    """
+    CachedEmbeddings(model, store, "model-a").embed_documents(["chunk"])
+    _, hits, _ = CachedEmbeddings(model, store, "model-b").embed_documents_with_stats(["chunk"])
+
+    assert hits == 0
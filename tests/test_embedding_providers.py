@@ -0,0 +1,123 @@
+import math
+import time
+import asyncio
+import threading
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from services.embedding_providers import HashingEncoder, MicroBatchingEmbeddings, create_embeddings
+
+
+class RecordingEncoder:
+    """
+    Hashing encoder that records the size of every batch and takes `delay` seconds per batch.
+    """
+
+    def __init__(self, delay: float = 0.01, fail: bool = False):
+        self.encoder = HashingEncoder(16)
+        self.delay = delay
+        self.fail = fail
+        self.batch_sizes = []
+        self._lock = threading.Lock()
+
+    def encode(self, texts):
+        with self._lock:
+            self.batch_sizes.append(len(texts))
+        time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("model crashed")
+        return self.encoder.encode(texts)
+
+
+def test_hashing_encoder_is_deterministic_and_normalized():
+    """
+    Test that the same text always gets the same unit vector, and unrelated texts differ.
+    """
+    encoder = HashingEncoder(64)
+    first, again, other = encoder.encode(["the deadline is friday", "the deadline is friday", "invoice totals"])
+
+    assert first == again
+    assert first != other
+    assert math.isclose(math.sqrt(sum(value * value for value in first)), 1.0, rel_tol=1e-6)
+    assert encoder.encode([""]) == [[0.0] * 64]
+
+
+def test_concurrent_queries_share_batches():
+    """
+    Test that queries embedded at the same time by many threads are encoded in a few batches,
+    and every caller gets the vector of its own text.
+    """
+    encoder = RecordingEncoder()
+    embeddings = MicroBatchingEmbeddings(encoder, max_batch=16, max_wait_ms=20)
+    texts = [f"question number {i}" for i in range(32)]
+
+    with ThreadPoolExecutor(max_workers=32) as pool:
+        vectors = list(pool.map(embeddings.embed_query, texts))
+
+    assert vectors == HashingEncoder(16).encode(texts)
+    assert len(encoder.batch_sizes) < len(texts)
+    assert max(encoder.batch_sizes) <= 16
+    assert embeddings.stats()["texts"] == len(texts)
+
+
+def test_large_document_batches_are_split():
+    """
+    Test that embed_documents encodes at most max_batch texts per forward pass, in order.
+    """
+    encoder = RecordingEncoder(delay=0)
+    embeddings = MicroBatchingEmbeddings(encoder, max_batch=4, max_wait_ms=0)
+    texts = [f"chunk {i}" for i in range(10)]
+
+    assert embeddings.embed_documents(texts, task_type="retrieval_query") == HashingEncoder(16).encode(texts)
+    assert max(encoder.batch_sizes) <= 4
+
+
+def test_failed_batch_fails_its_callers_only():
+    """
+    Test that an encoder error reaches the callers of that batch and the thread keeps serving.
+    """
+    encoder = RecordingEncoder(delay=0, fail=True)
+    embeddings = MicroBatchingEmbeddings(encoder, max_batch=4, max_wait_ms=0)
+
+    with pytest.raises(RuntimeError):
+        embeddings.embed_query("first")
+    encoder.fail = False
+    assert embeddings.embed_query("second") == HashingEncoder(16).encode(["second"])[0]
+
+
+@pytest.mark.asyncio
+async def test_async_queries_are_batched_without_the_thread_pool():
+    """
+    Test that aembed_query awaits the inference thread and concurrent coroutines share batches.
+    """
+    encoder = RecordingEncoder()
+    embeddings = MicroBatchingEmbeddings(encoder, max_batch=8, max_wait_ms=20)
+
+    vectors = await asyncio.gather(*(embeddings.aembed_query(f"question {i}") for i in range(8)))
+
+    assert vectors == HashingEncoder(16).encode([f"question {i}" for i in range(8)])
+    assert len(encoder.batch_sizes) < 8
+
+
+def test_hashing_provider_needs_no_credentials(monkeypatch):
+    """
+    Test that the offline provider is created without Google credentials.
+    """
+    monkeypatch.delenv("GOOGLE_APPLICATION_CREDENTIALS", raising=False)
+    provider = create_embeddings("hashing")
+
+    assert provider.model_name.startswith("hashing:")
+    assert provider.query_batch_kwargs == {}
+    assert len(provider.embeddings.embed_query("hello")) == int(provider.model_name.split(":")[1])
+
+    with pytest.raises(ValueError):
+        create_embeddings("unknown")
+
+
+def test_google_provider_is_created_lazily(monkeypatch):
+    """
+    Test that creating the Google provider reads no credentials until the first embedding.
+    """
+    monkeypatch.setenv("GOOGLE_APPLICATION_CREDENTIALS", "/nonexistent/service_account.json")
+    provider = create_embeddings("google")
+
+    assert provider.embeddings._embeddings is None
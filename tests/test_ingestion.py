@@ -0,0 +1,509 @@
+import os
+import asyncio
+import hashlib
+import pytest
+from io import BytesIO
+from unittest.mock import patch
+from sqlalchemy.orm import Session
+from starlette.datastructures import UploadFile
+from fastapi import HTTPException
+from db.models import PDFText, PDFAlias
+from controllers import pdf_endpoints_service
+from controllers.pdf_endpoints_service import enqueue_upload_service, get_staging_path, process_ingestion_job
+from services.chunk_store import save_document
+from services.job_queue import InMemoryJobQueue, RedisJobQueue, WorkerPool, new_job, COMPLETED, FAILED, QUEUED, RUNNING
+from tests.conftest import TestingSessionLocal
+
+
+async def wait_for_status(queue, job_id, statuses, timeout=5):
+    # Poll the job like a client of GET /jobs/{id} would
+    for _ in range(int(timeout / 0.01)):
+        job = await queue.get(job_id)
+        if job["status"] in statuses:
+            return job
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"Job {job_id} did not reach {statuses}: {job}")
+
+
+@pytest.mark.asyncio
+async def test_failed_jobs_are_retried():
+    """
+    Test that a job failing once is retried and then completes.
+    """
+    queue = InMemoryJobQueue()
+    calls = []
+
+    async def handler(job, report):
+        calls.append(job["attempts"])
+        if len(calls) == 1:
+            raise RuntimeError("temporary failure")
+        await report("done", 1.0)
+
+    pool = WorkerPool(queue, handler, concurrency=1, max_attempts=3, retry_delay=0)
+    pool.start()
+    try:
+        job = await queue.create(new_job(filename="a.pdf"))
+        job = await wait_for_status(queue, job["id"], {COMPLETED, FAILED})
+    finally:
+        await pool.stop()
+
+    assert job["status"] == COMPLETED
+    assert job["attempts"] == 2
+    assert calls == [1, 2]
+
+
+@pytest.mark.asyncio
+async def test_jobs_fail_after_max_attempts():
+    """
+    Test that a job failing every time is marked failed and cleaned up once.
+    """
+    queue = InMemoryJobQueue()
+    failed = []
+
+    async def handler(job, report):
+        raise RuntimeError("broken pdf")
+
+    pool = WorkerPool(queue, handler, concurrency=1, max_attempts=2, retry_delay=0, on_failure=failed.append)
+    pool.start()
+    try:
+        job = await queue.create(new_job(filename="a.pdf"))
+        job = await wait_for_status(queue, job["id"], {FAILED})
+    finally:
+        await pool.stop()
+
+    assert job["attempts"] == 2
+    assert job["error"] == "broken pdf"
+    assert [job["id"] for job in failed] == [job["id"]]
+
+
+class FlakyJobQueue(InMemoryJobQueue):
+    # Fails the first `failures` dequeues, like a Redis connection that drops
+    def __init__(self, failures: int):
+        super().__init__()
+        self.failures = failures
+
+    async def dequeue(self, timeout: float):
+        if self.failures > 0:
+            self.failures -= 1
+            raise ConnectionError("connection lost")
+        return await super().dequeue(timeout)
+
+
+@pytest.mark.asyncio
+async def test_workers_survive_queue_errors():
+    """
+    Test that a worker keeps processing jobs after the queue raised errors.
+    """
+    queue = FlakyJobQueue(failures=2)
+
+    async def handler(job, report):
+        await report("done", 1.0)
+
+    pool = WorkerPool(queue, handler, concurrency=1, max_error_delay=0.01)
+    pool.start()
+    try:
+        job = await queue.create(new_job(filename="a.pdf"))
+        job = await wait_for_status(queue, job["id"], {COMPLETED})
+    finally:
+        await pool.stop()
+
+    assert queue.failures == 0
+    assert job["attempts"] == 1
+
+
+@pytest.mark.asyncio
+async def test_stop_cancels_pending_retries():
+    """
+    Test that a retry scheduled before shutdown does not requeue its job afterwards.
+    """
+    queue = InMemoryJobQueue()
+
+    async def handler(job, report):
+        raise RuntimeError("temporary failure")
+
+    pool = WorkerPool(queue, handler, concurrency=1, max_attempts=3, retry_delay=0.2)
+    pool.start()
+    job = await queue.create(new_job(filename="a.pdf"))
+    while not pool._retry_tasks:
+        await asyncio.sleep(0.01)
+    await pool.stop()
+    await asyncio.sleep(0.3)
+
+    assert not pool._retry_tasks
+    assert queue._pending().empty()
+
+
+class ListRedis:
+    # The Redis commands of RedisJobQueue, on dicts and lists
+    def __init__(self):
+        self.values = {}
+        self.lists = {}
+
+    async def set(self, key, value, ex=None):
+        self.values[key] = value
+
+    async def get(self, key):
+        return self.values.get(key)
+
+    async def exists(self, key):
+        return int(key in self.values)
+
+    async def delete(self, key):
+        self.values.pop(key, None)
+
+    async def lpush(self, key, value):
+        self.lists.setdefault(key, []).insert(0, value)
+
+    async def lmove(self, source, destination, src, dest):
+        items = self.lists.get(source)
+        if not items:
+            return None
+        value = items.pop() if src == "RIGHT" else items.pop(0)
+        target = self.lists.setdefault(destination, [])
+        target.append(value) if dest == "RIGHT" else target.insert(0, value)
+        return value
+
+    async def blmove(self, source, destination, timeout, src, dest):
+        value = await self.lmove(source, destination, src, dest)
+        if value is None:
+            await asyncio.sleep(0.01)
+        return value
+
+    async def lrem(self, key, count, value):
+        self.lists.get(key, []).remove(value)
+
+    async def scan_iter(self, match):
+        for key in list(self.lists):
+            if key.startswith(match.rstrip("*")):
+                yield key
+
+
+@pytest.mark.asyncio
+async def test_jobs_of_a_stopped_process_are_recovered():
+    """
+    Test that a job taken by a process that died is requeued and completed by another one.
+    """
+    redis = ListRedis()
+    crashed = RedisJobQueue(redis)
+    job = await crashed.create(new_job(filename="a.pdf"))
+    await crashed.heartbeat()
+    assert await crashed.dequeue(timeout=1) == job["id"]
+    await crashed.update(job["id"], status=RUNNING, attempts=1)
+
+    async def handler(job, report):
+        await report("done", 1.0)
+
+    queue = RedisJobQueue(redis)
+    assert await queue.recover() == 0  # the heartbeat of the first process has not expired yet
+    await redis.delete(crashed.heartbeat_prefix + crashed.consumer_id)
+
+    pool = WorkerPool(queue, handler, concurrency=1)
+    pool.start()
+    try:
+        job = await wait_for_status(queue, job["id"], {COMPLETED})
+    finally:
+        await pool.stop()
+
+    assert job["attempts"] == 2
+    assert not redis.lists[crashed.processing_key]
+    assert not redis.lists[queue.processing_key]
+
+
+class SlowHeartbeatJobQueue(RedisJobQueue):
+    # Records the order of heartbeats and dequeues; the first heartbeat takes a while
+    def __init__(self, redis):
+        super().__init__(redis)
+        self.calls = []
+
+    async def heartbeat(self):
+        if not self.calls:
+            await asyncio.sleep(0.05)
+        await super().heartbeat()
+        self.calls.append("heartbeat")
+
+    async def dequeue(self, timeout: float):
+        self.calls.append("dequeue")
+        return await super().dequeue(timeout)
+
+
+@pytest.mark.asyncio
+async def test_workers_dequeue_after_the_first_heartbeat():
+    """
+    Test that no job is dequeued before the process has a heartbeat, so another
+    process's recovery cannot take a job it has just dequeued for one of a dead process.
+    """
+    redis = ListRedis()
+    queue = SlowHeartbeatJobQueue(redis)
+    job = await queue.create(new_job(filename="a.pdf"))
+
+    async def handler(job, report):
+        await report("done", 1.0)
+
+    pool = WorkerPool(queue, handler, concurrency=2)
+    pool.start()
+    try:
+        await asyncio.sleep(0.02)
+        assert await RedisJobQueue(redis).recover() == 0
+        job = await wait_for_status(queue, job["id"], {COMPLETED})
+    finally:
+        await pool.stop()
+
+    assert queue.calls[0] == "heartbeat"
+    assert job["attempts"] == 1
+
+
+@pytest.mark.asyncio
+async def test_jobs_interrupted_on_every_attempt_fail():
+    """
+    Test that a recovered job whose attempts were all interrupted is failed instead of run again.
+    """
+    queue = InMemoryJobQueue()
+    failed = []
+
+    async def handler(job, report):
+        raise AssertionError("must not run")
+
+    job = await queue.create(new_job(filename="a.pdf", status=RUNNING, attempts=2))
+    pool = WorkerPool(queue, handler, concurrency=1, max_attempts=2, on_failure=failed.append)
+    pool.start()
+    try:
+        job = await wait_for_status(queue, job["id"], {FAILED})
+    finally:
+        await pool.stop()
+
+    assert job["error"] == "Worker stopped while processing the job"
+    assert [job["id"] for job in failed] == [job["id"]]
+
+
+@pytest.mark.asyncio
+async def test_worker_count_is_bounded():
+    """
+    Test that no more than `concurrency` jobs run at the same time.
+    """
+    queue = InMemoryJobQueue()
+    running = 0
+    peak = 0
+
+    async def handler(job, report):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.05)
+        running -= 1
+
+    pool = WorkerPool(queue, handler, concurrency=2)
+    pool.start()
+    try:
+        jobs = [await queue.create(new_job(filename=f"{i}.pdf")) for i in range(6)]
+        for job in jobs:
+            await wait_for_status(queue, job["id"], {COMPLETED})
+    finally:
+        await pool.stop()
+
+    assert peak == 2
+
+
+@pytest.mark.asyncio
+async def test_upload_is_queued_then_ingested(tmp_path, test_db: Session):
+    """
+    Test that an upload returns a queued job right away and that the worker
+    extracts the text, stores the PDF in S3 and indexes it.
+    """
+    with open("tests/test_files/test_document.pdf", "rb") as f:
+        file_content = f.read()
+    file = UploadFile(filename="queued_document.pdf", file=BytesIO(file_content))
+    queue = InMemoryJobQueue()
+
+    with patch.object(pdf_endpoints_service, "INGESTION_STAGING_DIR", str(tmp_path)), \
+            patch.object(pdf_endpoints_service, "SessionLocal", TestingSessionLocal), \
+            patch("aws.s3client._s3_client") as mock_s3_client, \
+            patch.object(pdf_endpoints_service, "embed_chunks",
+                         side_effect=lambda chunks: ([[0.0] * 4 for _ in chunks], {"embedding_cache_hit_rate": 0.0})), \
+            patch.object(pdf_endpoints_service, "build_document_index") as mock_build_index:
+        job = await enqueue_upload_service(file, queue)
+        assert job["status"] == QUEUED
+        assert os.path.exists(get_staging_path(job["id"]))
+        mock_s3_client.put_object.assert_not_called()
+
+        pool = WorkerPool(queue, process_ingestion_job, concurrency=1)
+        pool.start()
+        try:
+            job = await wait_for_status(queue, job["id"], {COMPLETED, FAILED})
+        finally:
+            await pool.stop()
+
+    assert job["status"] == COMPLETED
+    db_entry = test_db.query(PDFText).filter(PDFText.id == job["text_id"]).first()
+    assert db_entry.filename == "queued_document.pdf"
+    assert db_entry.text.strip() == "test_text"
+    mock_s3_client.put_object.assert_called_once_with(Bucket="test", Key="queued_document.pdf", Body=file_content)
+    mock_build_index.assert_called_once()
+    assert mock_build_index.call_args.args[:2] == (db_entry.id, db_entry.content_hash)
+    assert job["embedding_cache_hit_rate"] == 0.0
+    assert not os.path.exists(get_staging_path(job["id"]))
+
+
+@pytest.mark.asyncio
+async def test_duplicate_upload_reuses_document(tmp_path, test_db: Session):
+    """
+    Test that uploading known bytes under another name completes right away with the
+    existing document, without extracting, storing or embedding it again.
+    """
+    with open("tests/test_files/test_document.pdf", "rb") as f:
+        file_content = f.read() + b"\n% duplicate upload test\n"
+    queue = InMemoryJobQueue()
+
+    with patch.object(pdf_endpoints_service, "INGESTION_STAGING_DIR", str(tmp_path)), \
+            patch.object(pdf_endpoints_service, "SessionLocal", TestingSessionLocal), \
+            patch("aws.s3client._s3_client") as mock_s3_client, \
+            patch.object(pdf_endpoints_service, "embed_chunks",
+                         side_effect=lambda chunks: ([[0.0] * 4 for _ in chunks], {"embedding_cache_hit_rate": 0.0})) \
+            as mock_embed_chunks, \
+            patch.object(pdf_endpoints_service, "build_document_index"):
+        first = await enqueue_upload_service(UploadFile(filename="original.pdf", file=BytesIO(file_content)), queue)
+        pool = WorkerPool(queue, process_ingestion_job, concurrency=1)
+        pool.start()
+        try:
+            first = await wait_for_status(queue, first["id"], {COMPLETED, FAILED})
+        finally:
+            await pool.stop()
+
+        copy = await enqueue_upload_service(UploadFile(filename="copy.pdf", file=BytesIO(file_content)), queue)
+        again = await enqueue_upload_service(UploadFile(filename="copy.pdf", file=BytesIO(file_content)), queue)
+
+    assert first["status"] == COMPLETED and not first["deduplicated"]
+    assert copy["status"] == COMPLETED and copy["deduplicated"]
+    assert copy["text_id"] == again["text_id"] == first["text_id"]
+    assert not os.path.exists(get_staging_path(copy["id"]))
+    mock_s3_client.put_object.assert_called_once()
+    mock_embed_chunks.assert_called_once()
+    alias = test_db.query(PDFAlias).filter(PDFAlias.filename == "copy.pdf").one()
+    assert alias.pdf_text_id == first["text_id"]
+
+
+@pytest.mark.asyncio
+async def test_duplicate_of_unstored_document_stores_its_pdf(tmp_path, test_db: Session):
+    """
+    Test that known bytes whose first upload never reached S3 are not aliased to the missing file:
+    the new upload stores the PDF under the document's original key, then the document is reused.
+    """
+    file_content = b"%PDF-unstored document"
+    file_hash = hashlib.sha256(file_content).hexdigest()
+    pdf_text = save_document(test_db, "unstored.pdf", "text", "hash", [], [], file_hash=file_hash)
+    queue = InMemoryJobQueue()
+
+    with patch.object(pdf_endpoints_service, "INGESTION_STAGING_DIR", str(tmp_path)), \
+            patch.object(pdf_endpoints_service, "SessionLocal", TestingSessionLocal), \
+            patch("aws.s3client._s3_client") as mock_s3_client, \
+            patch.object(pdf_endpoints_service, "embed_chunks") as mock_embed_chunks, \
+            patch.object(pdf_endpoints_service, "load_document_index") as mock_load_index:
+        job = await enqueue_upload_service(UploadFile(filename="retry.pdf", file=BytesIO(file_content)), queue)
+        assert job["status"] == QUEUED
+        pool = WorkerPool(queue, process_ingestion_job, concurrency=1)
+        pool.start()
+        try:
+            job = await wait_for_status(queue, job["id"], {COMPLETED, FAILED})
+        finally:
+            await pool.stop()
+
+    assert job["status"] == COMPLETED and job["deduplicated"]
+    assert job["text_id"] == pdf_text.id
+    mock_s3_client.put_object.assert_called_once_with(Bucket="test", Key="unstored.pdf", Body=file_content)
+    mock_embed_chunks.assert_not_called()
+    mock_load_index.assert_called_once_with(pdf_text.id, "hash")
+    test_db.expire_all()
+    assert test_db.get(PDFText, pdf_text.id).stored
+    assert test_db.query(PDFAlias).filter(PDFAlias.filename == "retry.pdf").one().pdf_text_id == pdf_text.id
+
+
+@pytest.mark.asyncio
+async def test_same_name_with_other_bytes_is_rejected(tmp_path, test_db: Session):
+    """
+    Test that a name already used by a different file is refused before anything is queued.
+    """
+    save_document(test_db, "taken.pdf", "text", "hash", [], [], file_hash="0" * 64)
+    queue = InMemoryJobQueue()
+
+    with patch.object(pdf_endpoints_service, "INGESTION_STAGING_DIR", str(tmp_path)), \
+            patch.object(pdf_endpoints_service, "SessionLocal", TestingSessionLocal):
+        with pytest.raises(HTTPException) as excinfo:
+            await enqueue_upload_service(UploadFile(filename="taken.pdf", file=BytesIO(b"%PDF-other")), queue)
+
+    assert excinfo.value.status_code == 409
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.asyncio
+async def test_legacy_document_is_verified_against_its_stored_pdf(tmp_path, test_db: Session):
+    """
+    Test that a document saved before file hashes were kept is reused when the same name is
+    uploaded with the bytes stored in S3 for it, gets its hash recorded, and still refuses other bytes.
+    """
+    file_content = b"%PDF-legacy document"
+    file_hash = hashlib.sha256(file_content).hexdigest()
+    pdf_text = save_document(test_db, "legacy.pdf", "text", "hash", [], [])
+    test_db.query(PDFText).filter(PDFText.id == pdf_text.id).update({PDFText.stored: True})
+    test_db.commit()
+    queue = InMemoryJobQueue()
+
+    with patch.object(pdf_endpoints_service, "INGESTION_STAGING_DIR", str(tmp_path)), \
+            patch.object(pdf_endpoints_service, "SessionLocal", TestingSessionLocal), \
+            patch.object(pdf_endpoints_service, "hash_object", return_value=file_hash) as mock_hash_object:
+        job = await enqueue_upload_service(UploadFile(filename="legacy.pdf", file=BytesIO(file_content)), queue)
+        with pytest.raises(HTTPException) as excinfo:
+            await enqueue_upload_service(UploadFile(filename="legacy.pdf", file=BytesIO(b"%PDF-other")), queue)
+
+    assert job["status"] == COMPLETED and job["deduplicated"]
+    assert job["text_id"] == pdf_text.id
+    assert excinfo.value.status_code == 409
+    # Read from S3 once, then checked against the recorded hash
+    mock_hash_object.assert_called_once_with("legacy.pdf")
+    test_db.expire_all()
+    assert test_db.get(PDFText, pdf_text.id).file_hash == file_hash
+
+
+@pytest.mark.asyncio
+async def test_legacy_document_without_stored_pdf_stores_the_upload(tmp_path, test_db: Session):
+    """
+    Test that a document saved before file hashes were kept, whose PDF is missing from S3,
+    takes the new upload as its file and has it stored instead of refusing it.
+    """
+    file_content = b"%PDF-legacy document, lost"
+    pdf_text = save_document(test_db, "lost.pdf", "text", "hash", [], [])
+    queue = InMemoryJobQueue()
+
+    with patch.object(pdf_endpoints_service, "INGESTION_STAGING_DIR", str(tmp_path)), \
+            patch.object(pdf_endpoints_service, "SessionLocal", TestingSessionLocal), \
+            patch.object(pdf_endpoints_service, "hash_object", return_value=None):
+        job = await enqueue_upload_service(UploadFile(filename="lost.pdf", file=BytesIO(file_content)), queue)
+
+    assert job["status"] == QUEUED
+    test_db.expire_all()
+    row = test_db.get(PDFText, pdf_text.id)
+    assert row.file_hash == hashlib.sha256(file_content).hexdigest()
+    assert not row.stored
+
+
+class DownJobQueue(InMemoryJobQueue):
+    # Like a Redis queue whose server is unreachable
+    async def create(self, job: dict, enqueue: bool = True) -> dict:
+        raise ConnectionError("Connection refused")
+
+
+@pytest.mark.asyncio
+async def test_upload_is_not_left_staged_when_the_queue_is_unavailable(tmp_path, test_db: Session):
+    """
+    Test that an upload that cannot be queued leaves no file in the staging directory,
+    and that it is refused with 503 when ingestion never started.
+    """
+    with patch.object(pdf_endpoints_service, "INGESTION_STAGING_DIR", str(tmp_path)), \
+            patch.object(pdf_endpoints_service, "SessionLocal", TestingSessionLocal):
+        with pytest.raises(ConnectionError):
+            await enqueue_upload_service(UploadFile(filename="down.pdf", file=BytesIO(b"%PDF-down")), DownJobQueue())
+        assert os.listdir(tmp_path) == []
+
+        with pytest.raises(HTTPException) as excinfo:
+            await enqueue_upload_service(UploadFile(filename="down.pdf", file=BytesIO(b"%PDF-down")), None)
+
+    assert excinfo.value.status_code == 503
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,112 @@
+import pytest
+from unittest.mock import patch
+from langchain_core.documents import Document
+from services import nlp_services
+from services.answer_cache import DisabledAnswerCache
+from services.lexical_index import BM25Index, LexicalIndexRegistry, reciprocal_rank_fusion, identifier_terms
+from services.vector_stores import LocalDiskBackend
+from tests.conftest import FakeQAChain
+
+CHUNKS = [
+    "General terms: the supplier delivers the goods on time and in good condition.",
+    "Clause 14.2: either party may terminate with thirty days written notice.",
+    "Invoice INV-2024-001 is payable within 45 days of receipt.",
+    "The supplier shall keep the goods insured until delivery.",
+]
+
+
+def chunk(text, index):
+    return Document(page_content=text, metadata={"chunk": index, "page_start": 1, "page_end": 1})
+
+
+@pytest.fixture
+def index():
+    return BM25Index([chunk(text, i) for i, text in enumerate(CHUNKS)])
+
+
+def test_identifiers_are_kept_in_one_token():
+    """
+    Test that clause numbers and codes are tokens of their own, and plain words, years and
+    hyphenated words are not identifiers.
+    """
+    assert identifier_terms("What does clause 14.2 say about INV-2024-001 and the supplier?") == {"14.2", "inv-2024-001"}
+    assert identifier_terms("Which clause sets reference code C4821 under ISO/IEC?") == {"c4821", "iso/iec"}
+    assert identifier_terms("What is the long-term plan?") == set()
+    assert identifier_terms("What happened in 2020?") == set()
+
+
+def test_bm25_ranks_chunks_with_rare_terms_first(index):
+    """
+    Test that the chunk naming the rare term outranks chunks with only common ones.
+    """
+    results = index.search("when must the invoice be paid", k=2)
+
+    assert results[0][0].metadata["chunk"] == 2
+    assert results[0][1] > results[1][1]
+
+
+def test_exact_search_finds_identifiers_and_phrases(index):
+    """
+    Test that exact lookups return the chunks naming the identifier or quoted phrase, and
+    nothing when the question names none or the term is too common to be a lookup.
+    """
+    assert [doc.metadata["chunk"] for doc in index.exact_search("What does clause 14.2 say?", k=4)] == [1]
+    assert [doc.metadata["chunk"] for doc in index.exact_search('Where is "kept insured" mentioned?', k=4)] == []
+    assert [doc.metadata["chunk"] for doc in index.exact_search('Where is "keep the goods insured"?', k=4)] == [3]
+    assert index.exact_search("What does the supplier deliver?", k=4) == []
+    assert index.exact_search('Which clauses mention "the goods"?', k=1) == []
+    # Found in more than half of the chunks retrieved otherwise: too weak, ranking by meaning decides
+    assert len(index.exact_search('Which clauses mention "the goods"?', k=4)) == 2
+    assert index.exact_search('Which clauses mention "the goods"?', k=3) == []
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    """
+    Test that a chunk ranked well by both rankings beats chunks ranked first by only one.
+    """
+    first, second, both = chunk("first", 0), chunk("second", 1), chunk("both", 2)
+
+    fused = reciprocal_rank_fusion([[first, both], [second, both]], k=3)
+
+    assert fused[0].page_content == "both"
+    assert len(fused) == 3
+
+
+def test_registry_round_trips_index(tmp_path, index):
+    """
+    Test that a saved index loads back from disk with the same results.
+    """
+    registry = LexicalIndexRegistry(LocalDiskBackend(str(tmp_path), suffix=".bm25"))
+    registry.save("1", "hash", index)
+
+    loaded = registry.load("1", "hash")
+
+    assert [doc.page_content for doc, _ in loaded.search("invoice", 1)] == [CHUNKS[2]]
+    assert registry.load("1", "other") is None
+
+
+class NoEmbeddings:
+    async def aembed_query(self, text):
+        raise AssertionError("exact lookups must not embed the question")
+
+
+@pytest.mark.asyncio
+async def test_exact_lookup_skips_embedding(tmp_path, index):
+    """
+    Test that a question naming an identifier is answered from the lexical index alone.
+    """
+    registry = LexicalIndexRegistry(LocalDiskBackend(str(tmp_path), suffix=".bm25"))
+    registry.save(nlp_services.get_index_namespace(7), "hash", index)
+    answer_cache = DisabledAnswerCache()
+
+    with patch.object(nlp_services, "lexical_index_registry", registry), \
+            patch.object(nlp_services, "RETRIEVAL_MODE", "hybrid"), \
+            patch.object(nlp_services, "answer_cache", answer_cache), \
+            patch.object(nlp_services, "cached_embeddings", NoEmbeddings()), \
+            patch.object(nlp_services, "get_conversational_chain", return_value=FakeQAChain()):
+        response = await nlp_services.generate_answer("When is INV-2024-001 due?", 7, "hash")
+
+    assert response["answer"] == CHUNKS[2]
+    assert response["cache"] == "miss"
+    # Counted in the answer cache hit rate although the semantic tier was never consulted
+    assert answer_cache.stats()["misses"] == 1
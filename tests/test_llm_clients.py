@@ -0,0 +1,60 @@
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.documents import Document
+from services.llm_clients import LLMClients
+
+PROMPT = "Context: {context}\nQuestion: {question}\nAnswer:"
+
+
+@pytest.fixture
+def clients():
+    return LLMClients("fake", "echo-model", 0.3, PROMPT)
+
+
+def test_clients_are_built_once_per_setting(clients):
+    """
+    Test that repeated calls return the same chat model and chain, and another
+    temperature gets its own.
+    """
+    chain = clients.qa_chain()
+
+    assert clients.qa_chain() is chain
+    assert clients.chat_model() is clients.chat_model()
+    assert clients.qa_chain(temperature=0.0) is not chain
+    # Two chat models and two chains
+    assert clients.stats()["constructions"] == 4
+
+
+def test_concurrent_first_use_builds_once(clients):
+    """
+    Test that questions arriving together before warm-up share one chain.
+    """
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        chains = list(pool.map(lambda _: clients.qa_chain(), range(16)))
+
+    assert all(chain is chains[0] for chain in chains)
+    assert clients.stats()["constructions"] == 2
+
+
+@pytest.mark.asyncio
+async def test_fake_provider_answers_from_the_context(clients):
+    """
+    Test that the local fake works in the QA chain and in streaming mode.
+    """
+    clients.warm()
+    docs = [Document(page_content="the deadline is friday\nmore text"), Document(page_content="other chunk")]
+
+    response = await clients.qa_chain().ainvoke({"input_documents": docs, "question": "When?"}, return_only_outputs=True)
+    prompt = clients.prompt().format(context="the deadline is friday", question="When?")
+    parts = [chunk.content async for chunk in clients.chat_model().astream(prompt)]
+
+    assert response["output_text"] == "the deadline is friday"
+    assert "".join(parts) == "the deadline is friday"
+
+
+def test_unknown_provider_is_rejected():
+    """
+    Test that a misspelled llm_provider fails at startup rather than at the first question.
+    """
+    with pytest.raises(ValueError):
+        LLMClients("unknown", "model", 0.3, PROMPT)
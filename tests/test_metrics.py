@@ -0,0 +1,99 @@
+import time
+import asyncio
+import pytest
+from unittest.mock import patch
+from langchain_core.documents import Document
+from langchain_core.messages import AIMessageChunk
+from services import nlp_services
+from services.answer_cache import DisabledAnswerCache
+from services.metrics import MetricsRegistry, Counter, Gauge, Histogram
+from services.tracing import trace, traced
+from services.concurrency import run_blocking
+
+
+def test_metrics_render_in_prometheus_format():
+    """
+    Test the exposition of counters, gauges, histograms and collected stats.
+    """
+    registry = MetricsRegistry()
+    tokens = Counter("tokens_total", "Tokens.", labels=("model",), registry=registry)
+    connections = Gauge("connections", "Connections.", registry=registry)
+    latency = Histogram("latency_seconds", "Latency.", buckets=(0.1, 1), registry=registry)
+    registry.add_collector("cache", lambda: {"hits": 3, "backend": "memory"})
+
+    tokens.inc(5, model="gemini-pro")
+    tokens.inc(2, model="gemini-pro")
+    connections.inc()
+    connections.inc()
+    connections.dec()
+    latency.observe(0.05)
+    latency.observe(0.5)
+    lines = registry.render().splitlines()
+
+    assert "# TYPE pdf_chat_bot_tokens_total counter" in lines
+    assert 'pdf_chat_bot_tokens_total{model="gemini-pro"} 7.0' in lines
+    assert "pdf_chat_bot_connections 1.0" in lines
+    assert 'pdf_chat_bot_latency_seconds_bucket{le="0.1"} 1.0' in lines
+    assert 'pdf_chat_bot_latency_seconds_bucket{le="+Inf"} 2.0' in lines
+    assert "pdf_chat_bot_latency_seconds_count 2.0" in lines
+    # Numbers only: the backend name is not a sample
+    assert "pdf_chat_bot_cache_hits 3.0" in lines
+    assert not any("backend" in line for line in lines)
+
+
+@pytest.mark.asyncio
+async def test_trace_collects_stages_across_tasks_and_threads():
+    """
+    Test that stages timed in the blocking pool and in tasks started by a request
+    are added to that request's trace, and not to another one.
+    """
+    @traced("blocking_stage")
+    def blocking():
+        time.sleep(0.02)
+
+    @traced("async_stage")
+    async def waiting():
+        await asyncio.sleep(0.02)
+
+    async def request():
+        with trace() as request_trace:
+            await run_blocking(blocking)
+            await asyncio.gather(asyncio.create_task(waiting()), waiting())
+        return request_trace.summary()
+
+    first, second = await asyncio.gather(request(), request())
+
+    for timings in (first, second):
+        assert set(timings) == {"blocking_stage", "async_stage", "total"}
+        assert timings["blocking_stage"] >= 20
+        assert timings["async_stage"] >= 40
+        assert timings["total"] >= timings["blocking_stage"]
+
+
+class SlowChatModel:
+    # Streams three tokens, each taking 10 ms to generate
+    async def astream(self, prompt):
+        for word in ("one ", "two ", "three"):
+            await asyncio.sleep(0.01)
+            yield AIMessageChunk(content=word)
+
+
+@pytest.mark.asyncio
+async def test_streamed_llm_stage_excludes_time_spent_sending_tokens():
+    """
+    Test that the "llm" stage of a streamed answer counts the model's time only,
+    not the time the consumer takes to send each token to a slow client.
+    """
+    docs = [Document(page_content="one two three", metadata={"chunk": 0, "page_start": 1, "page_end": 1})]
+
+    with patch.object(nlp_services, "answer_cache", DisabledAnswerCache()), \
+            patch.object(nlp_services, "find_exact_matches", return_value=docs), \
+            patch.object(nlp_services, "get_chat_model", return_value=SlowChatModel()):
+        with trace() as request_trace:
+            async for event in nlp_services.stream_answer("What does clause 1.1 say?", 1, "hash"):
+                if "delta" in event:
+                    await asyncio.sleep(0.05)  # a slow client
+        timings = request_trace.summary()
+
+    assert 30 <= timings["llm"] < 100
+    assert timings["total"] >= 150
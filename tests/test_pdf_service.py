@@ -0,0 +1,46 @@
+import pymupdf
+import pytest
+from unittest.mock import patch
+from services import pdf_service
+from services.pdf_service import iter_pdf_pages, pdf_file_to_text, pdf_to_text
+
+
+@pytest.fixture
+def multi_page_pdf(tmp_path):
+    path = str(tmp_path / "pages.pdf")
+    doc = pymupdf.open()
+    for number in range(1, 11):
+        doc.new_page().insert_text((72, 72), f"content of page {number}")
+    doc.save(path)
+    doc.close()
+    return path
+
+
+def test_pages_are_yielded_in_order_with_numbers(multi_page_pdf):
+    """
+    Test that the generator yields every page once, in order, with 1-based page numbers.
+    """
+    pages = list(iter_pdf_pages(multi_page_pdf, workers=1))
+
+    assert [page.page_number for page in pages] == list(range(1, 11))
+    assert all(f"content of page {page.page_number}" in page.text for page in pages)
+
+
+def test_parallel_extraction_matches_sequential(multi_page_pdf):
+    """
+    Test that splitting page ranges across the process pool gives the same pages.
+    """
+    with patch.object(pdf_service, "PARALLEL_MIN_PAGES", 2), patch.object(pdf_service, "PAGES_PER_TASK", 3):
+        parallel = list(iter_pdf_pages(multi_page_pdf, workers=2))
+
+    assert parallel == list(iter_pdf_pages(multi_page_pdf, workers=1))
+
+
+def test_file_and_bytes_extraction_agree(multi_page_pdf):
+    """
+    Test that extraction from disk returns the same text as extraction from bytes.
+    """
+    with open(multi_page_pdf, "rb") as f:
+        contents = f.read()
+
+    assert pdf_file_to_text(multi_page_pdf) == pdf_to_text(contents)
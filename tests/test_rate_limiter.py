@@ -0,0 +1,91 @@
+import pytest
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from fastapi_limiter import FastAPILimiter, default_identifier, http_default_callback
+from services.rate_limiter import InMemoryRateLimiter
+from main import app
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.mark.asyncio
+async def test_limit_is_enforced_per_key():
+    """
+    Test that each key gets `limit` messages per window, independently of other keys.
+    """
+    clock = FakeClock()
+    limiter = InMemoryRateLimiter(limit=3, window=1, clock=clock)
+
+    assert [await limiter.allow("a") for _ in range(4)] == [True, True, True, False]
+    assert await limiter.allow("b")
+
+
+@pytest.mark.asyncio
+async def test_window_slides():
+    """
+    Test that messages from the previous window still count in proportion to their overlap.
+    """
+    clock = FakeClock(1000.0)
+    limiter = InMemoryRateLimiter(limit=4, window=1, clock=clock)
+    for _ in range(4):
+        assert await limiter.allow("a")
+
+    # Half of the previous window still overlaps: 4 * 0.5 = 2 of 4 used
+    clock.now = 1001.5
+    assert [await limiter.allow("a") for _ in range(3)] == [True, True, False]
+
+    clock.now = 1003.0
+    assert await limiter.allow("a")
+
+
+@pytest.mark.asyncio
+async def test_idle_keys_expire():
+    """
+    Test that keys unused for two windows are dropped.
+    """
+    clock = FakeClock(1000.0)
+    limiter = InMemoryRateLimiter(limit=1, window=1, clock=clock)
+    for ip in range(100):
+        await limiter.allow(f"10.0.0.{ip}")
+
+    clock.now = 1002.0
+    await limiter.allow("10.0.1.1")
+
+    assert len(limiter._counters) == 1
+
+
+class DownRedis:
+    # A Redis client whose server is unreachable
+    async def evalsha(self, *args):
+        raise ConnectionError("Connection refused")
+
+
+class FullRedis:
+    # A Redis client whose limit is used up for another second
+    async def evalsha(self, *args):
+        return 1000
+
+
+def test_http_routes_fail_open_without_redis():
+    """
+    Test that /upload and /ask/batch are still served when Redis is down or was never
+    set up at startup, and that the limit is enforced when Redis answers.
+    """
+    client = TestClient(app)
+    limiter = dict(identifier=default_identifier, http_callback=http_default_callback, prefix="test", lua_sha="sha")
+
+    for redis in (None, DownRedis()):
+        with patch.multiple(FastAPILimiter, redis=redis, **limiter):
+            response = client.post("/upload", files={"file": ("notes.txt", b"text", "text/plain")})
+            assert response.status_code == 400
+            assert client.post("/ask/batch", json={"text_id": 1, "questions": []}).status_code == 400
+
+    with patch.multiple(FastAPILimiter, redis=FullRedis(), **limiter):
+        response = client.post("/upload", files={"file": ("notes.txt", b"text", "text/plain")})
+        assert response.status_code == 429
@@ -0,0 +1,103 @@
+import os
+import boto3
+import hashlib
+import pytest
+from botocore.exceptions import ClientError
+from moto import mock_aws
+from aws.s3client import start_upload, hash_object, FilePart, MIN_PART_SIZE
+
+BUCKET = "uploads"
+
+
+@pytest.fixture
+def s3():
+    # In-process S3 stand-in
+    with mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+def write_file(path, size: int) -> bytes:
+    contents = os.urandom(size)
+    with open(path, "wb") as f:
+        f.write(contents)
+    return contents
+
+
+def test_large_file_is_uploaded_in_parts(s3, tmp_path):
+    """
+    Test that a file larger than a part is uploaded as several parts and only becomes
+    visible once the upload is completed.
+    """
+    path = tmp_path / "large.pdf"
+    contents = write_file(path, 2 * MIN_PART_SIZE + 1024)
+
+    upload = start_upload(str(path), "large.pdf", bucket=BUCKET, client=s3, part_size=MIN_PART_SIZE)
+    assert upload.upload_id is not None
+    with pytest.raises(ClientError):
+        s3.head_object(Bucket=BUCKET, Key="large.pdf")
+
+    upload.complete()
+
+    stored = s3.get_object(Bucket=BUCKET, Key="large.pdf")
+    assert stored["Body"].read() == contents
+    assert stored["ETag"].strip('"').endswith("-3")
+
+
+def test_aborted_upload_leaves_nothing(s3, tmp_path):
+    """
+    Test that aborting discards the uploaded parts and never creates the object.
+    """
+    path = tmp_path / "aborted.pdf"
+    write_file(path, MIN_PART_SIZE + 1)
+
+    upload = start_upload(str(path), "aborted.pdf", bucket=BUCKET, client=s3, part_size=MIN_PART_SIZE)
+    upload.abort()
+
+    assert "Contents" not in s3.list_objects_v2(Bucket=BUCKET)
+    assert "Uploads" not in s3.list_multipart_uploads(Bucket=BUCKET)
+
+
+def test_small_file_is_uploaded_in_one_request(s3, tmp_path):
+    """
+    Test that a file smaller than a part skips the multipart API.
+    """
+    path = tmp_path / "small.pdf"
+    contents = write_file(path, 1024)
+
+    upload = start_upload(str(path), "small.pdf", bucket=BUCKET, client=s3)
+    assert upload.upload_id is None
+    upload.complete()
+
+    assert s3.get_object(Bucket=BUCKET, Key="small.pdf")["Body"].read() == contents
+
+
+def test_stored_object_is_hashed(s3):
+    """
+    Test that the hash of a stored object matches its bytes, and is None for a missing key.
+    """
+    contents = os.urandom(3 * 1024 * 1024)
+    s3.put_object(Bucket=BUCKET, Key="stored.pdf", Body=contents)
+
+    assert hash_object("stored.pdf", bucket=BUCKET, client=s3) == hashlib.sha256(contents).hexdigest()
+    assert hash_object("missing.pdf", bucket=BUCKET, client=s3) is None
+
+
+def test_file_part_reads_only_its_range(tmp_path):
+    """
+    Test that a part body exposes only its own bytes and can be re-read after a seek.
+    """
+    path = tmp_path / "range.bin"
+    path.write_bytes(b"0123456789")
+
+    part = FilePart(str(path), 3, 4)
+    try:
+        assert len(part) == 4
+        assert part.read(2) == b"34"
+        assert part.read() == b"56"
+        assert part.read() == b""
+        part.seek(0)
+        assert part.read() == b"3456"
+    finally:
+        part.close()
@@ -0,0 +1,127 @@
+import os
+import sys
+import asyncio
+import subprocess
+import pytest
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+import startup
+from main import app
+
+
+def test_imports_create_no_clients():
+    """
+    Test that importing the app reads no credentials and creates no S3, embedding or chat client,
+    even when the Google credentials file does not exist.
+    """
+    code = (
+        "import main, aws.s3client as s3, services.nlp_services as nlp;"
+        "assert s3._s3_client is None;"
+        "assert nlp.embeddings._embeddings is None;"
+        "assert nlp.llm_clients.stats()['constructions'] == 0"
+    )
+    env = dict(os.environ, GOOGLE_APPLICATION_CREDENTIALS="/nonexistent/service_account.json")
+    result = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, timeout=120)
+
+    assert result.returncode == 0, result.stderr
+
+
+@pytest.mark.asyncio
+async def test_worker_boots_when_dependencies_are_down():
+    """
+    Test that failed phases are recorded with their duration instead of stopping startup,
+    and that independent phases run concurrently.
+    """
+    async def redis_down():
+        await asyncio.sleep(0.2)
+        raise ConnectionError("Connection refused")
+
+    def slow_ok():
+        import time
+        time.sleep(0.2)
+
+    startup.startup_report.clear()
+    with patch.object(startup, "setup_redis", redis_down), \
+            patch.object(startup, "ensure_bucket_exists", side_effect=RuntimeError("S3 unreachable")), \
+            patch.object(startup, "create_tables", slow_ok), \
+            patch.object(startup, "warm_clients", slow_ok), \
+            patch.object(startup, "check_google_credentials", slow_ok), \
+            patch.object(startup, "start_ingestion") as mock_start_ingestion:
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        await startup.startup_event(app)
+        elapsed = loop.time() - start
+
+    assert startup.startup_report["redis"]["ok"] is False
+    assert "Connection refused" in startup.startup_report["redis"]["error"]
+    assert startup.startup_report["s3"]["ok"] is False
+    assert startup.startup_report["database"]["ok"] is True
+    assert startup.startup_report["database"]["ms"] >= 200
+    # The redis queue cannot work without Redis: no workers, and the report says so
+    assert startup.startup_report["ingestion"]["ok"] is False
+    assert "Redis" in startup.startup_report["ingestion"]["error"]
+    mock_start_ingestion.assert_not_called()
+    # Four phases of 0.2 s each, run together
+    assert elapsed < 0.6
+
+
+@pytest.mark.asyncio
+async def test_in_memory_ingestion_starts_without_redis():
+    """
+    Test that the in-memory queue backend does not depend on the Redis phase.
+    """
+    async def redis_down():
+        raise ConnectionError("Connection refused")
+
+    def ok():
+        pass
+
+    startup.startup_report.clear()
+    with patch.dict(os.environ, {"ingestion_queue_backend": "memory"}), \
+            patch.object(startup, "setup_redis", redis_down), \
+            patch.object(startup, "ensure_bucket_exists", ok), \
+            patch.object(startup, "create_tables", ok), \
+            patch.object(startup, "warm_clients", ok), \
+            patch.object(startup, "check_google_credentials", ok), \
+            patch.object(startup, "start_ingestion") as mock_start_ingestion:
+        await startup.startup_event(app)
+
+    assert startup.startup_report["redis"]["ok"] is False
+    assert startup.startup_report["ingestion"]["ok"] is True
+    mock_start_ingestion.assert_called_once()
+
+
+def test_liveness_and_readiness_report_dependencies():
+    """
+    Test that liveness does not depend on backends and readiness names the one that is down.
+    """
+    async def up():
+        pass
+
+    async def down():
+        raise ConnectionError("Connection refused")
+
+    async def hangs():
+        await asyncio.sleep(10)
+
+    client = TestClient(app)
+    with patch.dict(startup.READINESS_CHECKS, {"database": up, "redis": down, "s3": up}, clear=True), \
+            patch.dict(startup.startup_report, {}, clear=True):
+        assert client.get("/health/live").status_code == 200
+
+        response = client.get("/health/ready")
+        assert response.status_code == 503
+        dependencies = response.json()["dependencies"]
+        assert dependencies["redis"]["ok"] is False
+        assert dependencies["database"]["ok"] is True
+
+    with patch.dict(startup.READINESS_CHECKS, {"database": up, "s3": hangs}, clear=True), \
+            patch.dict(startup.startup_report, {"clients": {"ok": True, "ms": 1.0}}, clear=True), \
+            patch.object(startup, "READINESS_TIMEOUT", 0.1):
+        response = client.get("/health/ready")
+        assert response.status_code == 503
+        assert response.json()["dependencies"]["s3"]["ok"] is False
+
+    with patch.dict(startup.READINESS_CHECKS, {"database": up}, clear=True), \
+            patch.dict(startup.startup_report, {"clients": {"ok": True, "ms": 1.0}}, clear=True):
+        assert client.get("/health/ready").json()["status"] == "ready"
@@ -1,40 +1,36 @@
 import pytest
 import os
 from io import BytesIO
-from unittest.mock import patch, MagicMock
-from db.models import PDFText
-from services.pdf_service import pdf_to_text
-from controllers.pdf_endpoints_service import upload_pdf_service
+from unittest.mock import patch
+from db.models import PDFText, PDFChunk
+from controllers import pdf_endpoints_service
+from controllers.pdf_endpoints_service import enqueue_upload_service, run_ingestion_job, get_staging_path
+from services.job_queue import InMemoryJobQueue
 from sqlalchemy.orm import Session
 from fastapi import HTTPException
 from starlette.datastructures import UploadFile  # Import UploadFile class
+from tests.conftest import TestingSessionLocal
 
-# Mocked PDF extraction function (aligning with the actual content of the PDF)
-def mock_pdf_to_text(contents):
+# Mocked embedding function returning one small vector per chunk
+def mock_embed_chunks(chunks):
     """
-    Simulates text extraction from a PDF.
-    Always returns 'test_text' regardless of input.
+    Simulates embedding the chunks of a document.
+    Always returns zero vectors and a cold embedding cache.
     """
-    return "test_text"
-
-# Mocked S3 client
-class MockS3Client:
-    def put_object(self, Bucket, Key, Body):
-        """
-        Simulates uploading an object to S3.
-        Always returns a successful response.
-        """
-        return {"ResponseMetadata": {"HTTPStatusCode": 200}}
+    return [[0.0] * 4 for _ in chunks], {"chunks": len(chunks), "embedding_cache_hit_rate": 0.0}
 
 # Test for successful PDF upload
-@patch("services.pdf_service.pdf_to_text", side_effect=mock_pdf_to_text)
-@patch("aws.s3client.s3_client.put_object", autospec=True)  # Mock `put_object` directly
-def test_upload_pdf_service(mock_put_object, mock_pdf_extraction, test_db: Session):
+@pytest.mark.asyncio
+@patch("controllers.pdf_endpoints_service.build_document_index")  # Avoid writing a FAISS index
+@patch("controllers.pdf_endpoints_service.embed_chunks", side_effect=mock_embed_chunks)  # Avoid calling the embedding API
+@patch("aws.s3client._s3_client")  # Mock the S3 client created on first use
+async def test_upload_pdf_service(mock_s3_client, mock_embed, mock_build_index, tmp_path, test_db: Session):
     """
-    Test the upload of a valid PDF file and verify:
+    Test the upload of a valid PDF file through the ingestion worker and verify:
       - PDF text extraction is successful.
       - S3 upload is invoked with correct parameters.
       - The database entry is created with the correct content.
+      - The chunks are stored with their page span and embedding.
     """
     # File path for the test PDF
     file_path = "tests/test_files/test_document.pdf"
@@ -42,30 +38,59 @@ def test_upload_pdf_service(mock_put_object, mock_pdf_extraction, test_db: Sessi
     # Ensure the file exists before proceeding
     assert os.path.exists(file_path), f"Test file at {file_path} not found."
 
-    # Open the file and use it as the UploadFile in the test
-    with open(file_path, "rb") as f:
-        file_content = f.read()  # Read the file content
-        file = UploadFile(filename="test_document.pdf", file=BytesIO(file_content))  # Create UploadFile with content
+    reports = []
+
+    async def report(stage_name, progress, **fields):
+        reports.append((stage_name, fields))
+
+    with patch.object(pdf_endpoints_service, "INGESTION_STAGING_DIR", str(tmp_path)), \
+            patch.object(pdf_endpoints_service, "SessionLocal", TestingSessionLocal):
+        # Open the file and use it as the UploadFile in the test
+        with open(file_path, "rb") as f:
+            file_content = f.read()  # Read the file content
+            file = UploadFile(filename="test_document.pdf", file=BytesIO(file_content))  # Create UploadFile with content
 
-        # Call the service with the file and the test database
-        result = upload_pdf_service(file, test_db)
+            # Queue the upload, then run the job as a worker would
+            job = await enqueue_upload_service(file, InMemoryJobQueue())
+        await run_ingestion_job(job, report)
 
     # Assertions
     db_entry = test_db.query(PDFText).filter(PDFText.filename == "test_document.pdf").first()
     assert db_entry is not None
     assert db_entry.text.strip() == "test_text"
+    assert db_entry.content_hash is not None
+    assert db_entry.stored
 
-    mock_put_object.assert_called_once_with(
+    chunks = test_db.query(PDFChunk).filter(PDFChunk.pdf_text_id == db_entry.id).all()
+    assert len(chunks) == 1
+    assert chunks[0].text.strip() == "test_text"
+    assert (chunks[0].page_start, chunks[0].page_end) == (1, 1)
+    assert len(chunks[0].embedding) == 4 * 4  # four float32 values
+
+    mock_s3_client.put_object.assert_called_once_with(
         Bucket="test",  
         Key="test_document.pdf",
         Body=file_content,
     )
 
+    # The index is built once at upload, keyed by the new document id
+    mock_build_index.assert_called_once()
+    assert mock_build_index.call_args.args[:2] == (db_entry.id, db_entry.content_hash)
+
+    # The job reports the new document and ends completed, with its staged file removed
+    assert reports[-1][0] == "completed"
+    assert ("storing", {
+        "text_id": db_entry.id, "content_hash": db_entry.content_hash, "embedding_cache_hit_rate": 0.0,
+    }) in reports
+    assert not os.path.exists(get_staging_path(job["id"]))
+
 # Test for invalid file type upload
-def test_upload_pdf_service_invalid_file(test_db: Session):
+@pytest.mark.asyncio
+async def test_upload_pdf_service_invalid_file(tmp_path):
     """
     Test the upload of an invalid file type and verify:
       - An HTTPException is raised with the appropriate error message.
+      - Nothing is queued or spooled.
     """
     # File path for the test text file
     file_path = "tests/test_files/test_document.txt"
@@ -73,14 +98,18 @@ def test_upload_pdf_service_invalid_file(test_db: Session):
     # Ensure the file exists before proceeding
     assert os.path.exists(file_path), f"Test file at {file_path} not found."
 
+    queue = InMemoryJobQueue()
+
     # Open the file and use it as the UploadFile in the test
     with open(file_path, "rb") as f:
         file = UploadFile(filename="test_document.txt", file=BytesIO(f.read()))  # Create UploadFile with content
 
         # Test that it raises an HTTPException for invalid file type
-        with pytest.raises(HTTPException) as excinfo:
-            upload_pdf_service(file, test_db)
+        with patch.object(pdf_endpoints_service, "INGESTION_STAGING_DIR", str(tmp_path)), \
+                pytest.raises(HTTPException) as excinfo:
+            await enqueue_upload_service(file, queue)
 
         # Verify the exception details
         assert excinfo.value.status_code == 400
         assert excinfo.value.detail == "Invalid file type. Only PDFs are allowed."
+    assert os.listdir(tmp_path) == []
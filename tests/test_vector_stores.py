@@ -0,0 +1,211 @@
+import json
+import pickle
+import pytest
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_community.vectorstores import FAISS
+from sqlalchemy.orm import Session
+from services.chunk_store import save_document
+from services.pdf_service import PageText
+from services import nlp_services
+from services.embedding_cache import CachedEmbeddings, NullEmbeddingStore
+from services.answer_cache import DisabledAnswerCache
+from services.rate_limiter import InMemoryRateLimiter
+from services.vector_stores import (
+    LocalDiskBackend,
+    VectorStoreCache,
+    VectorStoreRegistry,
+    build_index,
+    estimate_store_bytes,
+    index_factory_string,
+)
+from services.lexical_index import LexicalIndexRegistry
+from main import app
+from tests.conftest import TestingSessionLocal, TestingAsyncSessionLocal, FakeQAChain
+
+NUM_DOCUMENTS = 8
+CLIENTS_PER_DOCUMENT = 4
+
+fake_embeddings = DeterministicFakeEmbedding(size=32)
+
+
+@pytest.fixture
+def registry(tmp_path):
+    return VectorStoreRegistry(LocalDiskBackend(str(tmp_path)), fake_embeddings)
+
+
+def test_local_backend_write_is_atomic(tmp_path):
+    """
+    Test that a write replaces the stored blob and leaves no temporary files behind.
+    """
+    backend = LocalDiskBackend(str(tmp_path))
+    backend.write("1", b"first")
+    backend.write("1", b"second")
+
+    assert backend.read("1") == b"second"
+    assert backend.read("2") is None
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["1.faiss"]
+
+
+def test_registry_rejects_stale_index(registry):
+    """
+    Test that an index is only returned for the content hash it was built from.
+    """
+    store = FAISS.from_texts(["alpha"], embedding=fake_embeddings)
+    registry.save("1", "hash-a", store)
+
+    assert registry.load("1", "hash-a") is not None
+    assert registry.load("1", "hash-b") is None
+
+
+def test_registry_builds_each_namespace_once(registry):
+    """
+    Test that concurrent callers on one namespace trigger a single build.
+    """
+    builds = []
+
+    def build():
+        builds.append(1)
+        return FAISS.from_texts(["alpha"], embedding=fake_embeddings)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda _: registry.get_or_build("1", "hash", build), range(16)))
+
+    assert len(builds) == 1
+
+
+def test_parallel_websocket_clients_get_their_own_document(registry, tmp_path, test_db: Session):
+    """
+    Test many parallel WebSocket clients asking about different documents and verify
+    that no client is answered from another client's index.
+    """
+    documents = []
+    for i in range(NUM_DOCUMENTS):
+        text = f"document {i} secret content"
+        chunks = nlp_services.get_page_chunks([PageText(1, text)])
+        vectors = fake_embeddings.embed_documents([chunk["text"] for chunk in chunks])
+        documents.append(save_document(test_db, f"parallel_{i}.pdf", text, nlp_services.text_hash(text), chunks, vectors))
+    expected = {doc.id: doc.text for doc in documents}
+
+    def ask(text_id):
+        with client.websocket_connect("/ws/question") as websocket:
+            websocket.send_text(json.dumps({"text_id": text_id, "question": "What is the secret?"}))
+            return text_id, json.loads(websocket.receive_text())
+
+    client = TestClient(app)
+    with patch.object(nlp_services, "vector_store_registry", registry), \
+            patch.object(nlp_services, "lexical_index_registry",
+                         LexicalIndexRegistry(LocalDiskBackend(str(tmp_path), suffix=".bm25"))), \
+            patch.object(nlp_services, "SessionLocal", TestingSessionLocal), \
+            patch.object(nlp_services, "answer_cache", DisabledAnswerCache()), \
+            patch.object(nlp_services, "embeddings", fake_embeddings), \
+            patch.object(nlp_services, "cached_embeddings",
+                         CachedEmbeddings(fake_embeddings, NullEmbeddingStore(), "fake")), \
+            patch.object(nlp_services, "get_conversational_chain", return_value=FakeQAChain()), \
+            patch("controllers.websocket_controller.AsyncSessionLocal", TestingAsyncSessionLocal), \
+            patch("controllers.websocket_controller.rate_limiter", InMemoryRateLimiter(10_000, 1)):
+        text_ids = list(expected) * CLIENTS_PER_DOCUMENT
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            results = list(pool.map(ask, text_ids))
+
+    for text_id, response in results:
+        assert (response["answer"], response["cache"]) == (expected[text_id], "miss")
+        assert response["prompt_tokens"] > 0
+
+
+def test_cache_serves_hot_documents_from_memory(tmp_path):
+    """
+    Test that a second load is a cache hit and does not touch the backend.
+    """
+    cache = VectorStoreCache(max_bytes=10 * 1024 * 1024)
+    registry = VectorStoreRegistry(LocalDiskBackend(str(tmp_path)), fake_embeddings, cache=cache)
+    registry.save("1", "hash", FAISS.from_texts(["alpha"], embedding=fake_embeddings))
+    cache.invalidate("1")
+
+    first = registry.load("1", "hash")
+    with patch.object(registry.backend, "read") as mock_read:
+        second = registry.load("1", "hash")
+
+    assert second is first
+    mock_read.assert_not_called()
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_cache_evicts_least_recently_used_within_budget():
+    """
+    Test that the cache stays under its byte budget by evicting the oldest entry.
+    """
+    stores = {name: FAISS.from_texts([name * 10], embedding=fake_embeddings) for name in "abc"}
+    size = estimate_store_bytes(stores["a"])
+    cache = VectorStoreCache(max_bytes=size * 2)
+
+    cache.put("a", "hash", stores["a"])
+    cache.put("b", "hash", stores["b"])
+    cache.get("a", "hash")  # "b" is now the least recently used
+    cache.put("c", "hash", stores["c"])
+
+    assert cache.get("b", "hash") is None
+    assert cache.get("a", "hash") is stores["a"]
+    assert cache.get("c", "hash") is stores["c"]
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["bytes"] <= cache.max_bytes
+
+
+@pytest.mark.parametrize("index_type", ["flat", "fp16", "int8", "ivf", "pq"])
+def test_registry_round_trips_each_index_type(tmp_path, index_type):
+    """
+    Test that an index of every type is saved, memory-mapped back and still finds each vector.
+    """
+    vectors = np.random.default_rng(0).standard_normal((600, 32)).astype(np.float32)
+    store = FAISS.from_embeddings(zip([str(i) for i in range(600)], vectors.tolist()), embedding=fake_embeddings)
+    store.index = build_index(vectors, index_type)
+    registry = VectorStoreRegistry(LocalDiskBackend(str(tmp_path)), fake_embeddings)
+    registry.save("1", "hash", store)
+
+    loaded = registry.load("1", "hash")
+    _, ids = loaded.index.search(vectors[:20], 1)
+
+    assert loaded.index.ntotal == 600
+    # IVF lists are mapped by every FAISS version, the other types' codes only by recent ones
+    if index_type == "ivf":
+        assert loaded.memory_mapped
+    if index_type == "pq":
+        # Approximate: the vector itself is among its nearest neighbours
+        _, ids = loaded.index.search(vectors[:20], 10)
+        assert all(i in row for i, row in enumerate(ids))
+    else:
+        assert list(ids[:, 0]) == list(range(20))
+    # The docstore still maps index ids to their chunks
+    assert loaded.similarity_search_by_vector(vectors[3].tolist(), k=1)[0].page_content == str(ids[3][0])
+
+
+def test_small_documents_fall_back_to_untrained_types():
+    """
+    Test that IVF and PQ fall back to types that need no (or little) training on small documents.
+    """
+    assert index_factory_string("ivf", 50, 768) == "Flat"
+    assert index_factory_string("ivf", 10_000, 768) == "IVF256,Flat"
+    assert index_factory_string("pq", 100, 768) == "SQ8"
+    assert index_factory_string("pq", 1000, 768) == "PQ96"
+    with pytest.raises(ValueError):
+        index_factory_string("hnsw", 1000, 768)
+
+
+def test_registry_loads_indexes_saved_in_the_previous_format(registry, tmp_path):
+    """
+    Test that an index stored whole (before indexes had their own blob) still loads, and delete removes every blob.
+    """
+    store = FAISS.from_texts(["alpha", "beta"], embedding=fake_embeddings)
+    registry.backend.write("1", pickle.dumps({"content_hash": "old", "index": store.serialize_to_bytes()}))
+    registry.save("2", "new", store)
+
+    assert registry.load("1", "old").similarity_search("alpha", k=1)[0].page_content == "alpha"
+    assert registry.load("2", "new").similarity_search("alpha", k=1)[0].page_content == "alpha"
+
+    registry.delete("1")
+    registry.delete("2")
+    assert list(tmp_path.iterdir()) == []
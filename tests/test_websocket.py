@@ -1,14 +1,15 @@
-import pytest, os
+import pytest
 import asyncio
 import websockets
 import json
 from dotenv import load_dotenv
 from unittest.mock import patch, MagicMock
+from services.env import env_int
 
 load_dotenv()
 
 WEBSOCKET_URL = "ws://localhost:8000/ws/question"
-MAX_MESSAGES_PER_SECOND = int(os.getenv("no_of_request"))
+MAX_MESSAGES_PER_SECOND = env_int("no_of_request", 5)
 
 
 @pytest.mark.asyncio
@@ -0,0 +1,209 @@
+import json
+import time
+import urllib.request
+import asyncio
+import pytest
+import websockets
+from unittest.mock import patch
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from sqlalchemy.orm import Session
+from db.models import PDFText
+from services import nlp_services
+from services.embedding_cache import CachedEmbeddings, NullEmbeddingStore
+from services.answer_cache import DisabledAnswerCache
+from services.rate_limiter import InMemoryRateLimiter
+from services.vector_stores import LocalDiskBackend, VectorStoreRegistry
+from services.lexical_index import LexicalIndexRegistry
+from tests.conftest import TestingSessionLocal, TestingAsyncSessionLocal, FakeQAChain, FakeChatModel, testing_pool_metrics
+
+NUM_SOCKETS = 8
+LLM_DELAY = 0.5  # seconds of simulated model latency per question
+
+fake_embeddings = DeterministicFakeEmbedding(size=32)
+
+
+@pytest.fixture
+def fake_pipeline(tmp_path):
+    """
+    Replace the embedding model, index storage and LLM with offline fakes.
+    """
+    registry = VectorStoreRegistry(LocalDiskBackend(str(tmp_path)), fake_embeddings)
+    lexical_registry = LexicalIndexRegistry(LocalDiskBackend(str(tmp_path), suffix=".bm25"))
+    with patch.object(nlp_services, "vector_store_registry", registry), \
+            patch.object(nlp_services, "lexical_index_registry", lexical_registry), \
+            patch.object(nlp_services, "SessionLocal", TestingSessionLocal), \
+            patch.object(nlp_services, "answer_cache", DisabledAnswerCache()), \
+            patch.object(nlp_services, "cached_embeddings",
+                         CachedEmbeddings(fake_embeddings, NullEmbeddingStore(), "fake", query_batch_kwargs={})), \
+            patch.object(nlp_services, "get_conversational_chain", return_value=FakeQAChain(delay=LLM_DELAY)), \
+            patch.object(nlp_services, "get_chat_model", return_value=FakeChatModel()), \
+            patch("controllers.websocket_controller.AsyncSessionLocal", TestingAsyncSessionLocal), \
+            patch("controllers.websocket_controller.rate_limiter", InMemoryRateLimiter(10_000, 1)):
+        yield
+
+
+@pytest.mark.asyncio
+async def test_concurrent_sockets_do_not_serialize(live_server, fake_pipeline, test_db: Session):
+    """
+    Load test: N sockets asking at once on one worker should take about as long as one
+    question, not N times as long, because a slow model call no longer blocks the event loop.
+    """
+    pdf_text = PDFText(filename="concurrency.pdf", text="the deadline is friday")
+    test_db.add(pdf_text)
+    test_db.commit()
+
+    async def ask():
+        async with websockets.connect(f"{live_server}/ws/question") as websocket:
+            await websocket.send(json.dumps({"text_id": pdf_text.id, "question": "When is the deadline?"}))
+            return json.loads(await websocket.recv())
+
+    # Warm up: builds the index once so only question latency is measured
+    await ask()
+
+    start = time.perf_counter()
+    responses = await asyncio.gather(*(ask() for _ in range(NUM_SOCKETS)))
+    elapsed = time.perf_counter() - start
+
+    assert all((response["answer"], response["cache"]) == ("the deadline is friday", "miss") for response in responses)
+    assert all(response["prompt_tokens"] > 0 for response in responses)
+    # Serialized handling would take NUM_SOCKETS * LLM_DELAY seconds
+    assert elapsed < NUM_SOCKETS * LLM_DELAY / 2
+
+
+@pytest.mark.asyncio
+async def test_streaming_sends_deltas_then_done(live_server, fake_pipeline, test_db: Session):
+    """
+    Test that a client asking with "stream": true receives incremental delta frames
+    followed by one done frame listing the sources.
+    """
+    pdf_text = PDFText(filename="streaming.pdf", text="the contract ends in march")
+    test_db.add(pdf_text)
+    test_db.commit()
+
+    async with websockets.connect(f"{live_server}/ws/question") as websocket:
+        await websocket.send(json.dumps(
+            {"text_id": pdf_text.id, "question": "When does the contract end?", "stream": True}
+        ))
+        frames = []
+        while not frames or "done" not in frames[-1]:
+            frames.append(json.loads(await websocket.recv()))
+
+    deltas = [frame["delta"] for frame in frames[:-1]]
+    assert len(deltas) > 1
+    assert "".join(deltas).strip() == "the contract ends in march"
+    assert frames[-1]["done"] is True
+    assert frames[-1]["sources"][0]["chunk"] == 0
+
+
+@pytest.mark.asyncio
+async def test_batch_questions_are_answered_concurrently(live_server, fake_pipeline, test_db: Session):
+    """
+    Test that a message with a "questions" list gets one frame per question, embeds the
+    questions in one call and runs the model calls concurrently.
+    """
+    pdf_text = PDFText(filename="batch.pdf", text="the invoice is due in june")
+    test_db.add(pdf_text)
+    test_db.commit()
+    questions = [f"Question {i} about the invoice?" for i in range(10)]
+
+    with patch.object(nlp_services.cached_embeddings, "embed_queries",
+                      wraps=nlp_services.cached_embeddings.embed_queries) as embed_queries:
+        async with websockets.connect(f"{live_server}/ws/question") as websocket:
+            start = time.perf_counter()
+            await websocket.send(json.dumps({"text_id": pdf_text.id, "questions": questions}))
+            frames = []
+            while not frames or "done" not in frames[-1]:
+                frames.append(json.loads(await websocket.recv()))
+            elapsed = time.perf_counter() - start
+
+    answers = frames[:-1]
+    assert sorted(frame["index"] for frame in answers) == list(range(len(questions)))
+    assert all(frame["answer"] == "the invoice is due in june" for frame in answers)
+    assert all(frame["question"] == questions[frame["index"]] for frame in answers)
+    assert frames[-1] == {"done": True, "count": len(questions)}
+    embed_queries.assert_called_once_with(questions)
+    assert elapsed < len(questions) * LLM_DELAY / 2
+
+
+@pytest.mark.asyncio
+async def test_question_across_documents(live_server, fake_pipeline, test_db: Session):
+    """
+    Test that a question with "text_ids" is answered from the chunks of all the documents,
+    with every source naming its document.
+    """
+    first = PDFText(filename="contract_a.pdf", text="contract a renews yearly")
+    second = PDFText(filename="contract_b.pdf", text="contract b renews monthly")
+    test_db.add_all([first, second])
+    test_db.commit()
+
+    async with websockets.connect(f"{live_server}/ws/question") as websocket:
+        await websocket.send(json.dumps(
+            {"text_ids": [first.id, second.id], "question": "How do the contracts renew?"}
+        ))
+        response = json.loads(await websocket.recv())
+        await websocket.send(json.dumps({"text_ids": [first.id, 999_999], "question": "How?"}))
+        missing = json.loads(await websocket.recv())
+
+    assert {source["text_id"] for source in response["sources"]} == {first.id, second.id}
+    assert {source["filename"] for source in response["sources"]} == {"contract_a.pdf", "contract_b.pdf"}
+    # The fake model answers with the best chunk, labelled with its document
+    assert response["answer"].splitlines()[0] in ("[contract_a.pdf]", "[contract_b.pdf]")
+    assert missing == {"error": "PDF text not found: [999999]."}
+
+
+@pytest.mark.asyncio
+async def test_idle_sockets_hold_no_database_connection(live_server, fake_pipeline, test_db: Session):
+    """
+    Test that each message uses a short-lived session: once answered, open sockets
+    hold no connection, and slow answers do not keep one checked out.
+    """
+    pdf_text = PDFText(filename="pool.pdf", text="the office opens at nine")
+    test_db.add(pdf_text)
+    test_db.commit()
+    checkouts_before = testing_pool_metrics.stats()["checkouts"]
+
+    sockets = [await websockets.connect(f"{live_server}/ws/question") for _ in range(NUM_SOCKETS)]
+    try:
+        for websocket in sockets:
+            await websocket.send(json.dumps({"text_id": pdf_text.id, "question": "When does the office open?"}))
+        # Every question is waiting on the model now; none of them holds a connection
+        await asyncio.sleep(LLM_DELAY / 2)
+        in_use_while_answering = testing_pool_metrics.stats()["in_use"]
+        responses = [json.loads(await websocket.recv()) for websocket in sockets]
+        stats = testing_pool_metrics.stats()
+    finally:
+        for websocket in sockets:
+            await websocket.close()
+
+    assert all(response["answer"] == "the office opens at nine" for response in responses)
+    assert in_use_while_answering == 0
+    assert stats["in_use"] == 0
+    assert stats["checkouts"] - checkouts_before >= NUM_SOCKETS
+
+
+@pytest.mark.asyncio
+async def test_debug_timings_and_metrics(live_server, fake_pipeline, test_db: Session):
+    """
+    Test that with debug_timings the answer carries its stage timings, and that /metrics
+    reports the stages, the prompt sent to the model and the open sockets.
+    """
+    pdf_text = PDFText(filename="metrics.pdf", text="the warranty lasts two years")
+    test_db.add(pdf_text)
+    test_db.commit()
+    http_url = live_server.replace("ws://", "http://")
+
+    with patch("controllers.websocket_controller.DEBUG_TIMINGS", True):
+        async with websockets.connect(f"{live_server}/ws/question") as websocket:
+            await websocket.send(json.dumps({"text_id": pdf_text.id, "question": "How long is the warranty?"}))
+            response = json.loads(await websocket.recv())
+            metrics = await asyncio.to_thread(lambda: urllib.request.urlopen(f"{http_url}/metrics").read().decode())
+
+    timings = response["timings"]
+    assert {"document_lookup", "embed_question", "retrieve", "pack_context", "llm", "total"} <= set(timings)
+    assert timings["llm"] >= LLM_DELAY * 1000
+    assert timings["total"] >= timings["llm"]
+    assert 'pdf_chat_bot_stage_seconds_count{stage="llm"}' in metrics
+    assert "pdf_chat_bot_llm_prompt_bytes_total" in metrics
+    # This socket was open during the scrape
+    open_sockets = [line for line in metrics.splitlines() if line.startswith("pdf_chat_bot_websocket_connections ")]
+    assert float(open_sockets[0].split()[1]) >= 1